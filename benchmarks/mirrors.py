@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+بنچمارک دانلود چندآینه‌ای: یک فایل از چند سرور بازه‌ای محلی با سقف پهنای باند کل متفاوت
+(مثل آینه‌های واقعی که هر کدام پهنای باند محدودی دارند).
+
+برای هر موتور ابتدا هر آینه به تنهایی، سپس همه آینه‌ها با هم دانلود می‌شوند؛ سرعت ترکیبی
+باید از بهترین آینه تنها بیشتر باشد. با --fail-after سریع‌ترین آینه در میانه یک اجرای ترکیبی
+دیگر متوقف می‌شود تا جابه‌جایی بازه‌های باقی‌مانده به آینه‌های دیگر دیده شود:
+    python benchmarks/mirrors.py --size 64 --rates 8192 4096 2048 --threads 8
+    python benchmarks/mirrors.py --engines threads --fail-after 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shetabdaryaft
+from range_server import RangeServer, make_payload
+
+
+def serve(size, total_rate, ready):
+    """اجرای یک آینه در فرایند فرزند؛ درگاه از طریق صف ready اعلام می‌شود"""
+    server = RangeServer(make_payload(size), total_rate=total_rate)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_mirror(size, total_rate):
+    """راه‌اندازی آینه در فرایند جداگانه تا با کلاینت در GIL شریک نباشد"""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(size, total_rate, ready), daemon=True)
+    process.start()
+    port = ready.get(timeout=60)
+    return process, f"http://127.0.0.1:{port}/payload.bin"
+
+
+def run_download(config, url, mirrors, work_dir, payload, kill=None):
+    """یک دانلود کامل؛ (ثانیه، صحت محتوا، تعداد آینه‌های فعال در پایان) برمی‌گرداند"""
+    finished = threading.Event()
+
+    def on_update(item):
+        if item.status in ("completed", "error", "canceled"):
+            finished.set()
+
+    manager = shetabdaryaft.create_download_manager(config, on_update)
+    start = time.perf_counter()
+    download_id = manager.add_download(url, work_dir, "mirrors.bin", mirrors=mirrors)
+    if kill is not None:
+        delay, process = kill
+        timer = threading.Timer(delay, process.kill)
+        timer.start()
+    finished.wait(600)
+    elapsed = time.perf_counter() - start
+    manager.shutdown()
+
+    item = manager.get_download(download_id)
+    valid = False
+    if item.status == "completed":
+        with open(item.full_path, "rb") as f:
+            valid = f.read() == payload
+        os.remove(item.full_path)
+    usable = item.mirror_set.usable_count(time.time()) if item.mirror_set else 1
+    return elapsed, valid, usable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک دانلود چندآینه‌ای")
+    parser.add_argument("--size", type=int, default=64, help="اندازه فایل به مگابایت")
+    parser.add_argument("--rates", type=int, nargs="+", default=[8192, 4096, 2048],
+                        help="سقف پهنای باند کل هر آینه به کیلوبایت بر ثانیه")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--engines", nargs="+", default=["threads", "asyncio"], choices=["threads", "asyncio"])
+    parser.add_argument("--fail-after", type=float, help="توقف سریع‌ترین آینه پس از این تعداد ثانیه در یک اجرای جداگانه")
+    args = parser.parse_args()
+
+    if len(args.rates) < 2:
+        parser.error("دست‌کم دو آینه لازم است")
+
+    # پیام پایان هر دانلود در خروجی بنچمارک چاپ نشود؛ دانلودها در تاریخچه برنامه ثبت نمی‌شوند
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    work_dir = tempfile.mkdtemp(prefix="shetab_mirrors_")
+    shetabdaryaft.HISTORY_FILE = os.path.join(work_dir, "history.json")
+    shetabdaryaft.HISTORY_DB = os.path.join(work_dir, "history.db")
+    shetabdaryaft.TEMP_DIR = work_dir
+    shetabdaryaft.load_network_modules()
+
+    size = args.size * 1024 * 1024
+    payload = make_payload(size)
+    servers = [start_mirror(size, rate * 1024) for rate in args.rates]
+    urls = [url for _, url in servers]
+
+    def report(label, result):
+        elapsed, valid, usable = result
+        print(f"{label:<24} {elapsed:>8.2f} {args.size / elapsed:>8.2f} {usable:>7}  {'yes' if valid else 'NO'}",
+              file=stdout, flush=True)
+        return args.size / elapsed
+
+    try:
+        for engine in args.engines:
+            config = dict(shetabdaryaft.DEFAULT_CONFIG)
+            config.update({
+                "default_download_path": work_dir,
+                "download_engine": engine,
+                "max_concurrent_downloads": 1,
+                "max_threads_per_download": args.threads,
+                "use_multithreaded_download": True,
+                "adaptive_connections": False,
+                "checksum_algorithm": "",
+            })
+            print(f"\nموتور {engine}", file=stdout)
+            print(f"{'source':<24} {'s':>8} {'MB/s':>8} {'usable':>7}  valid", file=stdout)
+            best = 0
+            for rate, url in zip(args.rates, urls):
+                best = max(best, report(f"mirror {rate} KB/s", run_download(config, url, [], work_dir, payload)))
+            combined = report("all mirrors", run_download(config, urls[0], urls[1:], work_dir, payload))
+            print(f"{'speedup vs best single':<24} {combined / best:>17.2f}x", file=stdout)
+
+        if args.fail_after is not None:
+            # سریع‌ترین آینه در میانه دانلود متوقف می‌شود؛ فرایند آن دیگر برنمی‌گردد
+            fastest = max(range(len(args.rates)), key=lambda index: args.rates[index])
+            print(f"\nتوقف آینه {args.rates[fastest]} KB/s پس از {args.fail_after} ثانیه ({config['download_engine']})",
+                  file=stdout)
+            report("all mirrors, one killed",
+                   run_download(config, urls[0], urls[1:], work_dir, payload,
+                                kill=(args.fail_after, servers[fastest][0])))
+    finally:
+        for process, _ in servers:
+            process.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+سرور محلی HTTP با پشتیبانی از درخواست‌های بازه‌ای برای بنچمارک‌های شتاب دریافت
+داده‌ها از حافظه ارسال می‌شوند تا دیسک سمت سرور در نتیجه اثری نداشته باشد.
+
+هر مسیری همان محتوا را برمی‌گرداند؛ با ?size=N فقط N بایت اول ارسال می‌شود (فایل‌های کوچک).
+سقف پهنای باند هر اتصال، سقف کل سرور و تأخیر پیش از پاسخ برای شبیه‌سازی سرورهای واقعی قابل تنظیم است.
+زمان ارسال اولین بایت بدنه هر مسیر ثبت می‌شود و از /__first_bytes به صورت JSON خوانده می‌شود.
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_BUFFER_SIZE = 256 * 1024
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """پاسخ به GET/HEAD با Range روی محتوای ثابت server.payload"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_payload(self, head):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        if path == "/__first_bytes":
+            self._send_first_bytes()
+            return
+        
+        payload = memoryview(server.payload)
+        size_match = re.search(r'(?:^|&)size=(\d+)', query)
+        if size_match:
+            payload = payload[:int(size_match.group(1))]
+        size = len(payload)
+        start, end = 0, size - 1
+        
+        if server.latency:
+            time.sleep(server.latency)
+
+        range_match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if range_match:
+            start = int(range_match.group(1))
+            if range_match.group(2):
+                end = min(int(range_match.group(2)), size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"bench-%d"' % size)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+
+        # با سقف پهنای باند، تکه‌ها کوچک‌تر می‌شوند تا ارسال یکنواخت باشد
+        block = min(SEND_BUFFER_SIZE, max(4096, server.rate // 50)) if server.rate else SEND_BUFFER_SIZE
+        if server.total_rate:
+            block = min(block, max(4096, server.total_rate // 50))
+        server.first_bytes.setdefault(self.path, time.time())
+        begin = time.perf_counter()
+        position = start
+        try:
+            while position <= end:
+                sent = self.wfile.write(payload[position:min(position + block, end + 1)])
+                position += sent
+                if server.rate:
+                    delay = (position - start) / server.rate - (time.perf_counter() - begin)
+                    if delay > 0:
+                        time.sleep(delay)
+                if server.total_rate:
+                    delay = server.reserve(sent)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def _send_first_bytes(self):
+        """زمان (time.time) اولین بایت بدنه هر مسیر از آخرین خواندن؛ فهرست پس از خواندن خالی می‌شود"""
+        first_bytes, self.server.first_bytes = self.server.first_bytes, {}
+        body = json.dumps(first_bytes).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send_payload(False)
+
+    def do_HEAD(self):
+        self._send_payload(True)
+
+
+class RangeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, payload, host="127.0.0.1", port=0, rate=0, latency=0, total_rate=0):
+        super().__init__((host, port), RangeRequestHandler)
+        self.payload = payload
+        self.rate = rate  # بایت بر ثانیه برای هر اتصال؛ صفر یعنی بدون سقف
+        self.latency = latency  # ثانیه تأخیر پیش از ارسال هر پاسخ
+        self.total_rate = total_rate  # بایت بر ثانیه برای مجموع اتصال‌ها (مثل یک آینه با پهنای باند محدود)
+        self.total_lock = threading.Lock()
+        self.total_next = 0
+        self.first_bytes = {}
+    
+    def reserve(self, size):
+        """ثبت ارسال size بایت در سقف کل سرور؛ ثانیه‌های انتظار لازم برگردانده می‌شود"""
+        with self.total_lock:
+            now = time.perf_counter()
+            self.total_next = max(now, self.total_next) + size / self.total_rate
+            return self.total_next - now
+
+    def handle_error(self, request, client_address):
+        # قطع اتصال از سمت کلاینت (مثلاً پس از توقف دانلود) خطا محسوب نمی‌شود
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/payload.bin"
+
+
+def make_payload(size):
+    """محتوای قابل بررسی با الگوی تکراری (سریع‌تر از داده تصادفی)"""
+    block = bytes(range(256)) * 4096
+    repeats, remainder = divmod(size, len(block))
+    return block * repeats + block[:remainder]
+
+
+def start_server(payload, host="127.0.0.1", port=0, rate=0, latency=0, total_rate=0):
+    """راه‌اندازی سرور در یک نخ پس‌زمینه؛ سرور برگردانده می‌شود"""
+    server = RangeServer(payload, host, port, rate, latency, total_rate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name="RangeServer")
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="سرور محلی بازه‌ای برای بنچمارک")
+    parser.add_argument("--size", type=int, default=64, help="اندازه محتوا به مگابایت")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=int, default=0, help="سقف پهنای باند هر اتصال به کیلوبایت بر ثانیه")
+    parser.add_argument("--latency", type=float, default=0, help="تأخیر پیش از هر پاسخ به میلی‌ثانیه")
+    parser.add_argument("--total-rate", type=int, default=0, help="سقف پهنای باند کل سرور به کیلوبایت بر ثانیه")
+    args = parser.parse_args()
+
+    server = RangeServer(make_payload(args.size * 1024 * 1024), port=args.port, rate=args.rate * 1024,
+                         latency=args.latency / 1000, total_rate=args.total_rate * 1024)
+    print(f"در حال سرویس {server.url} ({args.size} MB)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
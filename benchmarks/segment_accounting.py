@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+بنچمارک حسابداری پیشرفت بخش‌ها: سرعت دانلود یک فایل از سرور محلی با ۱، ۱۶ و ۱۲۸ بخش
+و هزینه ثبت پیشرفت هر تکه با قفل سراسری در مقایسه با شمارنده جداگانه هر بخش.
+
+سرور داخلی با کلاینت در یک مفسر اجرا می‌شود و GIL مشترک دارد؛ برای اندازه‌گیری دقیق‌تر
+سرور را جداگانه اجرا کنید:
+    python benchmarks/range_server.py --size 128 --port 8765
+    python benchmarks/segment_accounting.py --size 128 --url http://127.0.0.1:8765/payload.bin
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import shetabdaryaft
+from range_server import make_payload, start_server
+
+
+def run_download(url, segments, save_path, payload):
+    """یک دانلود کامل با تعداد بخش ثابت؛ (ثانیه، صحت محتوا) برمی‌گرداند"""
+    config = dict(shetabdaryaft.DEFAULT_CONFIG)
+    config.update({
+        "max_concurrent_downloads": 1,
+        "max_threads_per_download": segments,
+        "adaptive_connections": False,
+        "chunk_size": 64 * 1024,
+        "min_segment_size": 64 * 1024,
+    })
+
+    done = threading.Event()
+
+    def on_update(item):
+        if item.status in ("completed", "error", "canceled"):
+            done.set()
+
+    manager = shetabdaryaft.DownloadManager(config, on_update)
+    start = time.perf_counter()
+    download_id = manager.add_download(url, save_path, f"bench_{segments}.bin")
+    done.wait(600)
+    elapsed = time.perf_counter() - start
+
+    item = manager.get_download(download_id)
+    with open(item.full_path, "rb") as f:
+        valid = item.status == "completed" and f.read() == payload
+    manager.close_sessions()
+    os.remove(item.full_path)
+    return elapsed, valid, len(item.thread_data)
+
+
+def accounting_cost(segments, updates, use_lock):
+    """زمان ثبت updates تکه توسط segments نخ؛ با قفل سراسری (روش قبلی) یا شمارنده هر بخش"""
+    lock = threading.RLock()
+    item = shetabdaryaft.DownloadItem("http://127.0.0.1/payload.bin", tempfile.gettempdir())
+    item.thread_data = [{'downloaded': 0} for _ in range(segments)]
+    totals = {'downloaded': 0}
+    per_thread = updates // segments
+    barrier = threading.Barrier(segments + 1)
+
+    def worker(thread_info):
+        barrier.wait()
+        for _ in range(per_thread):
+            thread_info['downloaded'] += 65536
+            if use_lock:
+                with lock:
+                    totals['downloaded'] += 65536
+
+    threads = [threading.Thread(target=worker, args=(thread_info,)) for thread_info in item.thread_data]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert item.downloaded == per_thread * segments * 65536
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک حسابداری پیشرفت بخش‌ها")
+    parser.add_argument("--size", type=int, default=128, help="اندازه فایل به مگابایت")
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", help="آدرس سرور بازه‌ای خارجی با همان اندازه محتوا")
+    parser.add_argument("--updates", type=int, default=1_000_000, help="تعداد ثبت پیشرفت در آزمون حسابداری")
+    args = parser.parse_args()
+
+    # دانلودهای بنچمارک در تاریخچه و پوشه موقت برنامه ثبت نمی‌شوند
+    work_dir = tempfile.mkdtemp(prefix="shetab_bench_")
+    shetabdaryaft.HISTORY_FILE = os.path.join(work_dir, "history.json")
+    shetabdaryaft.HISTORY_DB = os.path.join(work_dir, "history.db")
+    shetabdaryaft.TEMP_DIR = work_dir
+
+    payload = make_payload(args.size * 1024 * 1024)
+    server = None if args.url else start_server(payload)
+    url = args.url or server.url
+
+    try:
+        print("دانلود کامل از سرور محلی")
+        print(f"{'segments':>8} {'best s':>8} {'MB/s':>8}  valid")
+        for segments in args.segments:
+            runs = [run_download(url, segments, work_dir, payload) for _ in range(args.repeat)]
+            best = min(elapsed for elapsed, _, _ in runs)
+            valid = all(ok for _, ok, _ in runs)
+            print(f"{segments:>8} {best:>8.3f} {args.size / best:>8.1f}  {'yes' if valid else 'NO'}")
+
+        print(f"\nهزینه ثبت {args.updates} تکه")
+        print(f"{'segments':>8} {'global lock s':>14} {'per segment s':>14}")
+        for segments in args.segments:
+            locked = min(accounting_cost(segments, args.updates, True) for _ in range(args.repeat))
+            unlocked = min(accounting_cost(segments, args.updates, False) for _ in range(args.repeat))
+            print(f"{segments:>8} {locked:>14.3f} {unlocked:>14.3f}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+بنچمارک توان عملیاتی DownloadManager در برابر سرور بازه‌ای محلی برای تنظیم
+max_threads_per_download، chunk_size و max_concurrent_downloads.
+
+سناریوها:
+    single     یک فایل بزرگ با یک اتصال
+    segmented  یک فایل بزرگ با --threads اتصال
+    small      --files فایل کوچک با --concurrency دانلود همزمان
+
+سرور در یک فرایند جداگانه و هر اجرا در یک فرایند تازه انجام می‌شود تا زمان CPU و بیشینه
+حافظه (RSS) فقط مربوط به همان اجرا باشد. نتایج در فایل JSON ذخیره و با --compare مقایسه می‌شوند:
+    python benchmarks/throughput.py --rate 2048 --latency 20 --threads 1 4 8 16 --output base.json
+    python benchmarks/throughput.py --rate 2048 --latency 20 --threads 1 4 8 16 --compare base.json
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+try:
+    import resource
+except ImportError:  # ویندوز
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import shetabdaryaft
+from range_server import RangeServer, make_payload
+
+
+def serve(size, rate, latency, ready):
+    """اجرای سرور بازه‌ای در فرایند فرزند؛ درگاه از طریق صف ready اعلام می‌شود"""
+    server = RangeServer(make_payload(size), rate=rate, latency=latency)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server_process(size, rate, latency):
+    """راه‌اندازی سرور در فرایند جداگانه تا با کلاینت در GIL و زمان CPU شریک نباشد"""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(size, rate, latency, ready), daemon=True)
+    process.start()
+    port = ready.get(timeout=60)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def peak_rss_mb():
+    """بیشینه حافظه مقیم همین فرایند؛ در ویندوز در دسترس نیست"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # لینوکس کیلوبایت و مک بایت گزارش می‌کند
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(params, base_url, run_id, results):
+    """یک اجرای کامل سناریو در فرایند فرزند؛ نتیجه در صف results قرار می‌گیرد"""
+    # پیام پایان هر دانلود در خروجی بنچمارک چاپ نشود
+    sys.stdout = open(os.devnull, "w")
+    work_dir = tempfile.mkdtemp(prefix="shetab_throughput_")
+    shetabdaryaft.HISTORY_FILE = os.path.join(work_dir, "history.json")
+    shetabdaryaft.HISTORY_DB = os.path.join(work_dir, "history.db")
+    shetabdaryaft.TEMP_DIR = work_dir
+    # بارگذاری requests در زمان و حافظه پایه حساب می‌شود، نه در اجرا
+    shetabdaryaft.load_network_modules()
+
+    config = dict(shetabdaryaft.DEFAULT_CONFIG)
+    config.update({
+        "default_download_path": work_dir,
+        "download_engine": params["engine"],
+        "max_concurrent_downloads": params["concurrency"],
+        "max_threads_per_download": params["threads"],
+        "use_multithreaded_download": params["threads"] > 1,
+        "adaptive_connections": params["adaptive"],
+        "chunk_size": params["chunk_size"],
+    })
+
+    finished = threading.Event()
+
+    def on_update(item):
+        if item.status in ("completed", "error", "canceled"):
+            finished.set()
+
+    manager = shetabdaryaft.create_download_manager(config, on_update)
+    paths = [f"/run{run_id}/file{index}.bin?size={params['file_size']}" for index in range(params["files"])]
+
+    start_rss = peak_rss_mb()
+    start_wall = time.time()
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    ids = [manager.add_download(base_url + path, work_dir, f"file{index}.bin") for index, path in enumerate(paths)]
+
+    while True:
+        counts = manager.get_stats()["counts"]
+        if counts["completed"] + counts["error"] + counts["canceled"] >= len(ids):
+            break
+        finished.wait(0.1)
+        finished.clear()
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    # پیش از خواندن فایل‌ها برای بررسی صحت
+    peak_rss = peak_rss_mb()
+    manager.shutdown()
+
+    with urllib.request.urlopen(base_url + "/__first_bytes") as response:
+        first_bytes = json.load(response)
+
+    # زمان تا اولین بایت از شروع واقعی هر دانلود حساب می‌شود، نه از زمان انتظار در صف
+    expected = make_payload(params["file_size"])
+    valid = True
+    ttfb = []
+    for download_id, path in zip(ids, paths):
+        item = manager.get_download(download_id)
+        if path in first_bytes:
+            ttfb.append(first_bytes[path] - (item.start_time or start_wall))
+        if item.status != "completed":
+            valid = False
+            continue
+        with open(item.full_path, "rb") as f:
+            valid = valid and f.read() == expected
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    results.put({
+        "seconds": elapsed,
+        "mbps": params["files"] * params["file_size"] / (1024 * 1024) / elapsed,
+        "ttfb_ms": statistics.median(ttfb) * 1000 if ttfb else None,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": peak_rss,
+        "base_rss_mb": start_rss,
+        "valid": valid,
+    })
+
+
+def run_isolated(params, base_url, run_id, timeout):
+    """اجرای سناریو در یک فرایند تازه"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_once, args=(params, base_url, run_id, results))
+    process.start()
+    try:
+        return results.get(timeout=timeout)
+    finally:
+        process.join(10)
+        if process.is_alive():
+            process.terminate()
+
+
+def build_scenarios(args):
+    """فهرست ترکیب‌های سناریو، موتور، تعداد اتصال، همزمانی و اندازه تکه"""
+    scenarios = []
+    for engine in args.engines:
+        for chunk_kb in args.chunk_size:
+            common = {"engine": engine, "chunk_size": chunk_kb * 1024, "adaptive": args.adaptive}
+            if "single" in args.scenarios:
+                scenarios.append(dict(common, scenario="single", threads=1, concurrency=1,
+                                      files=1, file_size=args.size * 1024 * 1024))
+            if "segmented" in args.scenarios:
+                for threads in args.threads:
+                    scenarios.append(dict(common, scenario="segmented", threads=threads, concurrency=1,
+                                          files=1, file_size=args.size * 1024 * 1024))
+            if "small" in args.scenarios:
+                for concurrency in args.concurrency:
+                    scenarios.append(dict(common, scenario="small", threads=1, concurrency=concurrency,
+                                          files=args.files, file_size=args.file_size * 1024))
+    return scenarios
+
+
+def scenario_key(params):
+    return (f"{params['scenario']} engine={params['engine']} threads={params['threads']} "
+            f"concurrency={params['concurrency']} chunk={params['chunk_size'] // 1024}K")
+
+
+def summarize(params, runs):
+    """خلاصه تکرارها: بهترین توان، میانه زمان‌ها و بیشترین حافظه"""
+    def median(name):
+        values = [run[name] for run in runs if run[name] is not None]
+        return statistics.median(values) if values else None
+
+    peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None]
+    return dict(params, key=scenario_key(params), runs=runs,
+                best_mbps=max(run["mbps"] for run in runs),
+                median_mbps=median("mbps"),
+                median_ttfb_ms=median("ttfb_ms"),
+                median_cpu_seconds=median("cpu_seconds"),
+                peak_rss_mb=max(peaks) if peaks else None,
+                valid=all(run["valid"] for run in runs))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def format_number(value, digits=1):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_comparison(old_report, new_report):
+    """مقایسه نتایج با یک اجرای قبلی برای کلیدهای مشترک"""
+    old_results = {result["key"]: result for result in old_report["results"]}
+    print(f"\nمقایسه با {old_report['meta'].get('revision') or '?'} ({old_report['meta'].get('date', '?')})")
+    print(f"{'scenario':<62} {'old MB/s':>9} {'new MB/s':>9} {'change':>8} {'old cpu':>8} {'new cpu':>8}")
+    for result in new_report["results"]:
+        old = old_results.get(result["key"])
+        if old is None:
+            continue
+        change = (result["best_mbps"] - old["best_mbps"]) / old["best_mbps"] * 100
+        print(f"{result['key']:<62} {old['best_mbps']:>9.1f} {result['best_mbps']:>9.1f} {change:>+7.1f}% "
+              f"{format_number(old['median_cpu_seconds'], 2):>8} {format_number(result['median_cpu_seconds'], 2):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک توان عملیاتی مدیر دانلود")
+    parser.add_argument("--scenarios", nargs="+", choices=("single", "segmented", "small"),
+                        default=["single", "segmented", "small"])
+    parser.add_argument("--engines", nargs="+", choices=("threads", "asyncio"), default=["threads"])
+    parser.add_argument("--size", type=int, default=64, help="اندازه فایل بزرگ به مگابایت")
+    parser.add_argument("--files", type=int, default=200, help="تعداد فایل‌های کوچک")
+    parser.add_argument("--file-size", type=int, default=64, help="اندازه هر فایل کوچک به کیلوبایت")
+    parser.add_argument("--threads", type=int, nargs="+", default=[4, 8, 16], help="اتصال‌های سناریوی segmented")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8], help="همزمانی سناریوی small")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[1024], help="chunk_size به کیلوبایت")
+    parser.add_argument("--adaptive", action="store_true", help="افزایش تدریجی اتصال‌ها (adaptive_connections)")
+    parser.add_argument("--rate", type=int, default=0, help="سقف پهنای باند هر اتصال سرور به کیلوبایت بر ثانیه")
+    parser.add_argument("--latency", type=float, default=0, help="تأخیر سرور پیش از هر پاسخ به میلی‌ثانیه")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=int, default=600, help="حداکثر ثانیه هر اجرا")
+    parser.add_argument("--output", help="ذخیره نتایج در فایل JSON")
+    parser.add_argument("--compare", help="فایل JSON یک اجرای قبلی برای مقایسه")
+    args = parser.parse_args()
+
+    old_report = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old_report = json.load(f)
+
+    payload_size = max(args.size * 1024 * 1024, args.file_size * 1024)
+    server, base_url = start_server_process(payload_size, args.rate * 1024, args.latency / 1000)
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "app_version": shetabdaryaft.APP_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+
+    try:
+        print(f"سرور: {base_url} | سقف هر اتصال: {args.rate or '-'} KB/s | تأخیر: {args.latency:g} ms")
+        print(f"{'scenario':<62} {'MB/s':>8} {'ttfb ms':>8} {'cpu s':>7} {'rss MB':>7}  valid")
+        run_id = 0
+        for params in build_scenarios(args):
+            runs = []
+            for _ in range(args.repeat):
+                run_id += 1
+                runs.append(run_isolated(params, base_url, run_id, args.timeout))
+            result = summarize(params, runs)
+            report["results"].append(result)
+            print(f"{result['key']:<62} {result['best_mbps']:>8.1f} {format_number(result['median_ttfb_ms']):>8} "
+                  f"{format_number(result['median_cpu_seconds'], 2):>7} {format_number(result['peak_rss_mb']):>7}  "
+                  f"{'yes' if result['valid'] else 'NO'}")
+    finally:
+        server.terminate()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nنتایج در {args.output} ذخیره شد")
+    if old_report is not None:
+        print_comparison(old_report, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,34 @@
 تاریخ ایجاد: ۲۵ آوریل ۲۰۲۵
 """
 
+import time
+MODULE_LOAD_START = time.perf_counter()  # شروع زمان‌سنجی راه‌اندازی برای --startup-profile
+
 import os
 import sys
-import tkinter as tk
+import errno
+import shutil
+import asyncio
+import concurrent.futures
+import http.client
+import ssl
+import heapq
+import bisect
+import itertools
+import collections
+import hashlib
+import signal
 import threading
-import time
 import datetime
-import requests
-import queue
+import argparse
 import urllib.parse
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageDraw, ImageFont
 import math
 import re
 from io import BytesIO
 from urllib.parse import urlparse
 import json
+import csv
+import sqlite3
 
 # تنظیمات اولیه
 APP_NAME = "شتاب دریافت"
@@ -29,17 +41,245 @@ APP_VERSION = "2.0.0.0"
 APP_PATH = os.path.dirname(os.path.abspath(__file__))
 ASSETS_DIR = os.path.join(APP_PATH, "assets")
 FONT_DIR = os.path.join(APP_PATH, "font")
-HISTORY_FILE = os.path.join(APP_PATH, "download_history.json")
+HISTORY_FILE = os.path.join(APP_PATH, "download_history.json")  # قالب قدیمی؛ فقط یک بار وارد پایگاه داده می‌شود
+HISTORY_DB = os.path.join(APP_PATH, "download_history.db")
+HISTORY_BATCH_SIZE = 100  # حداکثر رکوردهای تاریخچه در هر تراکنش
+HISTORY_FLUSH_DELAY = 2  # ثانیه؛ حداکثر تأخیر ثبت یک رکورد تاریخچه روی دیسک
 CONFIG_FILE = os.path.join(APP_PATH, "config.json")
 TEMP_DIR = os.path.join(APP_PATH, "temp")
+USER_AGENT = "ShetabDaryaft/1.0"
+
+# سطح‌های اولویت دانلود؛ دانلودهای فوری بدون رعایت حداکثر دانلود همزمان شروع می‌شوند
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2
+PRIORITY_URGENT = 3
+
+# وضعیت‌های ممکن یک دانلود
+DOWNLOAD_STATUSES = ("pending", "downloading", "paused", "completed", "error", "canceled")
+
+# معیارهای پایش موتور دانلود
+METRICS_PREFIX = "shetabdaryaft_"
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # ثانیه
+METRICS_FILE_INTERVAL = 15  # ثانیه بین نوشتن فایل معیارها
+
+# چکیده (چک‌سام) فایل‌ها حین دانلود
+CHECKSUM_ALGORITHMS = {32: "md5", 40: "sha1", 64: "sha256"}  # الگوریتم بر اساس طول مقدار hex
+DIGEST_READ_SIZE = 1024 * 1024  # اندازه هر بار خواندن داده‌های نوشته‌شده بخش‌های جلوتر
+DIGEST_BLOCK_SIZE = 1024 * 1024  # اندازه بلوک‌های چکیده درختی که هر کدام حین نوشتن جداگانه هش می‌شوند
+TREE_DIGEST_SUFFIX = "-tree"  # پسوند نام الگوریتم چکیده درختی (مثلاً sha256-tree:hex)
+DIGEST_CATCH_UP_BYTES = 128 * 1024 * 1024  # حداکثر داده‌ای که مانیتور دانلود در هر نوبت به چکیده می‌افزاید
+
+# دانلود چندمنبعی (آینه‌ها)
+MIRROR_RETRY_DELAY = 30  # ثانیه کنار ماندن منبع خطادار یا کند پیش از اندازه‌گیری دوباره
+MIRROR_SLOW_RATIO = 0.25  # منبعی که سرعت هر اتصال و سرعت کلش هر دو کمتر از این نسبت بهترین منبع باشد کنار گذاشته می‌شود
+
+# ابعاد لیست دانلودها
+DOWNLOAD_ROW_HEIGHT = 28  # ارتفاع هر ردیف به پیکسل
+PROGRESS_BAR_CELLS = 20  # تعداد خانه‌های نوار پیشرفت متنی
+HISTORY_PAGE_SIZE = 50  # تعداد ردیف‌های هر صفحه دیالوگ تاریخچه
+DOWNLOAD_ROWS_PER_TICK = 2000  # حداکثر ردیف جدید لیست در هر به‌روزرسانی تا رابط کاربری روان بماند
+
+# requests و urllib3 حدود نیمی از زمان بارگذاری ماژول را می‌گیرند؛ تا اولین دانلود یا
+# بارگذاری پس‌زمینه بعد از نمایش پنجره، load_network_modules آن‌ها را وارد نمی‌کند
+requests = None
+HTTPAdapter = None
+Retry = None
+
+def load_network_modules():
+    """بارگذاری requests و urllib3 در فضای نام ماژول؛ فراخوانی‌های بعدی هزینه‌ای ندارند"""
+    global requests, HTTPAdapter, Retry
+    if requests is None:
+        import requests as requests_module
+        from requests.adapters import HTTPAdapter as adapter_class
+        from urllib3.util.retry import Retry as retry_class
+        HTTPAdapter, Retry = adapter_class, retry_class
+        requests = requests_module
+    return requests
+
+
+# tkinter فقط برای رابط گرافیکی بارگذاری می‌شود تا اجرای بدون رابط (get و daemon) به آن نیازی نداشته باشد
+tk = None
+ttk = None
+filedialog = None
+messagebox = None
+
+def load_gui_modules():
+    """بارگذاری tkinter در فضای نام ماژول"""
+    global tk, ttk, filedialog, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import filedialog as filedialog_module, messagebox as messagebox_module, ttk as ttk_module
+        ttk, filedialog, messagebox = ttk_module, filedialog_module, messagebox_module
+        tk = tkinter
+
+
+class StartupProfile:
+    """زمان‌سنجی مراحل راه‌اندازی؛ با --startup-profile گزارش آن چاپ می‌شود"""
+    
+    def __init__(self, start):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.start = start
+        self.last = start
+        self.phases = []
+    
+    def mark(self, name):
+        """ثبت پایان یک مرحله"""
+        with self.lock:
+            now = time.perf_counter()
+            self.phases.append((name, now - self.last, now - self.start))
+            self.last = now
+    
+    def report(self):
+        """چاپ مدت هر مرحله و زمان سپری شده از شروع بارگذاری ماژول"""
+        if not self.enabled:
+            return
+        with self.lock:
+            print("\n===== زمان‌بندی راه‌اندازی =====")
+            for name, duration, elapsed in self.phases:
+                print(f"{name:<28} {duration * 1000:8.1f} ms {elapsed * 1000:8.1f} ms")
+
+
+STARTUP_PROFILE = StartupProfile(MODULE_LOAD_START)
+
+
+# پروفایل‌گیری نمونه‌برداری؛ تا وقتی شروع نشده هیچ hook یا نخی فعال نیست
+PROFILE_INTERVAL = 0.01  # ثانیه بین نمونه‌برداری از پشته نخ‌ها
+PROFILE_DEFAULT_SECONDS = 30
+# حلقه‌های موتور دانلود و رابط کاربری که پروفایل می‌شوند؛ فقط پشته‌های شامل یکی از این توابع ثبت می‌شوند
+PROFILE_FOCUS = ("_download_part", "_download_single_threaded", "_monitor_multithreaded_download",
+                 "_download_part_async", "_download_single_async", "_download_multi_async",
+                 "_update_download_items")
+# نخ‌های موتور asyncio که coroutineهای آن بیشتر زمان معلق‌اند؛ کل پشته آن‌ها (از جمله انتظار حلقه) ثبت می‌شود
+PROFILE_THREADS = ("DownloadEventLoop", "DownloadIO")
+
+
+class SamplingProfiler:
+    """پروفایل‌گیری از همه نخ‌ها با نمونه‌برداری دوره‌ای sys._current_frames در یک پنجره زمانی
+    
+    خروجی با قالب collapsed stack (قابل استفاده در flamegraph.pl یا speedscope) کنار config.json نوشته می‌شود؛
+    هر پشته با نقش نخ (نام بدون شناسه دانلود و شماره بخش) و سپس نام کامل نخ شروع می‌شود تا نمونه‌های هر نقش کنار هم
+    و هر اتصال جداگانه دیده شود، و از بیرونی‌ترین تابع PROFILE_FOCUS ادامه می‌یابد.
+    """
+    
+    def __init__(self, interval=PROFILE_INTERVAL, focus=PROFILE_FOCUS, threads=PROFILE_THREADS):
+        self.interval = interval
+        self.focus = frozenset(focus)
+        self.threads = frozenset(threads)
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.result = None  # خلاصه آخرین پروفایل: path، samples، threads یا error
+    
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self, duration=PROFILE_DEFAULT_SECONDS):
+        """شروع پروفایل‌گیری برای duration ثانیه؛ اگر پروفایلی در حال اجراست False برمی‌گرداند"""
+        if self.running:
+            return False
+        self.result = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(duration, self.stop_event),
+                                       daemon=True, name="Profiler")
+        self.thread.start()
+        return True
+    
+    def stop(self):
+        """پایان زودتر پروفایل‌گیری و انتظار تا نوشتن فایل خروجی"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        return self.result
+    
+    def _run(self, duration, stop_event):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        stacks = {}
+        thread_samples = {}
+        
+        while not stop_event.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                codes = []
+                outermost_focus = None
+                while frame is not None:
+                    code = frame.f_code
+                    codes.append(code)
+                    if code.co_name in self.focus:
+                        outermost_focus = len(codes)
+                    frame = frame.f_back
+                
+                thread_name = names.get(ident, str(ident))
+                role = re.sub(r'[-_][\d-]+$', '', thread_name)
+                if role in self.threads:
+                    outermost_focus = len(codes)
+                if outermost_focus is None:
+                    continue
+                key = (role, thread_name, tuple(reversed(codes[:outermost_focus])))
+                stacks[key] = stacks.get(key, 0) + 1
+                thread_samples[role] = thread_samples.get(role, 0) + 1
+        
+        self.result = self._write(stacks, thread_samples)
+    
+    def _write(self, stacks, thread_samples):
+        path = os.path.join(os.path.dirname(CONFIG_FILE),
+                            f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}.collapsed")
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                for (role, thread_name, codes), count in sorted(stacks.items(), key=lambda entry: -entry[1]):
+                    frames = ";".join(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                                      for code in codes)
+                    f.write(f"{role};{thread_name};{frames} {count}\n")
+        except OSError as e:
+            print(f"خطا در ذخیره پروفایل: {e}")
+            return {"error": str(e)}
+        
+        print(f"پروفایل ({sum(thread_samples.values())} نمونه) در {path} ذخیره شد")
+        return {"path": path, "samples": sum(thread_samples.values()), "threads": thread_samples}
+
+
+PROFILER = SamplingProfiler()
+
+# ثبت فونت‌های ویندوز فقط یک بار در هر اجرا انجام می‌شود
+WINDOWS_FONTS_REGISTERED = False
+
+def register_windows_fonts():
+    """ثبت فونت‌های برنامه در ویندوز بدون انتظار برای پاسخ پنجره‌های دیگر"""
+    global WINDOWS_FONTS_REGISTERED
+    if os.name != "nt" or WINDOWS_FONTS_REGISTERED:
+        return
+    WINDOWS_FONTS_REGISTERED = True
+    
+    try:
+        import ctypes
+        FR_PRIVATE = 0x10
+        gdi32 = ctypes.WinDLL('gdi32')
+        
+        for font_file in ["BYekan+.ttf", "BYekan+ Bold.ttf"]:
+            font_path = os.path.join(FONT_DIR, font_file)
+            if not os.path.exists(font_path):
+                print(f"فایل فونت پیدا نشد: {font_path}")
+                continue
+            # ثبت خصوصی برای همین فرایند و ثبت عمومی برای Tk
+            if gdi32.AddFontResourceExW(font_path, FR_PRIVATE, 0) <= 0:
+                print(f"خطا در بارگذاری خصوصی فونت {font_file}")
+            if gdi32.AddFontResourceW(font_path) <= 0:
+                print(f"خطا در بارگذاری فونت {font_file}")
+        
+        # اعلام تغییر فونت؛ SendMessage تا پاسخ همه پنجره‌های باز منتظر می‌ماند
+        ctypes.windll.user32.PostMessageW(0xFFFF, 0x001D, 0, 0)  # WM_FONTCHANGE
+    except Exception as e:
+        print(f"خطا در فرآیند بارگذاری فونت: {str(e)}")
 
-# فانکشن برای نمایش اطلاعات فونت‌های موجود
-def print_font_info():
+# فانکشن برای نمایش اطلاعات فونت‌های موجود (گزینه --font-info)
+def print_font_info(root):
     """چاپ اطلاعات فونت‌های شناسایی شده"""
     try:
         import tkinter.font as tkfont
-        root = tk.Tk()
-        root.withdraw()  # پنجره مخفی می‌شود
         
         print("\n===== اطلاعات فونت‌های موجود =====")
         fonts = sorted(list(tkfont.families(root)))
@@ -56,8 +296,6 @@ def print_font_info():
         print("نمونه فونت‌ها:")
         for f in fonts[:10]:  # نمایش 10 فونت اول
             print(f"  - {f}")
-            
-        root.destroy()
     except Exception as e:
         print(f"خطا در بررسی فونت‌ها: {e}")
 
@@ -80,6 +318,15 @@ DEFAULT_CONFIG = {
     "max_threads_per_download": 5,
     "use_multithreaded_download": True,
     "chunk_size": 1024 * 1024,  # 1MB
+    "min_segment_size": 1024 * 1024,  # کوچک‌ترین بخشی که هنگام تقسیم پویا جدا می‌شود
+    "adaptive_connections": True,  # شروع با اتصال‌های کم و افزایش تا حداکثر تا وقتی سرعت بالا می‌رود
+    "initial_connections": 2,
+    "priority_aging": 600,  # هر سطح اولویت معادل این تعداد ثانیه انتظار در صف است
+    "storage_mode": "direct",  # direct: نوشتن مستقیم بخش‌ها در فایل مقصد، parts: فایل‌های موقت و ترکیب
+    "download_engine": "threads",  # threads: یک نخ برای هر بخش، asyncio: همه انتقال‌ها روی یک حلقه رویداد
+    "global_speed_limit": 0,  # کیلوبایت بر ثانیه برای کل برنامه، صفر یعنی بدون محدودیت
+    "download_speed_limit": 0,  # کیلوبایت بر ثانیه برای هر دانلود
+    "host_speed_limits": {},  # محدودیت هر میزبان: {"example.com": 500}
     "theme": "aqua",  # تم اختصاصی آبی
     "language": "fa",
     "rtl": True,
@@ -88,21 +335,643 @@ DEFAULT_CONFIG = {
     "tray_icon_enabled": True,
     "minimize_to_tray": True,
     "show_notifications": True,
-    "font_size": 14  # افزایش سایز پیش‌فرض فونت
+    "font_size": 14,  # افزایش سایز پیش‌فرض فونت
+    "ui_updates_per_second": 4,  # حداکثر دفعات به‌روزرسانی هر دانلود در رابط کاربری
+    "import_probe_workers": 8,  # درخواست‌های HEAD همزمان هنگام وارد کردن فهرست آدرس‌ها
+    "import_batch_size": 500,  # تعداد دانلودهایی که با یک بار گرفتن قفل به صف اضافه می‌شوند
+    "control_api": False,  # API محلی HTTP/JSON برای افزودن و کنترل دانلودها از اسکریپت‌ها
+    "control_api_host": "127.0.0.1",
+    "control_api_port": 6801,
+    "control_api_token": "",  # در صورت تعیین، هدر Authorization: Bearer <token> لازم است
+    "metrics_file": "",  # مسیر فایل معیارهای Prometheus که هر چند ثانیه بازنویسی می‌شود
+    "checksum_algorithm": "sha256"  # چکیده‌ای که حین دانلود محاسبه و در تاریخچه ثبت می‌شود؛ خالی یعنی بدون چکیده
 }
 
+def load_config():
+    """بارگذاری تنظیمات از فایل"""
+    if not os.path.exists(CONFIG_FILE):
+        # اگر فایل تنظیمات وجود ندارد، از تنظیمات پیش‌فرض استفاده کن
+        save_config(DEFAULT_CONFIG)
+        return dict(DEFAULT_CONFIG)
+    
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+            # ادغام تنظیمات جدید از تنظیمات پیش‌فرض
+            for key, value in DEFAULT_CONFIG.items():
+                if key not in config:
+                    config[key] = value
+            return config
+    except:
+        # در صورت خطا، از تنظیمات پیش‌فرض استفاده کن
+        save_config(DEFAULT_CONFIG)
+        return dict(DEFAULT_CONFIG)
+
+def save_config(config):
+    """ذخیره تنظیمات در فایل"""
+    try:
+        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        return True
+    except:
+        print("خطا در ذخیره‌سازی تنظیمات")
+        return False
+
+# شناسه دانلودها؛ در افزودن دسته‌ای چند دانلود در یک تیک ساعت ساخته می‌شوند و نباید تکراری باشند
+DOWNLOAD_ID_LOCK = threading.Lock()
+LAST_DOWNLOAD_ID = 0
+
+def new_download_id():
+    """شناسه یکتا و صعودی بر پایه زمان (میکروثانیه)"""
+    global LAST_DOWNLOAD_ID
+    with DOWNLOAD_ID_LOCK:
+        LAST_DOWNLOAD_ID = max(time.time_ns() // 1000, LAST_DOWNLOAD_ID + 1)
+        return str(LAST_DOWNLOAD_ID)
+
+def iter_url_list(path):
+    """خواندن جریانی فهرست آدرس‌ها از فایل متنی، CSV یا JSONL؛ هر مورد دیکشنری با کلید url و در صورت وجود
+    filename، checksum و mirrors است"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if extension == ".csv":
+            header = None
+            for row in csv.reader(f):
+                if not row:
+                    continue
+                if header is None:
+                    header = [column.strip().lower() for column in row]
+                    if "url" in header:
+                        continue
+                    header = []  # فایل بدون سطر عنوان: ستون اول آدرس و ستون دوم نام فایل
+                if header:
+                    yield dict(zip(header, row))
+                else:
+                    yield {"url": row[0], "filename": row[1] if len(row) > 1 else None}
+        elif extension in (".jsonl", ".ndjson"):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    yield {"url": None}
+                    continue
+                yield data if isinstance(data, dict) else {"url": data}
+        else:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    # آدرس‌های بعدی همان خط آینه‌های همان فایل هستند
+                    url, *mirrors = line.split()
+                    yield {"url": url, "mirrors": mirrors}
+
+def parse_checksum(value):
+    """تبدیل چک‌سام ورودی (hex یا algo:hex) به قالب algo:hex؛ الگوریتم از طول مقدار تشخیص داده می‌شود
+    (algo-tree:hex چکیده درختی ثبت‌شده برای دانلودهای چندبخشی است)"""
+    algorithm, _, digest = value.strip().lower().rpartition(":")
+    suffix = TREE_DIGEST_SUFFIX if algorithm.endswith(TREE_DIGEST_SUFFIX) else ""
+    algorithm = algorithm[:len(algorithm) - len(suffix)]
+    expected = CHECKSUM_ALGORITHMS.get(len(digest))
+    if expected is None or not re.fullmatch(r'[0-9a-f]+', digest):
+        raise ValueError(f"چک‌سام نامعتبر است (md5، sha1 یا sha256 به صورت hex): {value}")
+    if algorithm and algorithm.replace("-", "") != expected:
+        raise ValueError(f"طول چک‌سام با الگوریتم {algorithm} مطابقت ندارد: {value}")
+    return f"{expected}{suffix}:{digest}"
+
+def parse_mirrors(value):
+    """فهرست آدرس آینه‌ها از رشته (جداشده با فاصله) یا فهرست؛ آدرس نامعتبر ValueError می‌دهد"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split()
+    mirrors = []
+    for url in value:
+        url = str(url).strip()
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.netloc:
+            raise ValueError(f"آدرس آینه نامعتبر است: {url}")
+        if url not in mirrors:
+            mirrors.append(url)
+    return mirrors
+
 # کلاس‌های سفارشی برای ذخیره‌سازی اطلاعات
 
+class TokenBucket:
+    """محدودکننده پهنای باند به روش سطل توکن؛ برای نخ‌ها و coroutineها قابل استفاده است"""
+    
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = 0
+        self.capacity = 0
+        self.tokens = 0
+        self.timestamp = time.monotonic()
+        self.set_rate(rate)
+    
+    def set_rate(self, rate):
+        """تغییر نرخ (بایت بر ثانیه) در حین کار؛ صفر یعنی بدون محدودیت"""
+        with self.lock:
+            self.rate = max(0, rate)
+            # ظرفیت انفجاری ربع ثانیه است تا جریان‌ها یکنواخت بمانند
+            self.capacity = max(self.rate / 4, 16 * 1024)
+            self.tokens = min(self.tokens, self.capacity)
+            self.timestamp = time.monotonic()
+    
+    def reserve(self, size):
+        """برداشت size بایت و برگرداندن زمان انتظار لازم به ثانیه
+        
+        برداشت حتی با موجودی ناکافی انجام می‌شود و بدهی به ترتیب درخواست‌ها
+        پرداخت می‌شود؛ به این ترتیب بخش‌های همزمان سهم برابر می‌گیرند.
+        """
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= size
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class UIUpdateBus:
+    """صندوق پیام بین مدیر دانلود و رابط کاربری؛ به‌روزرسانی‌های هر دانلود تا تخلیه بعدی ادغام می‌شوند
+    
+    publish از هر نخی فراخوانی می‌شود و به Tk دست نمی‌زند؛ drain فقط در نخ اصلی Tk اجرا می‌شود.
+    افزودن و حذف دانلودها هم جداگانه ثبت می‌شوند تا لیست بدون پیمایش همه دانلودها همگام شود.
+    """
+    
+    def __init__(self):
+        self.pending = {}
+        # append و popleft در deque اتمی هستند؛ تنها مصرف‌کننده نخ اصلی Tk است
+        self.added = collections.deque()
+        self.removed = collections.deque()
+    
+    def publish_added(self, item):
+        """ثبت افزوده شدن دانلود به فهرست مدیر دانلود"""
+        self.added.append(item)
+    
+    def publish_removed(self, download_id):
+        """ثبت حذف دانلود از فهرست مدیر دانلود"""
+        self.removed.append(download_id)
+    
+    def drain_added(self, limit):
+        """برداشتن حداکثر limit دانلود تازه به ترتیب افزوده شدن؛ بقیه برای تخلیه بعدی می‌مانند"""
+        items = []
+        while self.added and len(items) < limit:
+            items.append(self.added.popleft())
+        return items
+    
+    def drain_removed(self):
+        """برداشتن شناسه دانلودهایی که از تخلیه قبلی حذف شده‌اند"""
+        removed = []
+        while self.removed:
+            removed.append(self.removed.popleft())
+        return removed
+    
+    def publish(self, item):
+        """ثبت تغییر یک دانلود؛ انتساب در دیکشنری اتمی است و قفلی لازم ندارد"""
+        self.pending[item.id] = item
+    
+    def drain(self):
+        """برداشتن آخرین وضعیت دانلودهایی که از تخلیه قبلی تغییر کرده‌اند"""
+        pending = self.pending
+        items = []
+        for download_id in list(pending):
+            # انتشار همزمان پس از pop در تخلیه بعدی دیده می‌شود و از دست نمی‌رود
+            item = pending.pop(download_id, None)
+            if item is not None:
+                items.append(item)
+        return items
+
+
+class DownloadScheduler:
+    """صف اولویت‌دار دانلودها با حذف تنبل؛ برداشتن، تغییر اولویت و حذف با هزینه O(log n)
+    
+    کلید هر مورد زمان ورود به صف منهای امتیاز اولویت آن است؛ مورد کم‌اولویتی که به اندازه
+    کافی منتظر مانده باشد از موارد پراولویت تازه جلو می‌زند و هیچ موردی گرسنه نمی‌ماند.
+    موارد فوری همیشه پیش از بقیه قرار می‌گیرند.
+    """
+    
+    def __init__(self, aging_weight=600):
+        self.aging_weight = aging_weight
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.front = None
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __contains__(self, download_id):
+        return download_id in self.entries
+    
+    def push(self, download_id, priority=PRIORITY_NORMAL, enqueue_time=None):
+        """افزودن یا جایگزینی یک مورد در صف"""
+        if enqueue_time is None:
+            enqueue_time = time.time()
+        self._push(download_id, priority, enqueue_time, enqueue_time - priority * self.aging_weight)
+    
+    def _push(self, download_id, priority, enqueue_time, key):
+        self.remove(download_id)
+        tier = 0 if priority >= PRIORITY_URGENT else 1
+        if tier == 1 and (self.front is None or key < self.front):
+            self.front = key
+        
+        # [رده، کلید، ترتیب ورود، شناسه، زمان ورود، اولویت]؛ شناسه None یعنی حذف شده
+        entry = [tier, key, next(self.counter), download_id, enqueue_time, priority]
+        self.entries[download_id] = entry
+        heapq.heappush(self.heap, entry)
+    
+    def remove(self, download_id):
+        """حذف یک مورد از صف؛ ورودی آن هنگام رسیدن به ابتدای هرم دور ریخته می‌شود"""
+        entry = self.entries.pop(download_id, None)
+        if entry is None:
+            return False
+        entry[3] = None
+        
+        # بازسازی هرم وقتی بیشتر آن ورودی‌های حذف‌شده است
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [entry for entry in self.heap if entry[3] is not None]
+            heapq.heapify(self.heap)
+        return True
+    
+    def set_priority(self, download_id, priority):
+        """تغییر اولویت با حفظ زمان ورود به صف (و در نتیجه انتظار سپری‌شده)"""
+        entry = self.entries.get(download_id)
+        if entry is None:
+            return False
+        self.push(download_id, priority, entry[4])
+        return True
+    
+    def move_to_top(self, download_id):
+        """انتقال یک مورد به ابتدای صف (پس از موارد فوری)"""
+        entry = self.entries.get(download_id)
+        if entry is None:
+            return False
+        self._push(download_id, entry[5], entry[4], self.front - 1 if self.front is not None else 0)
+        return True
+    
+    def peek(self):
+        """مورد ابتدای صف به شکل (شناسه، فوری بودن) یا None"""
+        heap = self.heap
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0][3], heap[0][0] == 0
+    
+    def pop(self):
+        """برداشتن مورد ابتدای صف؛ در صف خالی None برمی‌گرداند"""
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[3] is not None:
+                del self.entries[entry[3]]
+                return entry[3]
+        return None
+
+
+class DownloadStats:
+    """شمارنده وضعیت دانلودها که با هر تغییر وضعیت به‌روز می‌شود؛ آمار بدون پیمایش همه دانلودها خوانده می‌شود"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(DOWNLOAD_STATUSES, 0)
+        self.active = set()  # دانلودهای در حال انجام برای جمع سرعت
+    
+    def track(self, item):
+        """ثبت یک دانلود جدید در آمار"""
+        with self.lock:
+            item.stats = self
+            self._count(item, item._status, 1)
+    
+    def untrack(self, item):
+        """حذف دانلود از آمار"""
+        with self.lock:
+            if item.stats is self:
+                item.stats = None
+                self._count(item, item._status, -1)
+    
+    def set_status(self, item, status):
+        """تغییر وضعیت دانلود و شمارنده‌ها به صورت یکجا"""
+        with self.lock:
+            self._count(item, item._status, -1)
+            item._status = status
+            self._count(item, status, 1)
+    
+    def _count(self, item, status, delta):
+        self.counts[status] = self.counts.get(status, 0) + delta
+        if status == "downloading":
+            if delta > 0:
+                self.active.add(item)
+            else:
+                self.active.discard(item)
+    
+    def snapshot(self):
+        """تعداد دانلودها به تفکیک وضعیت، تعداد کل و مجموع سرعت دانلودهای فعال"""
+        with self.lock:
+            counts = dict(self.counts)
+            active = list(self.active)
+        return {
+            "counts": counts,
+            "total": sum(counts.values()),
+            "speed": sum(item.speed for item in active)
+        }
+
+
+class DownloadMetrics:
+    """شمارنده‌ها و هیستوگرام‌های داخلی موتور دانلود برای پایش
+    
+    ثبت فقط در رویدادهای هر درخواست، بخش یا اجرای دانلود انجام می‌شود و حلقه خواندن تکه‌ها هزینه‌ای نمی‌پردازد؛
+    حجم دریافتی هنگام گرفتن گزارش از شمارنده‌های موجود دانلودها محاسبه می‌شود.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}  # (نام، برچسب‌ها) -> مقدار
+        self.histograms = {}  # نام -> [تعداد هر بازه، مجموع، تعداد]
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value):
+        index = bisect.bisect_left(METRICS_BUCKETS, value)
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * (len(METRICS_BUCKETS) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def snapshot(self):
+        """کپی شمارنده‌ها و هیستوگرام‌ها (تعداد هر بازه به صورت غیرتجمعی)"""
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: {"buckets": list(buckets), "sum": total, "count": count}
+                          for name, (buckets, total, count) in self.histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+
+class ConnectionController:
+    """تنظیم تعداد اتصال‌های یک دانلود به روش AIMD بر اساس نمونه‌های سرعت"""
+    
+    # افزایش سرعت کمتر از این نسبت پس از افزودن اتصال، یعنی سرعت به سقف رسیده است
+    MIN_GAIN = 0.05
+    SETTLE_TIME = 2
+    HOLD_TIME = 5
+    MAX_THROTTLE_STRIKES = 5
+    
+    def __init__(self, initial, maximum):
+        self.maximum = max(1, maximum)
+        self.target = max(1, min(initial, self.maximum))
+        self.baseline = 0
+        self.probing = False
+        self.hold_until = 0
+        self.throttle_strikes = 0
+    
+    def on_speed_sample(self, speed, now):
+        """افزایش جمعی اتصال‌ها تا وقتی سرعت کل بالا می‌رود؛ True اگر اتصالی اضافه شود"""
+        if speed > 0:
+            self.throttle_strikes = 0
+        if now < self.hold_until:
+            return False
+        
+        if self.probing:
+            self.probing = False
+            if speed < self.baseline * (1 + self.MIN_GAIN):
+                # اتصال آخر سودی نداشت؛ برگشت و صبر پیش از آزمون دوباره
+                self.target = max(1, self.target - 1)
+                self.hold_until = now + self.HOLD_TIME
+                return False
+        
+        if self.target >= self.maximum:
+            return False
+        
+        self.baseline = speed
+        self.target += 1
+        self.probing = True
+        self.hold_until = now + self.SETTLE_TIME
+        return True
+    
+    def on_throttled(self, now, retry_after=0):
+        """کاهش ضربی اتصال‌ها پس از پاسخ 429/503؛ False اگر سرور با یک اتصال هم نپذیرد"""
+        if self.target == 1:
+            self.throttle_strikes += 1
+        self.target = max(1, self.target // 2)
+        self.probing = False
+        self.hold_until = now + max(self.HOLD_TIME, retry_after)
+        return self.throttle_strikes <= self.MAX_THROTTLE_STRIKES
+
+
+class MirrorSet:
+    """منابع (آینه‌های) یک دانلود چندبخشی: هر درخواست بخش به منبعی با بیشترین سرعت اندازه‌گیری‌شده هر اتصال
+    می‌رود و منبع‌های خطادار یا بسیار کند موقتاً کنار گذاشته می‌شوند"""
+    
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.lock = threading.Lock()
+        self.active = dict.fromkeys(self.urls, 0)  # درخواست‌های در جریان هر منبع
+        self.received = dict.fromkeys(self.urls, 0)
+        self.rate = dict.fromkeys(self.urls)  # بایت بر ثانیه هر اتصال (میانگین نمایی)؛ None یعنی اندازه‌گیری نشده
+        self.throughput = dict.fromkeys(self.urls, 0)  # بایت بر ثانیه کل منبع (میانگین نمایی)
+        self.samples = dict.fromkeys(self.urls, 0)
+        self.disabled_until = dict.fromkeys(self.urls, 0)
+        self.sample_time = None
+        self.sample_bytes = dict(self.received)
+    
+    def usable(self, url, now):
+        return self.disabled_until[url] <= now
+    
+    def usable_count(self, now):
+        return sum(1 for url in self.urls if self.disabled_until[url] <= now)
+    
+    def acquire(self, now, url=None):
+        """ثبت یک درخواست روی منبع url یا بهترین منبع: اول منبع‌های اندازه‌گیری‌نشده (کم‌بارترین)،
+        سپس منبعی که هر اتصالش سریع‌تر است؛ با پایین آمدن سرعت هر اتصال منبع پربار، منبع‌های دیگر انتخاب می‌شوند"""
+        with self.lock:
+            if url is None:
+                usable = [url for url in self.urls if self.disabled_until[url] <= now] or self.urls
+                unmeasured = [url for url in usable if self.rate[url] is None]
+                if unmeasured:
+                    url = min(unmeasured, key=lambda x: self.active[x])
+                else:
+                    url = max(usable, key=lambda x: self.rate[x])
+            self.active[url] += 1
+            return url
+    
+    def release(self, url):
+        with self.lock:
+            self.active[url] -= 1
+    
+    def add_bytes(self, url, size):
+        with self.lock:
+            self.received[url] += size
+    
+    def connection_rate(self, url=None):
+        """سرعت اندازه‌گیری‌شده هر اتصال منبع url؛ بدون url یا برای منبع اندازه‌گیری‌نشده بهترین سرعت موجود (یا ۱)"""
+        with self.lock:
+            return self.rate.get(url) or max((rate for rate in self.rate.values() if rate), default=1)
+    
+    def fail(self, url, now):
+        """کنار گذاشتن موقت منبع پس از خطا؛ اگر منبع قابل استفاده دیگری مانده باشد True برمی‌گرداند"""
+        with self.lock:
+            self._disable(url, now)
+            return any(self.disabled_until[other] <= now for other in self.urls)
+    
+    def _disable(self, url, now):
+        # پس از این مدت منبع دوباره اندازه‌گیری می‌شود
+        self.disabled_until[url] = now + MIRROR_RETRY_DELAY
+        self.rate[url] = None
+        self.throughput[url] = 0
+        self.samples[url] = 0
+    
+    def sample(self, now):
+        """به‌روزرسانی سرعت منبع‌ها و کنار گذاشتن منبع‌هایی که هم سرعت هر اتصال و هم سرعت کلشان بسیار کمتر
+        از بهترین منبع است (منبع پربار فقط سرعت هر اتصالش پایین می‌آید)؛ فهرست منبع‌های کنارگذاشته برگردانده می‌شود.
+        از مانیتور دانلود در هر نمونه سرعت فراخوانی می‌شود"""
+        with self.lock:
+            elapsed = now - self.sample_time if self.sample_time is not None else 0
+            measured = {}
+            for url in self.urls:
+                active = self.active[url]
+                if elapsed <= 0 or not active or self.disabled_until[url] > now:
+                    continue
+                throughput = (self.received[url] - self.sample_bytes[url]) / elapsed
+                previous = self.rate[url]
+                self.rate[url] = throughput / active if previous is None else (previous + throughput / active) / 2
+                self.throughput[url] = (self.throughput[url] + throughput) / 2 if self.samples[url] else throughput
+                self.samples[url] += 1
+                # نمونه اول زمان برقراری اتصال را هم در بر دارد
+                if self.samples[url] >= 2:
+                    measured[url] = (self.rate[url], self.throughput[url])
+            self.sample_time = now
+            self.sample_bytes = dict(self.received)
+            
+            slow = []
+            if len(measured) > 1:
+                best_rate = max(rate for rate, _ in measured.values())
+                best_throughput = max(throughput for _, throughput in measured.values())
+                slow = [url for url, (rate, throughput) in measured.items()
+                        if rate < best_rate * MIRROR_SLOW_RATIO and throughput < best_throughput * MIRROR_SLOW_RATIO]
+                for url in slow:
+                    self._disable(url, now)
+            return slow
+
+
+class StreamDigest:
+    """چکیده پیوسته یک فایل: داده‌ها به ترتیب موقعیت در فایل و فقط در ادامه پیشوند هش‌شده افزوده می‌شوند"""
+    
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.hasher = hashlib.new(algorithm)
+        self.offset = 0  # طول پیشوند هش‌شده فایل
+        self.lock = threading.Lock()
+    
+    def update(self, position, data):
+        """افزودن تکه نوشته‌شده در موقعیت position؛ تکه‌ای که ادامه پیشوند نباشد نادیده گرفته می‌شود"""
+        with self.lock:
+            if position != self.offset:
+                return False
+            self.hasher.update(data)
+            self.offset += len(data)
+            return True
+    
+    def catch_up(self, read, limit):
+        """خواندن داده‌های نوشته‌شده از انتهای پیشوند تا limit با read(موقعیت، اندازه) و افزودن آن‌ها"""
+        while True:
+            with self.lock:
+                position = self.offset
+            size = min(DIGEST_READ_SIZE, limit - position)
+            if size <= 0:
+                break
+            # خواندن از دیسک بیرون از قفل است تا نخ بخشی که در لبه پیشوند می‌نویسد منتظر نماند
+            data = read(position, size)
+            if not data:
+                break
+            with self.lock:
+                # اگر نخ بخش در این فاصله پیشوند را جلو برده باشد، خواندن از موقعیت جدید تکرار می‌شود
+                if self.offset == position:
+                    self.hasher.update(data)
+                    self.offset += len(data)
+    
+    def result(self):
+        """چکیده نهایی به قالب algo:hex"""
+        with self.lock:
+            return f"{self.algorithm}:{self.hasher.hexdigest()}"
+
+
+class TreeDigest:
+    """چکیده درختی: هر بلوک DIGEST_BLOCK_SIZE بایتی فایل حین نوشتن توسط نخی که آن را می‌نویسد هش می‌شود و
+    چکیده نهایی هش چکیده بلوک‌ها به ترتیب است (algo-tree:hex)؛ مقدار به تقسیم‌بندی بخش‌ها بستگی ندارد"""
+    
+    def __init__(self, algorithm):
+        hashlib.new(algorithm)  # الگوریتم ناشناخته ValueError می‌دهد
+        self.algorithm = algorithm
+        self.blocks = {}  # شماره بلوک -> چکیده بلوک کامل
+        self.open = {}  # موقعیت ادامه -> هش بلوک نیمه‌کاره‌ای که داده‌های آن تا همین موقعیت رسیده است
+        self.read_bytes = 0  # داده‌های خوانده‌شده از دیسک برای بلوک‌هایی که حین نوشتن کامل هش نشدند
+        self.lock = threading.Lock()
+    
+    def update(self, position, data):
+        """افزودن تکه نوشته‌شده در موقعیت position؛ بلوکی که ابتدای آن در این اجرا هش نشده
+        (ادامه پس از اجرای مجدد برنامه) در پایان از دیسک خوانده می‌شود"""
+        # هر موقعیت ادامه فقط به یک نویسنده تعلق دارد؛ هش بیرون از قفل انجام می‌شود
+        with self.lock:
+            hasher = self.open.pop(position, None)
+        view = memoryview(data)
+        completed = []
+        while view:
+            index, offset = divmod(position, DIGEST_BLOCK_SIZE)
+            size = min(len(view), DIGEST_BLOCK_SIZE - offset)
+            if hasher is None and offset == 0:
+                hasher = hashlib.new(self.algorithm)
+            if hasher is not None:
+                hasher.update(view[:size])
+                if offset + size == DIGEST_BLOCK_SIZE:
+                    completed.append((index, hasher.digest()))
+                    hasher = None
+            view = view[size:]
+            position += size
+        with self.lock:
+            self.blocks.update(completed)
+            if hasher is not None:
+                self.open[position] = hasher
+    
+    def result(self, size, read):
+        """چکیده نهایی فایل size بایتی به قالب algo-tree:hex؛ بلوک‌های هش‌نشده با read(موقعیت، اندازه) خوانده می‌شوند"""
+        root = hashlib.new(self.algorithm)
+        with self.lock:
+            for index in range((size + DIGEST_BLOCK_SIZE - 1) // DIGEST_BLOCK_SIZE):
+                digest = self.blocks.get(index)
+                if digest is None:
+                    start = index * DIGEST_BLOCK_SIZE
+                    length = min(DIGEST_BLOCK_SIZE, size - start)
+                    # بلوک آخر فایل ناقص است و هش آن در انتهای فایل باز مانده است
+                    hasher = self.open.get(size) if start + length == size else None
+                    if hasher is None:
+                        data = read(start, length)
+                        if len(data) != length:
+                            raise OSError(f"فایل کوتاه‌تر از {size} بایت است")
+                        self.read_bytes += length
+                        hasher = hashlib.new(self.algorithm, data)
+                    digest = hasher.digest()
+                root.update(digest)
+        return f"{self.algorithm}{TREE_DIGEST_SUFFIX}:{root.hexdigest()}"
+
+
 class DownloadItem:
     """کلاس نگهداری اطلاعات یک دانلود"""
     
     def __init__(self, url, save_path, filename=None):
         self.url = url
         self.save_path = save_path
-        self.filename = filename or os.path.basename(urllib.parse.unquote(urlparse(url).path))
+        self.auto_filename = not filename
+        self.filename = filename or os.path.basename(urllib.parse.unquote(urlparse(url).path)) or "download"
         self.full_path = os.path.join(save_path, self.filename)
-        self.status = "pending"  # pending, downloading, paused, completed, error, canceled
-        self.progress = 0
+        self.stats = None  # آمار مدیر دانلودی که این دانلود در آن ثبت شده است
+        self._status = "pending"  # pending, downloading, paused, completed, error, canceled
         self.size = 0
         self.downloaded = 0
         self.speed = 0
@@ -113,12 +982,64 @@ class DownloadItem:
         self.error_message = ""
         self.headers = {}
         self.resume_support = False
-        self.id = str(time.time()).replace(".", "")
+        self.etag = None
+        self.last_modified = None
+        self.id = new_download_id()
         self.last_updated = time.time()
         self.temp_files = []
+        self.storage_mode = "parts"
+        self.segments_lock = threading.RLock()
+        # اعلام پایان، خطا یا توقف بخش‌ها به نخ مانیتور
+        self.segments_changed = threading.Condition(self.segments_lock)
+        self.speed_limit = None  # کیلوبایت بر ثانیه؛ None یعنی محدودیت پیش‌فرض هر دانلود
+        self.priority = PRIORITY_NORMAL
+        self.queued_at = None  # زمان ورود به صف برای معیار زمان انتظار
+        self.dispatched_at = None  # زمان شروع اجرا برای معیار تأخیر زمان‌بندی
+        self.run_start_bytes = None  # حجم دریافتی در شروع اجرای فعلی برای معیار حجم دریافتی
+        self.expected_checksum = None  # algo:hex تعیین‌شده توسط کاربر
+        self.checksum = None  # algo:hex محاسبه‌شده حین دانلود
+        self.digest = None  # StreamDigest اجرای فعلی
+        self.mirrors = []  # آدرس‌های دیگر همین فایل برای دانلود چندمنبعی
+        self.mirror_set = None  # MirrorSet اجرای فعلی با آینه‌های تأییدشده
+        self.connections = 0  # اتصال‌های فعال دانلود چندبخشی
+        self.connection_control = None
+        self.limiter = TokenBucket()
         self.stop_event = threading.Event()
         self.ui_element = None
         
+    @property
+    def status(self):
+        return self._status
+    
+    @status.setter
+    def status(self, value):
+        stats = self.stats
+        if stats is None:
+            self._status = value
+        elif value != self._status:
+            stats.set_status(self, value)
+    
+    @property
+    def downloaded(self):
+        """بایت‌های دریافت‌شده؛ در دانلود چندبخشی هنگام خواندن از شمارنده‌های بخش‌ها جمع زده می‌شود"""
+        thread_data = self.thread_data
+        if thread_data:
+            return sum(thread_info['downloaded'] for thread_info in thread_data)
+        return self._downloaded
+    
+    @downloaded.setter
+    def downloaded(self, value):
+        self._downloaded = value
+    
+    @property
+    def progress(self):
+        """درصد پیشرفت محاسبه‌شده از بایت‌های دریافت‌شده"""
+        if self.status == "completed":
+            return 100
+        if self.size <= 0:
+            return 0
+        return min(100, self.downloaded / self.size * 100)
+    
     def elapsed_time(self):
         if not self.start_time:
             return 0
@@ -143,7 +1064,14 @@ class DownloadItem:
             "start_time": self.start_time,
             "end_time": self.end_time,
             "resume_support": self.resume_support,
-            "error_message": self.error_message
+            "error_message": self.error_message,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "speed_limit": self.speed_limit,
+            "priority": self.priority,
+            "expected_checksum": self.expected_checksum,
+            "checksum": self.checksum,
+            "mirrors": self.mirrors
         }
     
     @classmethod
@@ -157,40 +1085,344 @@ class DownloadItem:
         item.end_time = data["end_time"]
         item.resume_support = data["resume_support"]
         item.error_message = data["error_message"]
+        item.etag = data.get("etag")
+        item.last_modified = data.get("last_modified")
+        item.speed_limit = data.get("speed_limit")
+        item.priority = data.get("priority", PRIORITY_NORMAL)
+        item.expected_checksum = data.get("expected_checksum")
+        item.checksum = data.get("checksum")
+        item.mirrors = data.get("mirrors") or []
         return item
 
 
+class HistoryStore:
+    """تاریخچه دانلودها در SQLite با ایندکس آدرس، میزبان، وضعیت و تاریخ؛ رکوردها دسته‌ای ثبت می‌شوند"""
+    
+    COLUMNS = ("id", "url", "host", "filename", "save_path", "status", "size", "start_time", "end_time", "data")
+    
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.flush_timer = None
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("""CREATE TABLE IF NOT EXISTS history (
+                id TEXT PRIMARY KEY, url TEXT, host TEXT, filename TEXT, save_path TEXT,
+                status TEXT, size INTEGER, start_time REAL, end_time REAL, data TEXT)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS history_url ON history (url, end_time)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS history_host ON history (host, end_time)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS history_status ON history (status, end_time)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS history_end_time ON history (end_time)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    
+    def _row(self, data):
+        """تبدیل دیکشنری to_dict یک دانلود به ردیف جدول"""
+        return (data["id"], data["url"], urlparse(data["url"]).hostname or "", data["filename"],
+                data["save_path"], data["status"], data["size"], data["start_time"], data["end_time"],
+                json.dumps(data, ensure_ascii=False))
+    
+    def import_json(self, json_path):
+        """وارد کردن یک‌باره تاریخچه قالب JSON قدیمی"""
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+                return 0
+            history_data = []
+            if os.path.exists(json_path):
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    history_data = json.load(f)
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    [self._row(data) for data in history_data])
+                self.db.execute("INSERT INTO meta VALUES ('json_imported', ?)", (str(time.time()),))
+            return len(history_data)
+    
+    def add(self, item):
+        """افزودن دانلود به صف ثبت؛ ثبت با پر شدن دسته یا پس از HISTORY_FLUSH_DELAY ثانیه انجام می‌شود"""
+        with self.lock:
+            self.pending.append(self._row(item.to_dict()))
+            if len(self.pending) < HISTORY_BATCH_SIZE:
+                if self.flush_timer is None:
+                    self.flush_timer = threading.Timer(HISTORY_FLUSH_DELAY, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+                return
+        self.flush()
+    
+    def flush(self):
+        """ثبت رکوردهای در انتظار در یک تراکنش"""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not self.pending:
+                return
+            rows, self.pending = self.pending, []
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    
+    def _where(self, url=None, host=None, status=None, since=None, until=None, search=None):
+        """شرط و پارامترهای پرس‌وجو بر اساس فیلترها"""
+        clauses, params = [], []
+        for column, value in (("url", url), ("host", host), ("status", status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("end_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("end_time < ?")
+            params.append(until)
+        if search:
+            clauses.append("(filename LIKE ? OR url LIKE ?)")
+            params.extend([f"%{search}%"] * 2)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+    
+    def query(self, limit=50, offset=0, **filters):
+        """یک صفحه از تاریخچه، جدیدترین‌ها اول؛ هر رکورد دیکشنری ستون‌های جدول است"""
+        where, params = self._where(**filters)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT * FROM history{where} ORDER BY end_time DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+    
+    def count(self, **filters):
+        """تعداد رکوردهای منطبق با فیلترها"""
+        where, params = self._where(**filters)
+        with self.lock:
+            return self.db.execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+    
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+
 class DownloadManager:
     """کلاس مدیریت دانلود‌ها"""
     
     def __init__(self, config, update_callback=None):
         self.downloads = {}
         self.active_downloads = {}
+        self.stats = DownloadStats()
+        self.metrics = DownloadMetrics()
         self.config = config
         self.update_callback = update_callback
-        self.download_queue = queue.Queue()
-        self.download_threads = []
-        self.history = []
-        self.load_history()
+        # گیرنده‌های افزودن و حذف دانلودها (publish_added/publish_removed)، مثلاً صندوق پیام رابط کاربری و API کنترل
+        self.list_listeners = []
+        self.download_queue = DownloadScheduler(config.get("priority_aging", 600))
+        self.history = None  # با اولین استفاده یا بارگذاری پس‌زمینه باز می‌شود
+        self.history_lock = threading.Lock()
         self.lock = threading.RLock()
         
-        # راه‌اندازی نخ‌های دانلود کننده
-        for i in range(config.get("max_concurrent_downloads", 3)):
-            t = threading.Thread(target=self._download_worker, daemon=True, name=f"DownloadWorker-{i}")
-            t.start()
-            self.download_threads.append(t)
+        # تعداد اجراهای در حال انجام؛ shutdown تا پایان همه آن‌ها صبر می‌کند
+        self.running_transfers = 0
+        self.transfers_finished = threading.Condition(self.lock)
+        self.closing = False
+        
+        # استخر نشست‌های HTTP به تفکیک میزبان (استفاده مجدد از اتصال‌های keep-alive)
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        
+        # محدودیت‌های پهنای باند؛ تا وقتی محدودیتی تعیین نشده حلقه دانلود هیچ هزینه‌ای نمی‌پردازد
+        self.global_limiter = TokenBucket()
+        self.host_limiters = {}
+        self.limits_active = False
+        self.apply_speed_limits()
+        
+        # بازیابی دانلودهای نیمه‌کاره از اجرای قبلی
+        self._restore_manifests()
     
-    def add_download(self, url, save_path, filename=None, start=True):
-        """افزودن یک دانلود جدید"""
+    def add_download(self, url, save_path, filename=None, start=True, priority=PRIORITY_NORMAL, checksum=None,
+                     mirrors=None):
+        """افزودن یک دانلود جدید؛ checksum (hex یا algo:hex) پس از دریافت کامل بررسی می‌شود
+        و بخش‌ها بین آدرس اصلی و mirrors (آدرس‌های دیگر همین فایل) تقسیم می‌شوند"""
+        expected_checksum = parse_checksum(checksum) if checksum else None
+        mirrors = [mirror for mirror in parse_mirrors(mirrors) if mirror != url]
         with self.lock:
             item = DownloadItem(url, save_path, filename)
+            item.priority = priority
+            item.expected_checksum = expected_checksum
+            item.mirrors = mirrors
+            item.queued_at = time.monotonic()
             self.downloads[item.id] = item
-            if start and len(self.active_downloads) < self.config.get("max_concurrent_downloads", 3):
-                self.start_download(item.id)
-            else:
-                self.download_queue.put(item.id)
+            self.stats.track(item)
+            for listener in self.list_listeners:
+                listener.publish_added(item)
+            self.download_queue.push(item.id, priority)
+            self._dispatch_queue()
             return item.id
     
+    def add_downloads(self, entries, priority=PRIORITY_NORMAL):
+        """افزودن دسته‌ای دانلودها با یک بار گرفتن قفل؛ هر مورد (url، مسیر، نام فایل، اطلاعات بررسی اولیه، چک‌سام، آینه‌ها) است"""
+        items = []
+        for url, save_path, filename, file_info, checksum, mirrors in entries:
+            item = DownloadItem(url, save_path, filename)
+            item.priority = priority
+            item.expected_checksum = parse_checksum(checksum) if checksum else None
+            item.mirrors = [mirror for mirror in parse_mirrors(mirrors) if mirror != url]
+            if file_info:
+                item.size = file_info['size']
+                item.resume_support = file_info['accept_ranges']
+                if item.auto_filename:
+                    item.filename = file_info['filename']
+                    item.full_path = os.path.join(save_path, item.filename)
+            items.append(item)
+        
+        with self.lock:
+            queued_at = time.monotonic()
+            for item in items:
+                item.queued_at = queued_at
+                self.downloads[item.id] = item
+                self.stats.track(item)
+                for listener in self.list_listeners:
+                    listener.publish_added(item)
+                self.download_queue.push(item.id, priority)
+            self._dispatch_queue()
+        return [item.id for item in items]
+    
+    def import_urls(self, entries, save_path, priority=PRIORITY_NORMAL, probe=True, on_batch=None, stop_event=None):
+        """وارد کردن جریانی فهرست آدرس‌ها: حذف آدرس‌ها و مسیرهای تکراری، بررسی همزمان حجم و پشتیبانی از بازه
+        با تعداد محدودی درخواست HEAD و افزودن دسته‌ای به صف؛ on_batch(result, ids) پس از هر دسته فراخوانی می‌شود"""
+        result = {"read": 0, "added": 0, "duplicates": 0, "invalid": 0, "probe_failed": 0}
+        with self.lock:
+            seen_urls = {item.url for item in self.downloads.values()}
+            seen_paths = {item.full_path for item in self.downloads.values()}
+        batch_size = max(1, self.config.get("import_batch_size", 500))
+        workers = max(1, self.config.get("import_probe_workers", 8))
+        batch = []
+        
+        def flush():
+            ids = self.add_downloads(batch, priority)
+            batch.clear()
+            result["added"] += len(ids)
+            if on_batch:
+                on_batch(result, ids)
+        
+        def accept(url, filename, checksum, mirrors, file_info):
+            # مسیر مقصد پس از بررسی اولیه مشخص می‌شود (نام فایل ممکن است از Content-Disposition بیاید)
+            if probe and file_info is None:
+                result["probe_failed"] += 1
+            name = filename or (file_info and file_info['filename']) or \
+                os.path.basename(urllib.parse.unquote(urlparse(url).path)) or "download"
+            full_path = os.path.join(save_path, name)
+            if full_path in seen_paths:
+                result["duplicates"] += 1
+                return
+            seen_paths.add(full_path)
+            batch.append((url, save_path, filename, file_info, checksum, mirrors))
+            if len(batch) >= batch_size:
+                flush()
+        
+        def entries_to_add():
+            for entry in entries:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                result["read"] += 1
+                url = (entry.get("url") or "").strip()
+                scheme, separator, rest = url.partition("://")
+                if not separator or scheme.lower() not in ("http", "https") or rest[:1] in ("", "/", "?", "#"):
+                    result["invalid"] += 1
+                    continue
+                checksum = str(entry.get("checksum") or "").strip() or None
+                try:
+                    checksum = checksum and parse_checksum(checksum)
+                    mirrors = parse_mirrors(entry.get("mirrors"))
+                except ValueError:
+                    result["invalid"] += 1
+                    continue
+                if url in seen_urls:
+                    result["duplicates"] += 1
+                    continue
+                seen_urls.add(url)
+                yield url, (entry.get("filename") or "").strip() or None, checksum, mirrors
+        
+        if not probe:
+            for url, filename, checksum, mirrors in entries_to_add():
+                accept(url, filename, checksum, mirrors, None)
+        else:
+            # پنجره محدود درخواست‌های در جریان تا فایل‌های بزرگ یکجا در حافظه قرار نگیرند
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="UrlProbe") as executor:
+                pending = {}
+                for url, filename, checksum, mirrors in entries_to_add():
+                    pending[executor.submit(self._get_file_info, url)] = (url, filename, checksum, mirrors)
+                    if len(pending) >= workers * 2:
+                        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            accept(*pending.pop(future), future.result())
+                for future in concurrent.futures.as_completed(list(pending)):
+                    accept(*pending.pop(future), future.result())
+        
+        if batch:
+            flush()
+        return result
+    
+    def _dispatch_queue(self):
+        """شروع دانلودهای صف تا پر شدن ظرفیت دانلود همزمان؛ پس از هر تغییر ظرفیت فراخوانی می‌شود"""
+        with self.lock:
+            while not self.closing:
+                head = self.download_queue.peek()
+                if head is None:
+                    break
+                
+                # دانلودهای فوری بدون توجه به ظرفیت شروع می‌شوند
+                download_id, urgent = head
+                if not urgent and len(self.active_downloads) >= self.config.get("max_concurrent_downloads", 3):
+                    break
+                
+                self.download_queue.pop()
+                self.start_download(download_id)
+    
+    def set_priority(self, download_id, priority):
+        """تغییر اولویت یک دانلود؛ جایگاه آن در صف بلافاصله به‌روز می‌شود"""
+        with self.lock:
+            item = self.downloads.get(download_id)
+            if item is None:
+                return False
+            
+            item.priority = priority
+            if self.download_queue.set_priority(download_id, priority):
+                self._dispatch_queue()
+            return True
+    
+    def move_to_top(self, download_id):
+        """انتقال دانلود در انتظار به ابتدای صف"""
+        with self.lock:
+            return self.download_queue.move_to_top(download_id)
+    
+    def is_queued(self, download_id):
+        with self.lock:
+            return download_id in self.download_queue
+    
+    def _on_download_finished(self, item, stop_event):
+        """پایان یک اجرای دانلود (کامل، خطا، توقف یا لغو): آزاد کردن جای آن و شروع دانلود بعدی صف"""
+        completed = False
+        with self.lock:
+            self.running_transfers -= 1
+            self.transfers_finished.notify_all()
+            # پایان اجرای قدیمی یک دانلود ازسرگرفته‌شده، اجرای جدید را از فهرست فعال حذف نمی‌کند
+            if item.stop_event is stop_event:
+                self._close_run_metrics(item)
+                self.metrics.inc("downloads_finished_total", status=item.status)
+                if self.active_downloads.get(item.id) is item:
+                    del self.active_downloads[item.id]
+                if item.status == "completed":
+                    completed = True
+        
+        if completed:
+            # افزودن به تاریخچه؛ ثبت روی دیسک دسته‌ای انجام می‌شود
+            self.load_history().add(item)
+        self._dispatch_queue()
+    
+    def _close_run_metrics(self, item):
+        """افزودن حجم دریافتی اجرای فعلی دانلود به شمارنده کل؛ زیر قفل مدیر فراخوانی می‌شود"""
+        if item.run_start_bytes is not None:
+            self.metrics.inc("bytes_received_total", max(0, item.downloaded - item.run_start_bytes))
+            item.run_start_bytes = None
+    
     def start_download(self, download_id):
         """شروع دانلود"""
         with self.lock:
@@ -201,17 +1433,30 @@ class DownloadManager:
             if item.status in ["downloading", "completed"]:
                 return False
             
+            load_network_modules()
+            
+            # شروع مستقیم (بدون نوبت صف) جایگاه دانلود در صف را حذف می‌کند
+            self.download_queue.remove(download_id)
             item.status = "downloading"
             item.start_time = item.start_time or time.time()
-            item.stop_event.clear()
-            
-            if self.config.get("use_multithreaded_download", True) and item.size > 5 * 1024 * 1024 and item.resume_support:
-                # دانلود چند نخی
-                self._start_multithreaded_download(item)
-            else:
-                # دانلود تک نخی
-                self._start_single_threaded_download(item)
+            item.limiter.set_rate(self._download_speed_limit(item) * 1024)
+            if item.limiter.rate:
+                self.limits_active = True
+            # رویداد جدید برای هر اجرا تا نخ‌های باقی‌مانده از اجرای قبلی متوقف بمانند
+            item.stop_event = threading.Event()
             
+            now = time.monotonic()
+            if item.queued_at is not None:
+                self.metrics.observe("queue_wait_seconds", now - item.queued_at)
+                item.queued_at = None
+            item.dispatched_at = now
+            self._close_run_metrics(item)
+            item.run_start_bytes = item.downloaded
+
+            # بررسی اولیه و انتخاب روش دانلود در نخ جداگانه انجام می‌شود
+            self.running_transfers += 1
+            self._start_transfer(item)
+
             self.active_downloads[download_id] = item
             return True
     
@@ -227,10 +1472,13 @@ class DownloadManager:
             
             item.status = "paused"
             item.stop_event.set()
+            self._notify_segments(item)
             
             if download_id in self.active_downloads:
                 del self.active_downloads[download_id]
-                
+            
+            # جای آزادشده بلافاصله به دانلود بعدی صف می‌رسد
+            self._dispatch_queue()
             return True
     
     def resume_download(self, download_id):
@@ -243,26 +1491,29 @@ class DownloadManager:
             if item.status != "paused":
                 return False
             
-            # اگر نخ‌های فعال کمتر از حداکثر مجاز است، بلافاصله شروع کن
-            if len(self.active_downloads) < self.config.get("max_concurrent_downloads", 3):
-                return self.start_download(download_id)
-            else:
-                # در غیر این صورت به صف اضافه کن
-                self.download_queue.put(download_id)
-                return True
+            # اگر ظرفیت آزاد باشد بلافاصله شروع می‌شود، در غیر این صورت در صف می‌ماند
+            item.queued_at = time.monotonic()
+            self.download_queue.push(download_id, item.priority)
+            self._dispatch_queue()
+            return True
     
     def cancel_download(self, download_id):
-        """لغو دانلود"""
+        """لغو دانلود در جریان، متوقف یا در انتظار؛ دانلود کامل‌شده یا پایان‌یافته لغو نمی‌شود"""
         with self.lock:
             if download_id not in self.downloads:
                 return False
             
             item = self.downloads[download_id]
+            if item.status not in ("downloading", "paused", "pending"):
+                return False
             item.status = "canceled"
             item.stop_event.set()
+            self._notify_segments(item)
+            self.download_queue.remove(download_id)
             
             if download_id in self.active_downloads:
                 del self.active_downloads[download_id]
+                self._dispatch_queue()
             
             # پاکسازی فایل‌های موقت
             for temp_file in item.temp_files:
@@ -272,6 +1523,16 @@ class DownloadManager:
                     except:
                         pass
             
+            # فایل رزروشده مقصد در حالت نوشتن مستقیم ناقص است؛ فایلی که همه داده‌هایش رسیده حذف نمی‌شود
+            incomplete = not item.size or item.downloaded < item.size
+            if item.storage_mode == "direct" and item.thread_data and incomplete and os.path.exists(item.full_path):
+                try:
+                    os.remove(item.full_path)
+                except:
+                    pass
+            
+            self._remove_manifest(item)
+            
             return True
     
     def remove_download(self, download_id):
@@ -280,10 +1541,12 @@ class DownloadManager:
             if download_id not in self.downloads:
                 return False
             
-            if self.downloads[download_id].status == "downloading":
+            if self.downloads[download_id].status in ["downloading", "paused", "pending"]:
                 self.cancel_download(download_id)
             
-            del self.downloads[download_id]
+            self.stats.untrack(self.downloads.pop(download_id))
+            for listener in self.list_listeners:
+                listener.publish_removed(download_id)
             return True
     
     def get_download(self, download_id):
@@ -296,113 +1559,406 @@ class DownloadManager:
         with self.lock:
             return list(self.downloads.values())
     
+    def get_stats(self):
+        """آمار دانلودها بدون پیمایش لیست: تعداد هر وضعیت، تعداد کل و مجموع سرعت"""
+        return self.stats.snapshot()
+    
+    def get_metrics(self):
+        """معیارهای موتور دانلود: counters، histograms و gauges با کلیدهای (نام، برچسب‌ها)"""
+        with self.lock:
+            active = list(self.active_downloads.values())
+            queue_length = len(self.download_queue)
+        snapshot = self.metrics.snapshot()
+        stats = self.get_stats()
+        
+        # حجم دریافتی اجراهای در جریان از شمارنده‌های خود دانلودها خوانده می‌شود
+        live_bytes = 0
+        for item in active:
+            run_start_bytes = item.run_start_bytes
+            if run_start_bytes is not None:
+                live_bytes += max(0, item.downloaded - run_start_bytes)
+        key = ("bytes_received_total", ())
+        snapshot["counters"][key] = snapshot["counters"].get(key, 0) + live_bytes
+        
+        gauges = {("downloads", (("status", status),)): count for status, count in stats["counts"].items()}
+        gauges[("queue_length", ())] = queue_length
+        gauges[("active_connections", ())] = sum(item.connections if item.thread_data else 1 for item in active)
+        idle_connections = self._idle_connections()
+        if idle_connections is not None:
+            gauges[("idle_connections", ())] = idle_connections
+        gauges[("download_speed_bytes", ())] = stats["speed"]
+        snapshot["gauges"] = gauges
+        return snapshot
+    
+    def _idle_connections(self):
+        """اتصال‌های keep-alive آزاد در استخر اتصال‌های خود موتور؛ None یعنی این شمارش در دسترس نیست
+        (استخرهای urllib3 موتور نخ‌ها شمارش عمومی ندارند و معیار گزارش نمی‌شود)"""
+        return None
+    
+    def _record_response(self, response, *args, **kwargs):
+        """ثبت کد وضعیت هر پاسخ HTTP و تلاش‌های مجدد urllib3 پیش از آن (hook نشست requests)"""
+        self.metrics.inc("http_responses_total", code=str(response.status_code))
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            self.metrics.inc("retries_total", len(retries.history), reason="connection")
+    
+    def get_session(self, url):
+        """دریافت نشست HTTP مشترک برای میزبان یک آدرس"""
+        load_network_modules()
+        parsed = urlparse(url)
+        host_key = f"{parsed.scheme}://{parsed.netloc}".lower()
+        
+        with self.sessions_lock:
+            session = self.sessions.get(host_key)
+            if session is None:
+                # اندازه استخر: تمام اتصال‌هایی که ممکن است همزمان به یک میزبان باز شوند
+                pool_size = max(1, self.config.get("max_concurrent_downloads", 3) *
+                                   self.config.get("max_threads_per_download", 5))
+                # تلاش مجدد خطاهای اتصال از همان استخر انجام می‌شود؛ پاسخ‌های 429/503 به
+                # کنترل‌گر اتصال می‌رسند تا تعداد اتصال‌ها کم شود
+                retries = Retry(total=3, read=0, backoff_factor=0.5, respect_retry_after_header=False)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                      max_retries=retries, pool_block=False)
+                
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                # بایت‌های خام فایل؛ طول و بازه‌ها باید با اندازه روی دیسک یکی باشند
+                session.headers['Accept-Encoding'] = 'identity'
+                session.hooks['response'].append(self._record_response)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host_key] = session
+            
+            return session
+    
+    def shutdown(self, timeout=10):
+        """توقف مدیر دانلود: دانلودهای فعال متوقف و مشخصات آن‌ها ذخیره می‌شود تا در اجرای بعدی ادامه یابند"""
+        with self.lock:
+            self.closing = True
+            for download_id in list(self.active_downloads):
+                self.pause_download(download_id)
+            if not self.transfers_finished.wait_for(lambda: self.running_transfers == 0, timeout):
+                print("برخی دانلودها در زمان تعیین شده متوقف نشدند")
+        
+        self.save_history()
+        self.close_sessions()
+    
+    def close_sessions(self):
+        """بستن تمام نشست‌ها و اتصال‌های باز"""
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                try:
+                    session.close()
+                except:
+                    pass
+            self.sessions.clear()
+    
+    def apply_speed_limits(self):
+        """اعمال محدودیت‌های سرعت تنظیمات؛ در حین دانلود هم قابل فراخوانی است"""
+        with self.lock:
+            self.global_limiter.set_rate(self.config.get("global_speed_limit", 0) * 1024)
+            
+            host_limits = {host.lower(): limit for host, limit in self.config.get("host_speed_limits", {}).items() if limit > 0}
+            for host in list(self.host_limiters):
+                if host not in host_limits:
+                    del self.host_limiters[host]
+            for host, limit in host_limits.items():
+                self.host_limiters.setdefault(host, TokenBucket()).set_rate(limit * 1024)
+            
+            for item in self.downloads.values():
+                item.limiter.set_rate(self._download_speed_limit(item) * 1024)
+            
+            self.limits_active = bool(self.global_limiter.rate or self.host_limiters or
+                                      any(item.limiter.rate for item in self.downloads.values()))
+    
+    def set_speed_limit(self, download_id, limit):
+        """تعیین محدودیت سرعت یک دانلود (کیلوبایت بر ثانیه)؛ None یعنی محدودیت پیش‌فرض"""
+        with self.lock:
+            item = self.downloads.get(download_id)
+            if item is None:
+                return False
+            item.speed_limit = limit
+            self.apply_speed_limits()
+            return True
+    
+    def _download_speed_limit(self, item):
+        if item.speed_limit is not None:
+            return item.speed_limit
+        return self.config.get("download_speed_limit", 0)
+    
+    def _throttle_delay(self, item, size, url=None):
+        """برداشت size بایت از سطل‌های مربوط و برگرداندن زمان انتظار لازم؛ url آدرسی است که داده از آن دریافت می‌شود
+        (آینه بخش) و سقف سرعت میزبان همان آدرس اعمال می‌شود"""
+        delay = max(self.global_limiter.reserve(size), item.limiter.reserve(size))
+        host_limiter = self.host_limiters.get((urlparse(url or item.url).hostname or "").lower())
+        if host_limiter is not None:
+            delay = max(delay, host_limiter.reserve(size))
+        return delay
+    
+    def _read_size(self, chunk_size, even=False):
+        """اندازه خواندن از پاسخ؛ با محدودیت سرعت یا چند منبع (even) تکه‌ها کوچک‌تر می‌شوند تا جریان یکنواخت بماند
+        و سرعت منبع‌ها در هر نمونه درست اندازه‌گیری شود"""
+        if self.limits_active or even:
+            return min(chunk_size, 64 * 1024)
+        return chunk_size
+    
     def save_history(self):
-        """ذخیره تاریخچه دانلود‌ها"""
-        history_data = [item.to_dict() for item in self.history]
+        """ثبت رکوردهای در انتظار تاریخچه دانلود‌ها"""
+        if self.history is None:
+            return
         try:
-            with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, ensure_ascii=False, indent=2)
-        except:
+            self.history.flush()
+        except sqlite3.Error:
             print("خطا در ذخیره تاریخچه دانلود‌ها")
     
     def load_history(self):
-        """بارگذاری تاریخچه دانلود‌ها"""
-        if not os.path.exists(HISTORY_FILE):
-            return
-        
+        """باز کردن پایگاه داده تاریخچه در اولین فراخوانی؛ تاریخچه قالب JSON قدیمی در اولین اجرا وارد می‌شود"""
+        with self.history_lock:
+            if self.history is None:
+                history = HistoryStore(HISTORY_DB)
+                try:
+                    history.import_json(HISTORY_FILE)
+                except (OSError, ValueError, KeyError, sqlite3.Error):
+                    print("خطا در بارگذاری تاریخچه دانلود‌ها")
+                self.history = history
+            return self.history
+    
+    def query_history(self, limit=50, offset=0, **filters):
+        """یک صفحه از تاریخچه با فیلترهای url، host، status، since، until و search"""
+        return self.load_history().query(limit, offset, **filters)
+    
+    def count_history(self, **filters):
+        """تعداد رکوردهای تاریخچه منطبق با فیلترها"""
+        return self.load_history().count(**filters)
+    
+    def _manifest_path(self, item):
+        """مسیر فایل مشخصات بخش‌های یک دانلود"""
+        return os.path.join(TEMP_DIR, f"{item.id}.manifest.json")
+    
+    def _save_manifest(self, item):
+        """ذخیره وضعیت بخش‌های دانلود برای ادامه پس از توقف یا اجرای مجدد برنامه"""
+        with item.segments_lock:
+            data = item.to_dict()
+            data["storage_mode"] = item.storage_mode
+            data["segments"] = [{
+                'start': thread_info['start'],
+                'end': thread_info['end'],
+                'downloaded': thread_info['downloaded'],
+                'completed': bool(thread_info.get('completed')),
+                'temp_file': thread_info['temp_file']
+            } for thread_info in item.thread_data]
+            
+            path = self._manifest_path(item)
+            try:
+                # نوشتن در فایل موقت و جایگزینی اتمی تا فایل نیمه‌نوشته باقی نماند
+                with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"خطا در ذخیره مشخصات دانلود {item.filename}: {str(e)}")
+    
+    def _remove_manifest(self, item):
+        """حذف فایل مشخصات بخش‌های دانلود"""
         try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history_data = json.load(f)
-                self.history = [DownloadItem.from_dict(item) for item in history_data]
-        except:
-            print("خطا در بارگذاری تاریخچه دانلود‌ها")
+            os.remove(self._manifest_path(item))
+        except OSError:
+            pass
     
-    def _download_worker(self):
-        """نخ کارگر برای دانلود فایل‌ها"""
-        while True:
+    def _restore_manifests(self):
+        """بازیابی دانلودهای نیمه‌کاره از فایل‌های مشخصات"""
+        try:
+            names = os.listdir(TEMP_DIR)
+        except OSError:
+            return
+        
+        for name in names:
+            if not name.endswith(".manifest.json"):
+                continue
             try:
-                download_id = self.download_queue.get()
-                if download_id is None:
-                    break
+                with open(os.path.join(TEMP_DIR, name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
                 
-                with self.lock:
-                    if download_id not in self.downloads:
-                        self.download_queue.task_done()
-                        continue
-                    
-                    item = self.downloads[download_id]
-                
-                self.start_download(download_id)
-                
-                # منتظر اتمام دانلود بمان
-                while item.status == "downloading" and not item.stop_event.is_set():
-                    time.sleep(0.5)
-                
-                # فرایند تکمیل شده است
-                if item.status == "completed":
-                    with self.lock:
-                        if download_id in self.active_downloads:
-                            del self.active_downloads[download_id]
-                        # افزودن به تاریخچه
-                        self.history.append(item)
-                        self.save_history()
-                
-                self.download_queue.task_done()
+                item = DownloadItem.from_dict(data)
+                item.status = "paused"
+                item.storage_mode = data.get("storage_mode", "parts")
+                for segment in data.get("segments", []):
+                    thread_info = {
+                        'index': len(item.thread_data),
+                        'start': segment['start'],
+                        'end': segment['end'],
+                        'downloaded': segment['downloaded'],
+                        'temp_file': segment['temp_file']
+                    }
+                    if segment.get('completed'):
+                        thread_info['completed'] = True
+                    if thread_info['temp_file']:
+                        item.temp_files.append(thread_info['temp_file'])
+                    item.thread_data.append(thread_info)
                 
-                # بررسی وجود دانلود بعدی در صف
-                if not self.download_queue.empty():
-                    continue
-                
-                # اگر صف خالی است، آیا دانلود متوقف شده‌ای وجود دارد؟
-                with self.lock:
-                    for dl_id, dl_item in self.downloads.items():
-                        if dl_item.status == "paused":
-                            self.download_queue.put(dl_id)
-                            break
-            
+                self._verify_segments(item)
+                self.downloads[item.id] = item
+                self.stats.track(item)
             except Exception as e:
-                print(f"خطا در نخ دانلود: {str(e)}")
+                print(f"خطا در بازیابی دانلود {name}: {str(e)}")
+    
+    def _verify_segments(self, item):
+        """تطبیق پیشرفت ثبت‌شده بخش‌ها با طول واقعی فایل‌ها روی دیسک"""
+        if not item.thread_data:
+            # دانلود تک‌نخی: طول فایل مقصد مرجع است
+            on_disk = os.path.getsize(item.full_path) if os.path.exists(item.full_path) else 0
+            item.downloaded = min(item.downloaded, on_disk)
+            return
+        
+        target_ok = os.path.exists(item.full_path) and os.path.getsize(item.full_path) == item.size
+        for thread_info in item.thread_data:
+            # نخ اجرای قبلی هنوز روی این بخش می‌نویسد و شمارنده آن را خودش به‌روز نگه می‌دارد
+            if thread_info.get('writer') is not None:
+                continue
+            length = thread_info['end'] - thread_info['start'] + 1
+            if item.storage_mode == "direct":
+                on_disk = length if target_ok else 0
+            elif os.path.exists(thread_info['temp_file']):
+                on_disk = os.path.getsize(thread_info['temp_file'])
+            else:
+                on_disk = 0
+            
+            thread_info['downloaded'] = min(thread_info['downloaded'], on_disk, length)
+            if thread_info['downloaded'] < length:
+                thread_info.pop('completed', None)
+            thread_info.pop('error', None)
+    
+    def _parse_file_info(self, url, response, requested_offset=0):
+        """استخراج اطلاعات فایل از هدرهای پاسخ سرور"""
+        headers = response.headers
+        offset = 0
+        size = 0
+        
+        if response.status_code == 206:
+            # Content-Range: bytes start-end/total
+            range_match = re.match(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', headers.get('Content-Range', ''))
+            if range_match:
+                offset = int(range_match.group(1))
+                if range_match.group(3) != '*':
+                    size = int(range_match.group(3))
+            accept_ranges = True
+        else:
+            size = int(headers.get('Content-Length', 0) or 0)
+            accept_ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+        
+        filename = None
+        
+        # تلاش برای استخراج نام فایل از هدر
+        cd = headers.get('Content-Disposition')
+        if cd:
+            filename_match = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", cd, re.IGNORECASE)
+            if filename_match:
+                filename = urllib.parse.unquote(filename_match.group(1).strip().strip('"'))
+            else:
+                filename_match = re.search(r'filename="?([^";]+)"?', cd)
+                if filename_match:
+                    filename = filename_match.group(1)
+        
+        # اگر نام فایل در هدر نبود، از URL استخراج کن
+        if not filename:
+            filename = os.path.basename(urllib.parse.unquote(urlparse(url).path))
+            if not filename:
+                filename = "download"
+        
+        return {
+            'size': size,
+            'accept_ranges': accept_ranges,
+            'filename': os.path.basename(filename),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'offset': offset,
+            'headers': dict(headers)
+        }
     
     def _get_file_info(self, url):
-        """دریافت اطلاعات فایل قبل از دانلود"""
+        """دریافت اطلاعات فایل با درخواست HEAD"""
         try:
-            headers = {'User-Agent': 'ShetabDaryaft/1.0'}
-            response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+            response = self.get_session(url).head(url, allow_redirects=True, timeout=10)
             
             if response.status_code == 200:
-                size = int(response.headers.get('Content-Length', 0))
-                accept_ranges = response.headers.get('Accept-Ranges', '') == 'bytes'
-                filename = None
-                
-                # تلاش برای استخراج نام فایل از هدر
-                cd = response.headers.get('Content-Disposition')
-                if cd:
-                    filename_match = re.search(r'filename="?([^"]+)"?', cd)
-                    if filename_match:
-                        filename = filename_match.group(1)
-                
-                # اگر نام فایل در هدر نبود، از URL استخراج کن
-                if not filename:
-                    filename = os.path.basename(urllib.parse.unquote(urlparse(url).path))
-                    if not filename:
-                        filename = "download"
-                
-                return {
-                    'size': size,
-                    'accept_ranges': accept_ranges,
-                    'filename': filename,
-                    'headers': dict(response.headers)
-                }
+                return self._parse_file_info(url, response)
             
             return None
         except Exception as e:
             print(f"خطا در دریافت اطلاعات فایل: {str(e)}")
             return None
     
-    def _start_single_threaded_download(self, item):
-        """شروع دانلود تک‌نخی"""
+    def _probe(self, item, offset=0):
+        """بررسی فایل با یک درخواست GET بازه‌ای؛ پاسخ باز به‌عنوان اولین بخش دانلود استفاده می‌شود"""
+        response = None
+        try:
+            headers = {'Range': f'bytes={offset}-'}
+            # در ادامه دانلود، اگر فایل روی سرور تغییر کرده باشد کل فایل برگردانده می‌شود
+            if offset > 0 and item.etag and not item.etag.startswith('W/'):
+                headers['If-Range'] = item.etag
+            elif offset > 0 and item.last_modified:
+                headers['If-Range'] = item.last_modified
+            
+            session = self.get_session(item.url)
+            response = session.get(item.url, headers=headers, stream=True, timeout=30, allow_redirects=True)
+            
+            if response.status_code in (200, 206):
+                file_info = self._parse_file_info(item.url, response, offset)
+                file_info['response'] = response
+                return file_info
+            
+            response.close()
+        except Exception as e:
+            if response is not None:
+                response.close()
+            print(f"خطا در بررسی اولیه فایل: {str(e)}")
+        
+        # بازگشت به HEAD تنها در صورتی که GET بازه‌ای پاسخ قابل استفاده نداشت
+        file_info = self._get_file_info(item.url)
+        if file_info:
+            file_info['response'] = None
+        return file_info
+    
+    def _probe_mirrors(self, item):
+        """بررسی همزمان آینه‌های دانلود با HEAD و ساخت مجموعه منابع"""
+        results = []
+        if item.mirrors:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(item.mirrors),
+                                                       thread_name_prefix="MirrorProbe") as executor:
+                results = list(zip(item.mirrors, executor.map(self._get_file_info, item.mirrors)))
+        self._use_mirrors(item, results)
+    
+    def _use_mirrors(self, item, results):
+        """ساخت MirrorSet از آدرس اصلی و آینه‌هایی که همان فایل را گزارش می‌کنند؛ results فهرست (آدرس، اطلاعات فایل) است"""
+        urls = [item.url]
+        for url, file_info in results:
+            problem = self._check_mirror(item, file_info)
+            if problem:
+                print(f"آینه {url} برای {item.filename} استفاده نمی‌شود: {problem}")
+            else:
+                urls.append(url)
+        item.mirror_set = MirrorSet(urls) if len(urls) > 1 else None
+    
+    def _check_mirror(self, item, file_info):
+        """بررسی یکسان بودن فایل آینه با فایل اصلی (حجم، پشتیبانی از بازه و ETag/Last-Modified در صورت وجود)؛
+        دلیل رد آینه یا None برمی‌گرداند"""
+        if not file_info:
+            return "پاسخی دریافت نشد"
+        if file_info['size'] != item.size:
+            return f"حجم متفاوت ({file_info['size']} به جای {item.size})"
+        if not file_info['accept_ranges']:
+            return "از دانلود بازه‌ای پشتیبانی نمی‌کند"
+        # ETag ضعیف بین سرورها قابل مقایسه نیست
+        etags = (item.etag, file_info['etag'])
+        if all(etags) and not any(etag.startswith('W/') for etag in etags) and etags[0] != etags[1]:
+            return "ETag متفاوت"
+        if item.last_modified and file_info['last_modified'] and item.last_modified != file_info['last_modified']:
+            return "Last-Modified متفاوت"
+        return None
+    
+    def _start_transfer(self, item):
+        """شروع نخ بررسی اولیه و انتقال دانلود"""
         thread = threading.Thread(
-            target=self._download_single_threaded,
+            target=self._run_download,
             args=(item,),
             daemon=True,
             name=f"Download-{item.id}"
@@ -410,45 +1966,274 @@ class DownloadManager:
         thread.start()
         item.threads.append(thread)
     
-    def _start_multithreaded_download(self, item):
-        """شروع دانلود چند‌نخی"""
-        max_threads = self.config.get("max_threads_per_download", 5)
-        chunk_size = item.size // max_threads
+    def _run_download(self, item):
+        """بررسی اولیه فایل و انتخاب روش دانلود (تک‌نخی یا چندنخی)"""
+        stop_event = item.stop_event
+        self.metrics.observe("scheduler_latency_seconds", time.monotonic() - item.dispatched_at)
+        monitored = False
+        try:
+            # پیشرفت ثبت‌شده با وضعیت فایل‌ها روی دیسک تطبیق داده می‌شود
+            self._verify_segments(item)
+            resume_offset = self._resume_offset(item)
+            
+            file_info = self._probe(item, resume_offset)
+            if file_info and resume_offset > 0 and not self._is_same_file(item, file_info, resume_offset):
+                # فایل روی سرور تغییر کرده یا ادامه پشتیبانی نمی‌شود؛ شروع دوباره از ابتدا
+                print(f"فایل {item.filename} روی سرور تغییر کرده است؛ دانلود از ابتدا شروع می‌شود")
+                self._reset_progress(item)
+                if file_info['offset'] != 0:
+                    if file_info['response'] is not None:
+                        file_info['response'].close()
+                    file_info = self._probe(item, 0)
+            
+            mode = self._apply_file_info(item, file_info, stop_event)
+            if mode == "multi":
+                # دانلود چند نخی؛ پایان آن را نخ مانیتور اعلام می‌کند
+                monitored = self._start_multithreaded_download(item, file_info['response'])
+            elif mode == "single":
+                # دانلود تک نخی در همین نخ
+                self._download_single_threaded(item, file_info['response'], file_info['offset'])
+        finally:
+            if not monitored:
+                self._on_download_finished(item, stop_event)
+    
+    def _apply_file_info(self, item, file_info, stop_event):
+        """ثبت نتیجه بررسی اولیه و انتخاب روش دانلود: multi، single یا None در صورت خطا یا توقف"""
+        if not file_info:
+            item.status = "error"
+            item.error_message = "خطا در دسترسی به فایل"
+            if self.update_callback:
+                self.update_callback(item)
+            return None
         
-        # حداقل اندازه هر بخش: 1 مگابایت
-        if chunk_size < 1024 * 1024:
-            max_threads = max(1, item.size // (1024 * 1024))
-            chunk_size = item.size // max_threads
+        response = file_info['response']
+        if stop_event.is_set():
+            if response is not None:
+                response.close()
+            return None
         
-        # ایجاد اطلاعات هر نخ
+        item.size = file_info['size']
+        item.resume_support = file_info['accept_ranges']
+        item.etag = file_info['etag']
+        item.last_modified = file_info['last_modified']
+        item.headers = file_info['headers']
+        
+        # نام فایل پیشنهادی سرور فقط برای دانلودهای تازه و بدون نام دستی اعمال می‌شود
+        if item.auto_filename and item.downloaded == 0 and file_info['filename'] != item.filename:
+            item.filename = file_info['filename']
+            item.full_path = os.path.join(item.save_path, item.filename)
+        
+        use_multithreaded = bool(item.thread_data) or (
+            self.config.get("use_multithreaded_download", True)
+            and item.size > 5 * 1024 * 1024
+            and item.resume_support
+            and item.downloaded == 0)
+        
+        return "multi" if use_multithreaded else "single"
+    
+    def _resume_offset(self, item):
+        """موقعیتی که دانلود از آن ادامه می‌یابد (ابتدای اولین بخش ناتمام)"""
+        if item.thread_data:
+            pending = [thread_info['start'] + thread_info['downloaded']
+                       for thread_info in item.thread_data if not thread_info.get('completed')]
+            return min(pending) if pending else 0
+        return item.downloaded
+    
+    def _is_same_file(self, item, file_info, resume_offset):
+        """بررسی اینکه پاسخ سرور ادامه همان فایل قبلی است"""
+        if file_info['offset'] != resume_offset or file_info['size'] != item.size:
+            return False
+        if item.etag and file_info['etag'] and item.etag != file_info['etag']:
+            return False
+        if item.last_modified and file_info['last_modified'] and item.last_modified != file_info['last_modified']:
+            return False
+        return True
+    
+    def _reset_progress(self, item):
+        """کنار گذاشتن پیشرفت قبلی و آماده‌سازی برای دانلود از ابتدا"""
+        for temp_file in item.temp_files:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
         item.thread_data = []
-        for i in range(max_threads):
-            start = i * chunk_size
-            end = start + chunk_size - 1 if i < max_threads - 1 else item.size - 1
-            
-            # ایجاد فایل موقت برای این بخش
-            temp_file = os.path.join(TEMP_DIR, f"{item.id}_part{i}")
-            item.temp_files.append(temp_file)
-            
-            thread_info = {
-                'index': i,
-                'start': start,
-                'end': end,
-                'downloaded': 0,
-                'temp_file': temp_file
-            }
-            
-            item.thread_data.append(thread_info)
+        item.temp_files = []
+        item.downloaded = 0
+    
+    def _written_prefix(self, item):
+        """طول پیشوند پیوسته‌ای از فایل که داده‌های آن روی دیسک نوشته شده است"""
+        if not item.thread_data:
+            return item.downloaded
+        position = 0
+        with item.segments_lock:
+            for thread_info in sorted(item.thread_data, key=lambda x: x['start']):
+                if thread_info['start'] != position:
+                    break
+                position += thread_info['downloaded']
+                if position <= thread_info['end']:
+                    break
+        return position
+    
+    def _start_digest(self, item):
+        """آماده‌سازی چکیده حین دانلود؛ اگر داده‌های هش‌شده دیگر روی دیسک معتبر نیستند چکیده از ابتدا ساخته می‌شود
+        
+        دانلود تک‌جریانی چکیده پیوسته کل فایل (algo:hex) و دانلود چندبخشی چکیده درختی (algo-tree:hex) می‌گیرد که
+        هر بخش بلوک‌های خود را حین نوشتن هش می‌کند. چک‌سام مورد انتظار نوع چکیده را تعیین می‌کند؛ md5/sha1/sha256 کل
+        فایل از بلوک‌ها ساختنی نیست و در دانلود چندبخشی با چکیده پیوسته و خواندن دوباره بخش‌های جلوتر محاسبه می‌شود."""
+        kind = (item.expected_checksum or "").partition(":")[0]
+        if kind:
+            tree = kind.endswith(TREE_DIGEST_SUFFIX)
+            algorithm = kind[:len(kind) - len(TREE_DIGEST_SUFFIX)] if tree else kind
+        else:
+            tree = bool(item.thread_data)
+            algorithm = self.config.get("checksum_algorithm", "sha256")
+        digest = item.digest
+        if not algorithm:
+            item.digest = None
+        elif tree:
+            if not isinstance(digest, TreeDigest) or digest.algorithm != algorithm or item.downloaded == 0:
+                try:
+                    item.digest = TreeDigest(algorithm)
+                except ValueError:
+                    print(f"الگوریتم چکیده {algorithm} پشتیبانی نمی‌شود")
+                    item.digest = None
+        elif (not isinstance(digest, StreamDigest) or digest.algorithm != algorithm
+              or digest.offset > self._written_prefix(item)):
+            try:
+                item.digest = StreamDigest(algorithm)
+            except ValueError:
+                print(f"الگوریتم چکیده {algorithm} پشتیبانی نمی‌شود")
+                item.digest = None
+    
+    def _advance_digest(self, item, budget=None):
+        """افزودن داده‌های نوشته‌شده پس از پیشوند هش‌شده به چکیده پیوسته، به ترتیب موقعیت در فایل
+        
+        فقط در دانلود چندبخشی با چک‌سام md5/sha1/sha256 مورد انتظار لازم است: داده‌های بخش‌های جلوتر وقتی پیشوند به
+        آن‌ها برسد دوباره از دیسک خوانده می‌شوند و حجم آن در معیار digest_read_bytes_total ثبت می‌شود. چکیده درختی
+        نیازی به این کار ندارد."""
+        digest = item.digest
+        if not isinstance(digest, StreamDigest):
+            return
+        limit_total = None if budget is None else digest.offset + budget
+        
+        while limit_total is None or digest.offset < limit_total:
+            offset = digest.offset
+            if not item.thread_data:
+                path, base, limit = item.full_path, 0, item.downloaded
+            else:
+                with item.segments_lock:
+                    segment = next((thread_info for thread_info in item.thread_data
+                                    if thread_info['start'] <= offset <= thread_info['end']), None)
+                if segment is None:
+                    return
+                limit = segment['start'] + segment['downloaded']
+                if item.storage_mode == "direct":
+                    path, base = item.full_path, 0
+                else:
+                    path, base = segment['temp_file'], segment['start']
+            if limit_total is not None:
+                limit = min(limit, limit_total)
+            if limit <= offset:
+                return
             
-            # راه‌اندازی نخ برای این بخش
-            thread = threading.Thread(
-                target=self._download_part,
-                args=(item, thread_info),
-                daemon=True,
-                name=f"DownloadPart-{item.id}-{i}"
-            )
-            thread.start()
-            item.threads.append(thread)
+            try:
+                with open(path, 'rb') as f:
+                    def read(position, size):
+                        f.seek(position - base)
+                        return f.read(size)
+                    digest.catch_up(read, limit)
+            except OSError as e:
+                print(f"خطا در محاسبه چکیده {item.filename}: {str(e)}")
+                return
+            finally:
+                if digest.offset > offset:
+                    self.metrics.inc("digest_read_bytes_total", digest.offset - offset)
+            if digest.offset == offset:
+                return
+    
+    def _write_chunk(self, item, fd, data, offset, position):
+        """نوشتن تکه در موقعیت offset فایل و افزودن آن به چکیده اگر ادامه پیشوند هش‌شده باشد
+        (position موقعیت تکه در فایل نهایی است)"""
+        write_at(fd, data, offset)
+        digest = item.digest
+        if digest is not None:
+            digest.update(position, data)
+    
+    def _finish_digest(self, item):
+        """ثبت چکیده نهایی و مقایسه با چک‌سام مورد انتظار؛ در صورت عدم تطابق دانلود خطا می‌شود و False برمی‌گرداند"""
+        # داده‌های باقی‌مانده پس از پیشوند پیش از کنار گذاشتن چکیده افزوده می‌شوند
+        self._advance_digest(item)
+        digest = item.digest
+        item.digest = None
+        item.checksum = None
+        if isinstance(digest, TreeDigest):
+            # فقط بلوک‌هایی که حین نوشتن کامل هش نشده‌اند از فایل نهایی خوانده می‌شوند
+            read_bytes = digest.read_bytes
+            try:
+                with open(item.full_path, 'rb') as f:
+                    def read(position, size):
+                        f.seek(position)
+                        return f.read(size)
+                    item.checksum = digest.result(item.downloaded, read)
+            except OSError as e:
+                print(f"خطا در محاسبه چکیده {item.filename}: {str(e)}")
+            finally:
+                if digest.read_bytes > read_bytes:
+                    self.metrics.inc("digest_read_bytes_total", digest.read_bytes - read_bytes)
+        elif digest is not None:
+            if digest.offset == item.downloaded:
+                item.checksum = digest.result()
+        
+        if not item.expected_checksum or item.checksum == item.expected_checksum:
+            return True
+        item.status = "error"
+        if item.checksum is None:
+            item.error_message = "محاسبه چک‌سام فایل ممکن نشد"
+        else:
+            item.error_message = f"چک‌سام فایل با مقدار مورد انتظار مطابقت ندارد ({item.checksum})"
+        self._remove_manifest(item)
+        print(f"خطا در دانلود {item.filename}: {item.error_message}")
+        return False
+    
+    def _start_multithreaded_download(self, item, first_response=None):
+        """شروع یا ادامه دانلود چند‌نخی؛ در صورت راه‌اندازی نخ مانیتور True برمی‌گرداند"""
+        max_threads = self.config.get("max_threads_per_download", 5)
+        self._probe_mirrors(item)
+        
+        if not item.thread_data:
+            item.storage_mode = self.config.get("storage_mode", "direct")
+        
+        # رزرو کامل فایل مقصد؛ کمبود فضا همین‌جا آشکار می‌شود نه در پایان دانلود
+        if item.storage_mode == "direct" and (not os.path.exists(item.full_path)
+                                              or os.path.getsize(item.full_path) != item.size):
+            if not self._preallocate(item):
+                if first_response is not None:
+                    first_response.close()
+                print(f"خطا در دانلود {item.filename}: {item.error_message}")
+                if self.update_callback:
+                    self.update_callback(item)
+                return False
+        
+        if not item.thread_data:
+            self._create_segments(item, max_threads)
+        self._start_digest(item)
+        
+        self._save_manifest(item)
+        
+        # پاسخ باز بررسی اولیه، اولین بخش ناتمام را ادامه می‌دهد
+        first_segment = None
+        if first_response is not None:
+            first_segment = self._claim_segment(item, self._resume_offset(item), item.stop_event)
+            if first_segment is None:
+                first_response.close()
+                first_response = None
+        
+        item.connection_control = self._new_connection_control(max_threads)
+        for i in range(item.connection_control.target):
+            if i == 0:
+                self._add_connection(item, first_segment, first_response)
+            else:
+                self._add_connection(item)
         
         # نخ مانیتورینگ و ترکیب نتایج
         monitor_thread = threading.Thread(
@@ -459,140 +2244,1001 @@ class DownloadManager:
         )
         monitor_thread.start()
         item.threads.append(monitor_thread)
+        return True
+    
+    def _new_connection_control(self, max_threads):
+        """کنترل‌گر تعداد اتصال؛ در حالت غیرتطبیقی از همان ابتدا با حداکثر اتصال شروع می‌کند"""
+        if self.config.get("adaptive_connections", True):
+            return ConnectionController(self.config.get("initial_connections", 2), max_threads)
+        return ConnectionController(max_threads, max_threads)
+    
+    def _add_connection(self, item, thread_info=None, response=None):
+        """راه‌اندازی نخ یک اتصال جدید برای دانلود چندبخشی"""
+        with item.segments_lock:
+            item.connections += 1
+        
+        thread = threading.Thread(
+            target=self._download_part,
+            args=(item, thread_info, response),
+            daemon=True,
+            name=f"DownloadPart-{item.id}-{len(item.threads)}"
+        )
+        thread.start()
+        item.threads.append(thread)
+    
+    def _adjust_connections(self, item, speed_sampled):
+        """اعمال تصمیم کنترل‌گر اتصال پس از هر نمونه سرعت"""
+        control = item.connection_control
+        now = time.time()
+        
+        # بخش‌های منبع‌های بسیار کند در ادامه به منبع‌های دیگر سپرده می‌شوند
+        if speed_sampled and item.mirror_set is not None:
+            for url in item.mirror_set.sample(now):
+                print(f"منبع {url} برای {item.filename} کند است؛ بخش‌های آن به منبع‌های دیگر سپرده می‌شود")
+        
+        added = speed_sampled and self.config.get("adaptive_connections", True) and control.on_speed_sample(item.speed, now)
+        
+        with item.segments_lock:
+            # پس از پاسخ‌های 429/503 ممکن است هیچ اتصالی نمانده باشد
+            stalled = (item.connections == 0 and now >= control.hold_until
+                       and any(self._is_segment_free(thread_info) for thread_info in item.thread_data))
+            missing = control.target - item.connections
+        
+        if added or stalled:
+            for _ in range(max(1, missing) if stalled else 1):
+                self._add_connection(item)
+    
+    def _drop_connection(self, item, thread_info):
+        """رها کردن بخش فعلی وقتی اتصال‌ها بیش از هدف کنترل‌گر هستند؛ بخش برای نخ‌های دیگر آزاد می‌شود"""
+        with item.segments_lock:
+            if item.connections <= item.connection_control.target:
+                return False
+            item.connections -= 1
+            thread_info['owner'] = None
+            thread_info['writer'] = None
+            return True
+    
+    def _release_connection(self, item):
+        with item.segments_lock:
+            item.connections -= 1
+    
+    def _fail_segment(self, item, thread_info, error):
+        """ثبت خطای یک بخش و بیدار کردن نخ مانیتور"""
+        with item.segments_lock:
+            thread_info['error'] = error
+            item.segments_changed.notify_all()
+    
+    def _notify_segments(self, item):
+        with item.segments_lock:
+            item.segments_changed.notify_all()
+    
+    def _on_mirror_failed(self, item, thread_info, url, error, stop_event):
+        """خطای یک منبع در دانلود چندمنبعی: منبع موقتاً کنار گذاشته و بخش به اتصالی تازه روی منبع دیگری سپرده می‌شود؛
+        اگر منبع سالمی نمانده باشد False برمی‌گرداند تا خطای بخش مثل دانلود تک‌منبعی ثبت شود"""
+        mirrors = item.mirror_set
+        if mirrors is None or url is None or stop_event.is_set() or not mirrors.fail(url, time.time()):
+            return False
+        print(f"منبع {url} برای {item.filename} کنار گذاشته شد: {error}")
+        self._leave_mirror(item, thread_info)
+        return True
     
-    def _download_single_threaded(self, item):
+    def _leave_mirror(self, item, thread_info):
+        """رها کردن ادامه بخش و جایگزینی این اتصال با اتصالی تازه که منبع دیگری انتخاب می‌کند"""
+        with item.segments_lock:
+            thread_info['owner'] = None
+            thread_info['writer'] = None
+            item.connections -= 1
+        self._add_connection(item)
+    
+    def _on_throttled(self, item, thread_info, status_code, retry_after):
+        """واکنش به 429/503: نصف کردن اتصال‌ها و آزاد کردن بخش به‌جای ثبت خطا"""
+        self.metrics.inc("retries_total", reason="throttled")
+        try:
+            retry_after = int(retry_after or 0)
+        except ValueError:
+            retry_after = 0
+        
+        with item.segments_lock:
+            item.connections -= 1
+            if item.connection_control.on_throttled(time.time(), retry_after):
+                thread_info['owner'] = None
+                thread_info['writer'] = None
+            else:
+                self._fail_segment(item, thread_info, f"سرور درخواست‌ها را نمی‌پذیرد ({status_code})")
+        print(f"سرور برای {item.filename} پاسخ {status_code} داد؛ اتصال‌ها به {item.connection_control.target} کاهش یافت")
+    
+    def _create_segments(self, item, max_threads):
+        """تقسیم اولیه فایل به بخش‌های هم‌اندازه"""
+        chunk_size = item.size // max_threads
+        
+        # حداقل اندازه هر بخش
+        min_segment_size = self._min_segment_size()
+        if chunk_size < min_segment_size:
+            max_threads = max(1, item.size // min_segment_size)
+            chunk_size = item.size // max_threads
+        
+        # مرز بخش‌ها روی مرز بلوک‌های چکیده درختی می‌افتد تا هر بلوک را یک نخ از ابتدا تا انتها هش کند
+        bounds = [i * chunk_size for i in range(max_threads)] + [item.size]
+        if chunk_size >= DIGEST_BLOCK_SIZE:
+            bounds[1:-1] = [(bound + DIGEST_BLOCK_SIZE // 2) // DIGEST_BLOCK_SIZE * DIGEST_BLOCK_SIZE
+                            for bound in bounds[1:-1]]
+        
+        # ایجاد اطلاعات هر نخ
+        item.thread_data = []
+        item.temp_files = []
+        item.downloaded = 0
+        for start, next_start in zip(bounds, bounds[1:]):
+            self._new_segment(item, start, next_start - 1)
+    
+    def _download_single_threaded(self, item, response=None, offset=0):
         """انجام دانلود تک‌نخی"""
+        stop_event = item.stop_event
+        try:
+            # بررسی حالت ادامه دانلود
+            if response is None:
+                # بررسی اولیه با HEAD انجام شده و پاسخی برای ادامه وجود ندارد
+                offset = 0
+                if item.resume_support and os.path.exists(item.full_path):
+                    offset = min(item.downloaded, os.path.getsize(item.full_path))
+                headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+                response = self.get_session(item.url).get(item.url, headers=headers, stream=True, timeout=30)
+                if offset > 0 and response.status_code != 206:
+                    # سرور بازه را نادیده گرفت و فایل را از ابتدا می‌فرستد؛ فایل موجود بازنویسی می‌شود
+                    offset = 0
+            
+            # پاسخ خطا پیش از دست زدن به فایل موجود رد می‌شود
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            
+            if offset > 0:
+                # حذف داده‌های اضافی احتمالی پس از نقطه ادامه
+                with open(item.full_path, 'r+b') as f:
+                    f.truncate(offset)
+                mode = 'ab'
+            else:
+                mode = 'wb'
+            item.downloaded = offset
+            # داده‌های موجود پیش از نقطه ادامه که هنوز در چکیده نیستند یک بار خوانده می‌شوند
+            self._start_digest(item)
+            self._advance_digest(item)
+            digest = item.digest
+            
+            with response:
+                chunk_size = self._read_size(self.config.get("chunk_size", 1024 * 1024))
+                
+                with open(item.full_path, mode) as f:
+                    start_time = time.time()
+                    speed_calc_time = start_time
+                    speed_calc_bytes = item.downloaded
+                    manifest_time = start_time
+                    
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if stop_event.is_set():
+                            break
+                        
+                        if chunk:
+                            f.write(chunk)
+                            if digest is not None:
+                                digest.update(item.downloaded, chunk)
+                            item.downloaded += len(chunk)
+                            
+                            if self.limits_active:
+                                delay = self._throttle_delay(item, len(chunk))
+                                if delay > 0:
+                                    stop_event.wait(delay)
+                            
+                            # محاسبه سرعت هر ثانیه
+                            current_time = time.time()
+                            if current_time - speed_calc_time >= 1:
+                                item.speed = (item.downloaded - speed_calc_bytes) / (current_time - speed_calc_time)
+                                speed_calc_time = current_time
+                                speed_calc_bytes = item.downloaded
+                            
+                            # ثبت پیشرفت برای ادامه پس از اجرای مجدد (فقط اگر سرور از بازه پشتیبانی کند)
+                            if item.resume_support and current_time - manifest_time >= 0.5:
+                                f.flush()
+                                self._save_manifest(item)
+                                manifest_time = current_time
+                            
+                            # به‌روزرسانی UI
+                            if self.update_callback:
+                                self.update_callback(item)
+            
+            # بررسی وضعیت اتمام
+            if stop_event.is_set():
+                if item.status == "paused" and item.resume_support:
+                    self._save_manifest(item)
+            elif item.size > 0 and item.downloaded < item.size:
+                item.status = "error"
+                item.error_message = "اتصال پیش از دریافت کامل فایل قطع شد"
+            elif self._finish_digest(item):
+                item.status = "completed"
+                item.end_time = time.time()
+                self._remove_manifest(item)
+                print(f"دانلود {item.filename} کامل شد")
+            
+            # به‌روزرسانی نهایی UI
+            if self.update_callback:
+                self.update_callback(item)
+        
+        except Exception as e:
+            item.status = "error"
+            item.error_message = str(e)
+            print(f"خطا در دانلود {item.filename}: {str(e)}")
+            
+            if self.update_callback:
+                self.update_callback(item)
+    
+    def _min_segment_size(self):
+        """کوچک‌ترین اندازه بخش؛ هیچ‌گاه کوچک‌تر از اندازه هر بار خواندن نیست"""
+        read_size = min(self.config.get("chunk_size", 1024 * 1024), 1024 * 1024)
+        return max(self.config.get("min_segment_size", 1024 * 1024), read_size)
+    
+    def _preallocate(self, item):
+        """رزرو فضای کامل فایل مقصد پیش از شروع دانلود بخش‌ها"""
+        try:
+            existing_size = os.path.getsize(item.full_path) if os.path.exists(item.full_path) else 0
+            if item.size - existing_size > shutil.disk_usage(item.save_path).free:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+            
+            fd = os.open(item.full_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+            try:
+                if hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(fd, 0, item.size)
+                    except OSError as e:
+                        # سیستم‌فایل‌هایی که fallocate ندارند
+                        if e.errno == errno.ENOSPC:
+                            raise
+                os.ftruncate(fd, item.size)
+            finally:
+                os.close(fd)
+            return True
+        
+        except OSError as e:
+            item.status = "error"
+            if e.errno == errno.ENOSPC:
+                item.error_message = "فضای کافی روی دیسک وجود ندارد"
+            else:
+                item.error_message = f"خطا در رزرو فضای فایل: {str(e)}"
+            return False
+    
+    def _new_segment(self, item, start, end):
+        """ایجاد و ثبت اطلاعات یک بخش جدید از فایل"""
+        index = len(item.thread_data)
+        
+        # ایجاد فایل موقت برای این بخش (در حالت نوشتن مستقیم نیازی نیست)
+        temp_file = None
+        if item.storage_mode != "direct":
+            temp_file = os.path.join(TEMP_DIR, f"{item.id}_part{index}")
+            item.temp_files.append(temp_file)
+        
+        thread_info = {
+            'index': index,
+            'start': start,
+            'end': end,
+            'downloaded': 0,
+            'temp_file': temp_file
+        }
+        
+        item.thread_data.append(thread_info)
+        return thread_info
+    
+    def _is_segment_free(self, thread_info):
+        """بخش ناتمامی که نخ فعالی روی آن کار نمی‌کند؛ نخ اجرای متوقف‌شده تا خروج از دانلود بازه (writer) هنوز صاحب بخش است"""
+        owner = thread_info.get('owner')
+        return (not thread_info.get('completed') and not thread_info.get('error') and thread_info.get('writer') is None
+                and (owner is None or owner.is_set()))
+    
+    def _end_segment_write(self, item, thread_info, writer):
+        """پایان نوشتن نخ روی بخش؛ اگر بخش پیش‌تر رها و به نخ دیگری سپرده نشده باشد برای اتصال یا اجرای دیگری آزاد می‌شود"""
+        with item.segments_lock:
+            if thread_info.get('writer') is writer:
+                thread_info['writer'] = None
+                item.segments_changed.notify_all()
+    
+    def _claim_segment(self, item, position, stop_event):
+        """اختصاص بخش آزادی که از موقعیت مشخص ادامه می‌یابد به نخ فعلی"""
+        with item.segments_lock:
+            for thread_info in item.thread_data:
+                if (self._is_segment_free(thread_info)
+                        and thread_info['start'] + thread_info['downloaded'] == position):
+                    thread_info['owner'] = stop_event
+                    return thread_info
+            return None
+    
+    def _next_segment(self, item, finished, stop_event):
+        """تکمیل بخش فعلی و برداشتن بخش بعدی: یک بخش آزاد یا نیمه بالایی بزرگ‌ترین بخش باقی‌مانده"""
+        min_segment_size = self._min_segment_size()
+        
+        with item.segments_lock:
+            if finished is not None:
+                finished['completed'] = True
+                finished['owner'] = None
+                item.segments_changed.notify_all()
+            
+            # اول بخش‌های بدون نخ (ادامه پس از توقف یا بخش‌های رهاشده)
+            free_segments = [thread_info for thread_info in item.thread_data if self._is_segment_free(thread_info)]
+            if free_segments:
+                new_segment = max(free_segments, key=lambda x: x['end'] - x['start'] - x['downloaded'])
+                new_segment['owner'] = stop_event
+                return new_segment
+            
+            # با چند منبع بخشی تقسیم می‌شود که دیرتر تمام می‌شود، نه لزوماً بزرگ‌ترین بخش
+            mirrors = item.mirror_set
+            victim = None
+            victim_remaining = 0
+            victim_time = 0
+            for thread_info in item.thread_data:
+                if thread_info.get('completed') or thread_info.get('error'):
+                    continue
+                remaining = thread_info['end'] - thread_info['start'] - thread_info['downloaded'] + 1
+                remaining_time = remaining / mirrors.connection_rate(thread_info.get('source')) if mirrors else remaining
+                if remaining_time > victim_time:
+                    victim = thread_info
+                    victim_remaining = remaining
+                    victim_time = remaining_time
+            
+            keep = victim_remaining // 2
+            min_keep = min_segment_size
+            if victim is not None and mirrors is not None:
+                # اتصال تازه به سریع‌ترین منبع می‌رود؛ سهم هر طرف به نسبت سرعت است تا هر دو با هم تمام شوند
+                victim_rate = mirrors.connection_rate(victim.get('source'))
+                keep = int(victim_remaining * victim_rate / (victim_rate + mirrors.connection_rate()))
+                min_keep = 2 * self._read_size(min_segment_size, True)
+            
+            new_segment = None
+            if victim is not None and keep >= min_keep and victim_remaining - keep >= min_segment_size:
+                # نخ صاحب بخش پیش از هر نوشتن انتهای بخش را دوباره می‌خواند؛ فاصله
+                # نقطه تقسیم از موقعیت فعلی بزرگ‌تر از یک بار خواندن است
+                position = victim['start'] + victim['downloaded']
+                split_at = position + keep
+                # در صورت امکان نقطه تقسیم نزدیک‌ترین مرز بلوک چکیده درختی است
+                lower = split_at - split_at % DIGEST_BLOCK_SIZE
+                for aligned in sorted((lower, lower + DIGEST_BLOCK_SIZE), key=lambda x: abs(x - split_at)):
+                    if position + min_keep <= aligned <= victim['end'] + 1 - min_segment_size:
+                        split_at = aligned
+                        break
+                new_segment = self._new_segment(item, split_at, victim['end'])
+                new_segment['owner'] = stop_event
+                victim['end'] = split_at - 1
+            
+            return new_segment
+    
+    def _download_part(self, item, thread_info=None, response=None):
+        """دانلود یک بخش از فایل و ادامه کار با بخش‌های آزاد یا جداشده از بخش‌های کندتر"""
+        stop_event = item.stop_event
+        if thread_info is None:
+            thread_info = self._next_segment(item, None, stop_event)
+        
+        while thread_info is not None:
+            started = time.perf_counter()
+            done = self._download_range(item, thread_info, response, stop_event)
+            self.metrics.observe("segment_duration_seconds", time.perf_counter() - started)
+            if done is None:
+                # بخش رها شد و اتصال پیش‌تر از شمارش خارج شده است
+                return
+            if not done:
+                break
+            
+            response = None
+            thread_info = self._next_segment(item, thread_info, stop_event)
+        
+        self._release_connection(item)
+    
+    def _open_segment_target(self, item, thread_info):
+        """باز کردن فایل مقصد یک بخش؛ توصیف‌گر فایل و موقعیت شروع بخش در آن را برمی‌گرداند"""
+        flags = os.O_WRONLY | getattr(os, "O_BINARY", 0)
+        
+        if item.storage_mode == "direct":
+            # هر نخ توصیف‌گر مخصوص خود را دارد و در موقعیت بخش خودش می‌نویسد
+            return os.open(item.full_path, flags), thread_info['start']
+        
+        # حالت ادامه دانلود
+        flags |= os.O_CREAT
+        if thread_info['downloaded'] == 0:
+            flags |= os.O_TRUNC
+        return os.open(thread_info['temp_file'], flags, 0o666), 0
+    
+    def _download_range(self, item, thread_info, response, stop_event):
+        """دانلود بازه یک بخش؛ در صورت دریافت کامل True و اگر بخش برای اتصال دیگری رها شود None برمی‌گرداند"""
+        # پاسخ بررسی اولیه از آدرس اصلی است؛ درخواست‌های تازه به منبعی که MirrorSet انتخاب کند می‌روند
+        # نشانه نخ نویسنده تا خروج از این تابع؛ بخش تا آن زمان به اجرای بعدی سپرده نمی‌شود
+        writer = thread_info['writer'] = object()
+        mirrors = item.mirror_set
+        url = mirrors.acquire(time.time(), None if response is None else item.url) if mirrors else item.url
+        thread_info['source'] = url
+        try:
+            if response is None:
+                headers = {
+                    'Range': f'bytes={thread_info["start"] + thread_info["downloaded"]}-{thread_info["end"]}'
+                }
+                response = self.get_session(url).get(url, headers=headers, stream=True, timeout=30)
+            
+            with response:
+                response.raise_for_status()
+                if mirrors is not None and response.status_code != 206:
+                    raise ValueError(f"منبع بازه درخواستی را برنگرداند ({response.status_code})")
+                chunk_size = self._read_size(min(self.config.get("chunk_size", 1024 * 1024), 1024 * 1024), mirrors is not None)
+                
+                fd, base_offset = self._open_segment_target(item, thread_info)
+                try:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if stop_event.is_set():
+                            break
+                        
+                        if chunk:
+                            # پاسخ ممکن است فراتر از انتهای این بخش ادامه داشته باشد
+                            remaining = thread_info['end'] - thread_info['start'] - thread_info['downloaded'] + 1
+                            if len(chunk) > remaining:
+                                chunk = chunk[:remaining]
+                            
+                            self._write_chunk(item, fd, chunk, base_offset + thread_info['downloaded'],
+                                              thread_info['start'] + thread_info['downloaded'])
+                            size = len(chunk)
+                            # فقط شمارنده همین بخش؛ مجموع دانلود هنگام خواندن محاسبه می‌شود
+                            thread_info['downloaded'] += size
+                            if mirrors is not None:
+                                mirrors.add_bytes(url, size)
+                            
+                            if size == remaining:
+                                break
+                            
+                            if self.limits_active:
+                                delay = self._throttle_delay(item, size, url)
+                                if delay > 0:
+                                    stop_event.wait(delay)
+                            
+                            if item.connections > item.connection_control.target and self._drop_connection(item, thread_info):
+                                return None
+                            
+                            if mirrors is not None and not mirrors.usable(url, time.time()):
+                                self._leave_mirror(item, thread_info)
+                                return None
+                finally:
+                    os.close(fd)
+            
+            # بخش با موفقیت دانلود شد
+            if stop_event.is_set():
+                return False
+            if thread_info['downloaded'] < thread_info['end'] - thread_info['start'] + 1:
+                self._fail_segment(item, thread_info, "اتصال پیش از دریافت کامل بخش قطع شد")
+                return False
+            return True
+        
+        except requests.HTTPError as e:
+            if self._on_mirror_failed(item, thread_info, url, str(e), stop_event):
+                return None
+            if e.response is not None and e.response.status_code in (429, 503):
+                self._on_throttled(item, thread_info, e.response.status_code, e.response.headers.get('Retry-After'))
+                return None
+            self._fail_segment(item, thread_info, str(e))
+            print(f"خطا در دانلود بخش {thread_info['index']}: {str(e)}")
+            return False
+        
+        except Exception as e:
+            if self._on_mirror_failed(item, thread_info, url, str(e), stop_event):
+                return None
+            self._fail_segment(item, thread_info, str(e))
+            print(f"خطا در دانلود بخش {thread_info['index']}: {str(e)}")
+            return False
+        
+        finally:
+            if mirrors is not None:
+                mirrors.release(url)
+            self._end_segment_write(item, thread_info, writer)
+    
+    def _monitor_multithreaded_download(self, item):
+        """مانیتور کردن و ترکیب نتایج دانلود چند نخی"""
+        stop_event = item.stop_event
+        start_time = time.time()
+        speed_calc_time = start_time
+        speed_calc_bytes = item.downloaded
+        
+        try:
+            while item.status == "downloading" and not stop_event.is_set():
+                all_completed, has_error = self._segments_state(item)
+                
+                # محاسبه سرعت هر ثانیه
+                current_time = time.time()
+                speed_sampled = current_time - speed_calc_time >= 1
+                if speed_sampled:
+                    item.speed = (item.downloaded - speed_calc_bytes) / (current_time - speed_calc_time)
+                    speed_calc_time = current_time
+                    speed_calc_bytes = item.downloaded
+                
+                # به‌روزرسانی UI
+                if self.update_callback:
+                    self.update_callback(item)
+                
+                # ثبت پیشرفت بخش‌ها (حداکثر دو بار در ثانیه)
+                if not all_completed:
+                    self._save_manifest(item)
+                    self._adjust_connections(item, speed_sampled)
+                    # داده‌های بخش‌های جلوتر وقتی پیشوند فایل به آن‌ها برسد از حافظه نهان دیسک به چکیده افزوده می‌شوند
+                    self._advance_digest(item, DIGEST_CATCH_UP_BYTES)
+                
+                if has_error:
+                    item.status = "error"
+                    item.error_message = "خطا در دانلود یکی از بخش‌ها"
+                    stop_event.set()
+                    break
+                
+                if all_completed:
+                    break
+                
+                # انتظار تا پایان یا خطای یک بخش، توقف دانلود یا نوبت بعدی محاسبه سرعت
+                with item.segments_changed:
+                    item.segments_changed.wait_for(
+                        lambda: stop_event.is_set() or self._segments_state(item) != (False, False), timeout=0.5)
+            
+            self._finish_multithreaded(item, stop_event)
+        
+        except Exception as e:
+            item.status = "error"
+            item.error_message = str(e)
+            print(f"خطا در مانیتورینگ دانلود {item.filename}: {str(e)}")
+            
+            if self.update_callback:
+                self.update_callback(item)
+        
+        finally:
+            self._on_download_finished(item, stop_event)
+    
+    def _segments_state(self, item):
+        """وضعیت کلی بخش‌ها: (همه بخش‌ها کامل شده‌اند، یکی از بخش‌ها خطا داده است)"""
+        all_completed = True
+        
+        # بخش‌ها هنگام تقسیم پویا زیر همین قفل اضافه می‌شوند
+        with item.segments_lock:
+            for thread_info in item.thread_data:
+                if thread_info.get('error'):
+                    return False, True
+                
+                if not thread_info.get('completed', False):
+                    all_completed = False
+        
+        return all_completed, False
+    
+    def _finish_multithreaded(self, item, stop_event):
+        """ترکیب بخش‌ها و ثبت وضعیت نهایی دانلود چند نخی"""
+        # اگر دانلود کنسل یا متوقف شده، خروج
+        if item.status == "paused":
+            self._save_manifest(item)
+        if item.status in ["paused", "canceled"] or (stop_event.is_set() and item.status != "error"):
+            return
+        
+        started = time.perf_counter()
+        # چکیده پیش از ترکیب کامل می‌شود (در حالت فایل‌های موقت داده‌های باقی‌مانده از همان فایل‌ها خوانده می‌شوند)
+        if item.status != "error":
+            self._advance_digest(item)
+        
+        # ترکیب تمام بخش‌ها (در حالت نوشتن مستقیم داده‌ها از قبل در فایل مقصد هستند)
+        if item.status != "error" and item.storage_mode != "direct":
+            self._combine_parts(item)
+        
+        # به‌روزرسانی نهایی
+        if item.status != "error" and self._finish_digest(item):
+            item.status = "completed"
+            item.end_time = time.time()
+            self._remove_manifest(item)
+            print(f"دانلود {item.filename} کامل شد")
+        self.metrics.observe("finalize_seconds", time.perf_counter() - started)
+        
+        # به‌روزرسانی نهایی UI
+        if self.update_callback:
+            self.update_callback(item)
+    
+    def _combine_parts(self, item):
+        """ترکیب بخش‌های دانلود شده به یک فایل"""
+        try:
+            parts = sorted(item.thread_data, key=lambda x: x['start'])
+            
+            # بخش اول خود فایل مقصد می‌شود: تغییر نام در همان دیسک یا کپی هسته‌ای بین دیسک‌ها
+            move_file(parts[0]['temp_file'], item.full_path)
+            
+            # بقیه بخش‌ها بدون عبور داده از پایتون به انتهای فایل افزوده می‌شوند
+            output_fd = os.open(item.full_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+            try:
+                for thread_info in parts[1:]:
+                    temp_fd = os.open(thread_info['temp_file'], os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                    try:
+                        os.lseek(output_fd, thread_info['start'], os.SEEK_SET)
+                        copy_file_data(temp_fd, output_fd, thread_info['downloaded'])
+                    finally:
+                        os.close(temp_fd)
+                os.ftruncate(output_fd, item.size)
+            finally:
+                os.close(output_fd)
+            
+            # پاکسازی فایل‌های موقت
+            for temp_file in item.temp_files:
+                if os.path.exists(temp_file):
+                    try:
+                        os.remove(temp_file)
+                    except:
+                        pass
+            
+            return True
+        
+        except Exception as e:
+            item.status = "error"
+            item.error_message = f"خطا در ترکیب بخش‌ها: {str(e)}"
+            print(f"خطا در ترکیب بخش‌های دانلود {item.filename}: {str(e)}")
+            return False
+
+
+class AsyncHTTPResponse:
+    """پاسخ HTTP موتور asyncio با رابطی نزدیک به پاسخ requests"""
+    
+    def __init__(self, pool, key, reader, writer, status_code, headers, method):
+        self.pool = pool
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status_code = status_code
+        self.headers = headers
+        self.timeout = pool.timeout
+        
+        transfer_encoding = headers.get('Transfer-Encoding', '').lower()
+        content_length = headers.get('Content-Length')
+        self._chunked = 'chunked' in transfer_encoding
+        self._remaining = int(content_length) if content_length and not self._chunked else None
+        self._chunk_left = 0
+        self._reusable = headers.get('Connection', '').lower() != 'close' and (self._chunked or self._remaining is not None)
+        self._done = method == "HEAD" or status_code in (204, 304) or self._remaining == 0
+        self._closed = False
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} خطای سرور برای آدرس درخواست شده", response=self)
+    
+    async def read(self, size):
+        """خواندن حداکثر size بایت از بدنه پاسخ؛ در پایان بدنه b'' برمی‌گرداند"""
+        if self._done:
+            return b''
+        
+        if self._chunked:
+            if self._chunk_left == 0:
+                line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+                chunk_length = int(line.split(b';')[0].strip() or b'0', 16)
+                if chunk_length == 0:
+                    # خواندن هدرهای انتهایی تا خط خالی
+                    while (await asyncio.wait_for(self.reader.readline(), self.timeout)) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._done = True
+                    return b''
+                self._chunk_left = chunk_length
+            
+            data = await asyncio.wait_for(self.reader.read(min(size, self._chunk_left)), self.timeout)
+            if not data:
+                raise ConnectionError("اتصال در میانه پاسخ بسته شد")
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await asyncio.wait_for(self.reader.readexactly(2), self.timeout)
+            return data
+        
+        if self._remaining is not None:
+            data = await asyncio.wait_for(self.reader.read(min(size, self._remaining)), self.timeout)
+            if not data:
+                raise ConnectionError("اتصال در میانه پاسخ بسته شد")
+            self._remaining -= len(data)
+            self._done = self._remaining == 0
+            return data
+        
+        # بدون طول مشخص: تا بسته شدن اتصال
+        data = await asyncio.wait_for(self.reader.read(size), self.timeout)
+        if not data:
+            self._done = True
+        return data
+    
+    async def read_chunk(self, size):
+        """خواندن یک تکه کامل به اندازه size (یا کمتر در پایان بدنه)"""
+        buffer = bytearray()
+        while len(buffer) < size:
+            data = await self.read(size - len(buffer))
+            if not data:
+                break
+            buffer += data
+        return bytes(buffer)
+    
+    def close(self):
+        """بازگرداندن اتصال به استخر در صورت خوانده شدن کامل بدنه، در غیر این صورت بستن آن"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._done and self._reusable:
+            self.pool.release(self.key, self.reader, self.writer)
+        else:
+            self.writer.close()
+
+
+class AsyncConnectionPool:
+    """استخر اتصال‌های keep-alive موتور asyncio به تفکیک میزبان"""
+    
+    def __init__(self, max_idle_per_host, timeout=30):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}
+        self.ssl_context = None
+        self.on_response = None  # on_response(کد وضعیت، تعداد اتصال دوباره) برای معیارها
+    
+    async def _acquire(self, key):
+        idle = self.idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            ssl_context = self.ssl_context
+        
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=host if ssl_context else None),
+            self.timeout)
+        return reader, writer, False
+    
+    def release(self, key, reader, writer):
+        idle = self.idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+    
+    def close(self):
+        for idle in self.idle.values():
+            for reader, writer in idle:
+                writer.close()
+        self.idle.clear()
+    
+    async def request(self, method, url, headers=None, max_redirects=5):
+        """ارسال یک درخواست HTTP/1.1 و دریافت هدرهای پاسخ؛ بدنه به‌صورت جریانی خوانده می‌شود"""
+        for _ in range(max_redirects + 1):
+            parsed = urlparse(url)
+            scheme = parsed.scheme.lower()
+            port = parsed.port or (443 if scheme == "https" else 80)
+            key = (scheme, parsed.hostname, port)
+            path = parsed.path or "/"
+            if parsed.query:
+                path += "?" + parsed.query
+            
+            lines = [f"{method} {path} HTTP/1.1", f"Host: {parsed.netloc}",
+                     f"User-Agent: {USER_AGENT}", "Accept-Encoding: identity", "Connection: keep-alive"]
+            lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+            request_bytes = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+            
+            for attempt in range(2):
+                reader, writer, reused = await self._acquire(key)
+                try:
+                    writer.write(request_bytes)
+                    await writer.drain()
+                    status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                    if not status_line:
+                        raise ConnectionError("اتصال پیش از دریافت پاسخ بسته شد")
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    # اتصال استفاده‌شده ممکن است از سمت سرور بسته شده باشد؛ یک بار با اتصال تازه
+                    if not reused or attempt == 1:
+                        raise
+                except BaseException:
+                    # مهلت، لغو یا هر خطای دیگر: اتصال نیمه‌کاره بسته می‌شود
+                    writer.close()
+                    raise
+            
+            try:
+                try:
+                    status_code = int(status_line.split()[1])
+                except (IndexError, ValueError):
+                    raise ConnectionError(f"خط وضعیت پاسخ نامعتبر است: {status_line[:100]!r}")
+                if self.on_response:
+                    self.on_response(status_code, attempt)
+                header_lines = []
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), self.timeout)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    header_lines.append(line)
+                response_headers = http.client.parse_headers(BytesIO(b''.join(header_lines) + b'\r\n'))
+                response = AsyncHTTPResponse(self, key, reader, writer, status_code, response_headers, method)
+            except BaseException:
+                writer.close()
+                raise
+            
+            location = response_headers.get('Location')
+            if status_code in (301, 302, 303, 307, 308) and location:
+                # بدنه کوتاه تغییر مسیر خوانده می‌شود تا اتصال قابل استفاده بماند؛ در صورت خطا اتصال بسته می‌شود
+                try:
+                    while await response.read(65536):
+                        pass
+                finally:
+                    response.close()
+                url = urllib.parse.urljoin(url, location)
+                if status_code == 303:
+                    method = "GET"
+                continue
+            
+            return response
+        
+        raise requests.TooManyRedirects("تعداد تغییر مسیرها بیش از حد مجاز است")
+
+
+class AsyncDownloadManager(DownloadManager):
+    """مدیریت دانلود با موتور asyncio: همه انتقال‌ها روی یک حلقه رویداد و بدون نخ جداگانه برای هر بخش"""
+    
+    def __init__(self, config, update_callback=None):
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="DownloadEventLoop")
+        self.loop_thread.start()
+        
+        # نوشتن روی دیسک در استخر کوچک و ثابتی از نخ‌ها انجام می‌شود تا حلقه رویداد مسدود نشود
+        self.io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.get("async_io_threads", 4), thread_name_prefix="DownloadIO")
+        self.http = AsyncConnectionPool(max(1, config.get("max_concurrent_downloads", 3) *
+                                               config.get("max_threads_per_download", 5)))
+        
+        super().__init__(config, update_callback)
+        self.http.on_response = self._record_async_response
+    
+    def _record_async_response(self, status_code, reconnects):
+        self.metrics.inc("http_responses_total", code=str(status_code))
+        if reconnects:
+            self.metrics.inc("retries_total", reconnects, reason="reconnect")
+    
+    def _idle_connections(self):
+        return sum(len(idle) for idle in list(self.http.idle.values()))
+    
+    def close_sessions(self):
+        """بستن اتصال‌های باز هر دو موتور"""
+        super().close_sessions()
+        self.loop.call_soon_threadsafe(self.http.close)
+    
+    def _start_transfer(self, item):
+        """زمان‌بندی انتقال دانلود روی حلقه رویداد"""
+        item.task = asyncio.run_coroutine_threadsafe(self._run_download_async(item), self.loop)
+    
+    async def _in_executor(self, func, *args):
+        return await self.loop.run_in_executor(self.io_executor, func, *args)
+    
+    async def _sleep(self, delay, stop_event):
+        """انتظار محدودکننده سرعت در تکه‌های کوتاه تا توقف دانلود معطل نماند"""
+        deadline = time.monotonic() + delay
+        while not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(remaining, 0.25))
+    
+    async def _run_download_async(self, item):
+        """بررسی اولیه فایل و انتخاب روش دانلود در موتور asyncio"""
+        stop_event = item.stop_event
+        self.metrics.observe("scheduler_latency_seconds", time.monotonic() - item.dispatched_at)
         try:
-            # دریافت اطلاعات فایل
-            file_info = self._get_file_info(item.url)
-            if not file_info:
-                item.status = "error"
-                item.error_message = "خطا در دسترسی به فایل"
-                return
-            
-            item.size = file_info['size']
-            item.resume_support = file_info['accept_ranges']
-            
-            # بررسی حالت ادامه دانلود
-            file_exists = os.path.exists(item.full_path)
-            if file_exists and item.resume_support and item.downloaded > 0:
-                headers = {'Range': f'bytes={item.downloaded}-'}
-                mode = 'ab'
-            else:
-                headers = {}
-                mode = 'wb'
-                item.downloaded = 0
-            
-            # افزودن User-Agent
-            headers['User-Agent'] = 'ShetabDaryaft/1.0'
-            
-            with requests.get(item.url, headers=headers, stream=True, timeout=30) as response:
-                response.raise_for_status()
-                chunk_size = self.config.get("chunk_size", 1024 * 1024)
-                
-                with open(item.full_path, mode) as f:
-                    start_time = time.time()
-                    speed_calc_time = start_time
-                    speed_calc_bytes = item.downloaded
-                    
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if item.stop_event.is_set():
-                            break
-                        
-                        if chunk:
-                            f.write(chunk)
-                            item.downloaded += len(chunk)
-                            
-                            # محاسبه سرعت هر ثانیه
-                            current_time = time.time()
-                            if current_time - speed_calc_time >= 1:
-                                item.speed = (item.downloaded - speed_calc_bytes) / (current_time - speed_calc_time)
-                                speed_calc_time = current_time
-                                speed_calc_bytes = item.downloaded
-                            
-                            # محاسبه پیشرفت
-                            if item.size > 0:
-                                item.progress = min(100, item.downloaded / item.size * 100)
-                            
-                            # به‌روزرسانی UI
-                            if self.update_callback:
-                                self.update_callback(item)
+            await self._in_executor(self._verify_segments, item)
+            resume_offset = self._resume_offset(item)
             
-            # بررسی وضعیت اتمام
-            if not item.stop_event.is_set():
-                item.status = "completed"
-                item.progress = 100
-                item.end_time = time.time()
-                print(f"دانلود {item.filename} کامل شد")
+            file_info = await self._probe_async(item, resume_offset)
+            if file_info and resume_offset > 0 and not self._is_same_file(item, file_info, resume_offset):
+                # فایل روی سرور تغییر کرده یا ادامه پشتیبانی نمی‌شود؛ شروع دوباره از ابتدا
+                print(f"فایل {item.filename} روی سرور تغییر کرده است؛ دانلود از ابتدا شروع می‌شود")
+                await self._in_executor(self._reset_progress, item)
+                if file_info['offset'] != 0:
+                    if file_info['response'] is not None:
+                        file_info['response'].close()
+                    file_info = await self._probe_async(item, 0)
             
-            # به‌روزرسانی نهایی UI
-            if self.update_callback:
-                self.update_callback(item)
+            mode = self._apply_file_info(item, file_info, stop_event)
+            if mode == "multi":
+                await self._download_multi_async(item, file_info['response'])
+            elif mode == "single":
+                await self._download_single_async(item, file_info['response'], file_info['offset'])
         
         except Exception as e:
             item.status = "error"
             item.error_message = str(e)
             print(f"خطا در دانلود {item.filename}: {str(e)}")
-            
             if self.update_callback:
                 self.update_callback(item)
+        
+        finally:
+            # ثبت تاریخچه و شروع دانلود بعدی صف بیرون از حلقه رویداد
+            await self._in_executor(self._on_download_finished, item, stop_event)
     
-    def _download_part(self, item, thread_info):
-        """دانلود یک بخش از فایل"""
-        try:
-            headers = {
-                'User-Agent': 'ShetabDaryaft/1.0',
-                'Range': f'bytes={thread_info["start"] + thread_info["downloaded"]}-{thread_info["end"]}'
-            }
-            
-            # حالت ادامه دانلود
-            mode = 'ab' if os.path.exists(thread_info['temp_file']) and thread_info['downloaded'] > 0 else 'wb'
-            
-            with requests.get(item.url, headers=headers, stream=True, timeout=30) as response:
-                response.raise_for_status()
-                chunk_size = min(self.config.get("chunk_size", 1024 * 1024), 1024 * 1024)
-                
-                with open(thread_info['temp_file'], mode) as f:
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if item.stop_event.is_set():
-                            break
-                        
-                        if chunk:
-                            f.write(chunk)
-                            size = len(chunk)
-                            thread_info['downloaded'] += size
-                            
-                            with self.lock:
-                                item.downloaded += size
-                                # محاسبه پیشرفت
-                                if item.size > 0:
-                                    item.progress = min(100, item.downloaded / item.size * 100)
-            
-            # بخش با موفقیت دانلود شد
-            thread_info['completed'] = True
+    async def _probe_async(self, item, offset=0):
+        """بررسی فایل با GET بازه‌ای (و در صورت نیاز HEAD) روی حلقه رویداد"""
+        headers = {'Range': f'bytes={offset}-'}
+        if offset > 0 and item.etag and not item.etag.startswith('W/'):
+            headers['If-Range'] = item.etag
+        elif offset > 0 and item.last_modified:
+            headers['If-Range'] = item.last_modified
+        
+        for method, request_headers in (("GET", headers), ("HEAD", {})):
+            response = None
+            try:
+                response = await self.http.request(method, item.url, request_headers)
+                if response.status_code in (200, 206):
+                    file_info = self._parse_file_info(item.url, response, offset)
+                    file_info['response'] = response if method == "GET" else None
+                    if method == "HEAD":
+                        response.close()
+                    return file_info
+                response.close()
+            except Exception as e:
+                if response is not None:
+                    response.close()
+                print(f"خطا در بررسی اولیه فایل: {str(e)}")
         
-        except Exception as e:
-            thread_info['error'] = str(e)
-            print(f"خطا در دانلود بخش {thread_info['index']}: {str(e)}")
+        return None
     
-    def _monitor_multithreaded_download(self, item):
-        """مانیتور کردن و ترکیب نتایج دانلود چند نخی"""
-        start_time = time.time()
-        speed_calc_time = start_time
-        speed_calc_bytes = item.downloaded
+    async def _probe_mirrors_async(self, item):
+        """بررسی همزمان آینه‌های دانلود با HEAD روی حلقه رویداد"""
+        async def probe(url):
+            response = None
+            try:
+                response = await self.http.request("HEAD", url)
+                return self._parse_file_info(url, response) if response.status_code == 200 else None
+            except Exception as e:
+                print(f"خطا در دریافت اطلاعات فایل: {str(e)}")
+                return None
+            finally:
+                if response is not None:
+                    response.close()
+        
+        results = await asyncio.gather(*(probe(url) for url in item.mirrors))
+        self._use_mirrors(item, list(zip(item.mirrors, results)))
+    
+    async def _download_single_async(self, item, response=None, offset=0):
+        """انجام دانلود تک‌جریانی روی حلقه رویداد"""
+        stop_event = item.stop_event
+        if response is None:
+            offset = 0
+            if item.resume_support and os.path.exists(item.full_path):
+                offset = min(item.downloaded, os.path.getsize(item.full_path))
+            headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+            response = await self.http.request("GET", item.url, headers)
+            if offset > 0 and response.status_code != 206:
+                # سرور بازه را نادیده گرفت و فایل را از ابتدا می‌فرستد؛ فایل موجود بازنویسی می‌شود
+                offset = 0
         
         try:
-            while item.status == "downloading" and not item.stop_event.is_set():
-                all_completed = True
-                has_error = False
+            response.raise_for_status()
+            flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0) | (0 if offset > 0 else os.O_TRUNC)
+            fd = os.open(item.full_path, flags, 0o666)
+        except BaseException:
+            response.close()
+            raise
+        try:
+            if offset > 0:
+                # حذف داده‌های اضافی احتمالی پس از نقطه ادامه
+                os.ftruncate(fd, offset)
+            item.downloaded = offset
+            self._start_digest(item)
+            await self._in_executor(self._advance_digest, item)
+            chunk_size = self._read_size(self.config.get("chunk_size", 1024 * 1024))
+            
+            speed_calc_time = manifest_time = time.time()
+            speed_calc_bytes = item.downloaded
+            
+            while not stop_event.is_set():
+                chunk = await response.read_chunk(chunk_size)
+                if not chunk or stop_event.is_set():
+                    break
                 
-                for thread_info in item.thread_data:
-                    if thread_info.get('error'):
-                        has_error = True
-                        break
-                    
-                    if not thread_info.get('completed', False):
-                        all_completed = False
+                await self._in_executor(self._write_chunk, item, fd, chunk, item.downloaded, item.downloaded)
+                item.downloaded += len(chunk)
+                
+                if self.limits_active:
+                    delay = self._throttle_delay(item, len(chunk))
+                    if delay > 0:
+                        await self._sleep(delay, stop_event)
                 
                 # محاسبه سرعت هر ثانیه
                 current_time = time.time()
@@ -601,69 +3247,675 @@ class DownloadManager:
                     speed_calc_time = current_time
                     speed_calc_bytes = item.downloaded
                 
+                # ثبت پیشرفت برای ادامه پس از اجرای مجدد
+                if item.resume_support and current_time - manifest_time >= 0.5:
+                    await self._in_executor(self._save_manifest, item)
+                    manifest_time = current_time
+                
                 # به‌روزرسانی UI
                 if self.update_callback:
                     self.update_callback(item)
-                
-                if has_error:
-                    item.status = "error"
-                    item.error_message = "خطا در دانلود یکی از بخش‌ها"
-                    break
-                
-                if all_completed:
-                    # ترکیب تمام بخش‌ها
-                    self._combine_parts(item)
-                    break
-                
-                time.sleep(0.5)
-            
-            # اگر دانلود کنسل یا متوقف شده، خروج
-            if item.status in ["paused", "canceled"]:
+        finally:
+            response.close()
+            os.close(fd)
+        
+        # بررسی وضعیت اتمام
+        if stop_event.is_set():
+            if item.status == "paused" and item.resume_support:
+                await self._in_executor(self._save_manifest, item)
+        elif item.size > 0 and item.downloaded < item.size:
+            item.status = "error"
+            item.error_message = "اتصال پیش از دریافت کامل فایل قطع شد"
+        elif await self._in_executor(self._finish_digest, item):
+            item.status = "completed"
+            item.end_time = time.time()
+            self._remove_manifest(item)
+            print(f"دانلود {item.filename} کامل شد")
+        
+        # به‌روزرسانی نهایی UI
+        if self.update_callback:
+            self.update_callback(item)
+    
+    async def _download_multi_async(self, item, first_response=None):
+        """دانلود چندبخشی با یک coroutine برای هر اتصال"""
+        stop_event = item.stop_event
+        max_connections = self.config.get("max_threads_per_download", 5)
+        await self._probe_mirrors_async(item)
+        
+        if not item.thread_data:
+            item.storage_mode = self.config.get("storage_mode", "direct")
+        
+        # رزرو کامل فایل مقصد؛ کمبود فضا همین‌جا آشکار می‌شود نه در پایان دانلود
+        if item.storage_mode == "direct" and (not os.path.exists(item.full_path)
+                                              or os.path.getsize(item.full_path) != item.size):
+            if not await self._in_executor(self._preallocate, item):
+                if first_response is not None:
+                    first_response.close()
+                print(f"خطا در دانلود {item.filename}: {item.error_message}")
+                if self.update_callback:
+                    self.update_callback(item)
                 return
+        
+        if not item.thread_data:
+            self._create_segments(item, max_connections)
+        self._start_digest(item)
+        await self._in_executor(self._save_manifest, item)
+        
+        # پاسخ باز بررسی اولیه، اولین بخش ناتمام را ادامه می‌دهد
+        first_segment = None
+        if first_response is not None:
+            first_segment = self._claim_segment(item, self._resume_offset(item), stop_event)
+            if first_segment is None:
+                first_response.close()
+                first_response = None
+        
+        item.threads = []
+        item.connection_control = self._new_connection_control(max_connections)
+        for i in range(item.connection_control.target):
+            if i == 0:
+                self._add_connection(item, first_segment, first_response)
+            else:
+                self._add_connection(item)
+        
+        speed_calc_time = time.time()
+        speed_calc_bytes = item.downloaded
+        while item.status == "downloading" and not stop_event.is_set():
+            # پایان همه بخش‌ها یا گذشت نیم ثانیه برای محاسبه سرعت
+            pending = [task for task in item.threads if not task.done()]
+            if pending:
+                await asyncio.wait(pending, timeout=0.5)
+            else:
+                await asyncio.sleep(0.5)
+            all_completed, has_error = self._segments_state(item)
             
-            # به‌روزرسانی نهایی
-            if item.status != "error":
-                item.status = "completed"
-                item.progress = 100
-                item.end_time = time.time()
-                print(f"دانلود {item.filename} کامل شد")
+            # محاسبه سرعت هر ثانیه
+            current_time = time.time()
+            speed_sampled = current_time - speed_calc_time >= 1
+            if speed_sampled:
+                item.speed = (item.downloaded - speed_calc_bytes) / (current_time - speed_calc_time)
+                speed_calc_time = current_time
+                speed_calc_bytes = item.downloaded
             
-            # به‌روزرسانی نهایی UI
+            # به‌روزرسانی UI
             if self.update_callback:
                 self.update_callback(item)
+            
+            if has_error:
+                item.status = "error"
+                item.error_message = "خطا در دانلود یکی از بخش‌ها"
+                stop_event.set()
+                break
+            
+            if all_completed:
+                break
+            
+            # ثبت پیشرفت بخش‌ها (حداکثر دو بار در ثانیه)
+            await self._in_executor(self._save_manifest, item)
+            self._adjust_connections(item, speed_sampled)
+            await self._in_executor(self._advance_digest, item, DIGEST_CATCH_UP_BYTES)
         
-        except Exception as e:
-            item.status = "error"
-            item.error_message = str(e)
-            print(f"خطا در مانیتورینگ دانلود {item.filename}: {str(e)}")
+        await asyncio.gather(*item.threads, return_exceptions=True)
+        await self._in_executor(self._finish_multithreaded, item, stop_event)
+    
+    def _add_connection(self, item, thread_info=None, response=None):
+        """افزودن coroutine یک اتصال جدید؛ فقط از داخل حلقه رویداد فراخوانی می‌شود"""
+        with item.segments_lock:
+            item.connections += 1
+        item.threads.append(asyncio.ensure_future(self._download_part_async(item, thread_info, response)))
+    
+    async def _download_part_async(self, item, thread_info=None, response=None):
+        """دانلود یک بخش و ادامه کار با بخش‌های آزاد یا جداشده از بخش‌های کندتر"""
+        stop_event = item.stop_event
+        if thread_info is None:
+            thread_info = self._next_segment(item, None, stop_event)
+        
+        while thread_info is not None:
+            started = time.perf_counter()
+            done = await self._download_range_async(item, thread_info, response, stop_event)
+            self.metrics.observe("segment_duration_seconds", time.perf_counter() - started)
+            if done is None:
+                return
+            if not done:
+                break
             
-            if self.update_callback:
-                self.update_callback(item)
+            response = None
+            thread_info = self._next_segment(item, thread_info, stop_event)
+        
+        self._release_connection(item)
     
-    def _combine_parts(self, item):
-        """ترکیب بخش‌های دانلود شده به یک فایل"""
+    async def _download_range_async(self, item, thread_info, response, stop_event):
+        """دانلود بازه یک بخش؛ در صورت دریافت کامل True و اگر بخش برای اتصال دیگری رها شود None برمی‌گرداند"""
+        fd = None
+        # نشانه نخ نویسنده تا خروج از این تابع؛ بخش تا آن زمان به اجرای بعدی سپرده نمی‌شود
+        writer = thread_info['writer'] = object()
+        mirrors = item.mirror_set
+        url = mirrors.acquire(time.time(), None if response is None else item.url) if mirrors else item.url
+        thread_info['source'] = url
         try:
-            with open(item.full_path, 'wb') as output_file:
-                for thread_info in sorted(item.thread_data, key=lambda x: x['index']):
-                    if os.path.exists(thread_info['temp_file']):
-                        with open(thread_info['temp_file'], 'rb') as temp_file:
-                            output_file.write(temp_file.read())
+            if response is None:
+                headers = {
+                    'Range': f'bytes={thread_info["start"] + thread_info["downloaded"]}-{thread_info["end"]}'
+                }
+                response = await self.http.request("GET", url, headers)
             
-            # پاکسازی فایل‌های موقت
-            for temp_file in item.temp_files:
-                if os.path.exists(temp_file):
-                    try:
-                        os.remove(temp_file)
-                    except:
-                        pass
+            response.raise_for_status()
+            if mirrors is not None and response.status_code != 206:
+                raise ValueError(f"منبع بازه درخواستی را برنگرداند ({response.status_code})")
+            chunk_size = self._read_size(min(self.config.get("chunk_size", 1024 * 1024), 1024 * 1024), mirrors is not None)
+            fd, base_offset = self._open_segment_target(item, thread_info)
+            
+            while not stop_event.is_set():
+                remaining = thread_info['end'] - thread_info['start'] - thread_info['downloaded'] + 1
+                if remaining <= 0:
+                    break
+                
+                chunk = await response.read_chunk(min(chunk_size, remaining))
+                if not chunk or stop_event.is_set():
+                    break
+                
+                # انتهای بخش ممکن است در این فاصله توسط اتصال دیگری کوتاه شده باشد
+                remaining = thread_info['end'] - thread_info['start'] - thread_info['downloaded'] + 1
+                chunk = chunk[:remaining]
+                
+                await self._in_executor(self._write_chunk, item, fd, chunk, base_offset + thread_info['downloaded'],
+                                        thread_info['start'] + thread_info['downloaded'])
+                thread_info['downloaded'] += len(chunk)
+                if mirrors is not None:
+                    mirrors.add_bytes(url, len(chunk))
+                
+                if self.limits_active:
+                    delay = self._throttle_delay(item, len(chunk), url)
+                    if delay > 0:
+                        await self._sleep(delay, stop_event)
+                
+                if item.connections > item.connection_control.target and self._drop_connection(item, thread_info):
+                    return None
+                
+                if mirrors is not None and not mirrors.usable(url, time.time()):
+                    self._leave_mirror(item, thread_info)
+                    return None
             
+            if stop_event.is_set():
+                return False
+            if thread_info['downloaded'] < thread_info['end'] - thread_info['start'] + 1:
+                self._fail_segment(item, thread_info, "اتصال پیش از دریافت کامل بخش قطع شد")
+                return False
             return True
         
+        except requests.HTTPError as e:
+            if self._on_mirror_failed(item, thread_info, url, str(e), stop_event):
+                return None
+            if e.response is not None and e.response.status_code in (429, 503):
+                self._on_throttled(item, thread_info, e.response.status_code, e.response.headers.get('Retry-After'))
+                return None
+            self._fail_segment(item, thread_info, str(e))
+            print(f"خطا در دانلود بخش {thread_info['index']}: {str(e)}")
+            return False
+        
         except Exception as e:
-            item.status = "error"
-            item.error_message = f"خطا در ترکیب بخش‌ها: {str(e)}"
-            print(f"خطا در ترکیب بخش‌های دانلود {item.filename}: {str(e)}")
+            if self._on_mirror_failed(item, thread_info, url, str(e), stop_event):
+                return None
+            self._fail_segment(item, thread_info, str(e))
+            print(f"خطا در دانلود بخش {thread_info['index']}: {str(e)}")
             return False
+        
+        finally:
+            if response is not None:
+                response.close()
+            if fd is not None:
+                os.close(fd)
+            if mirrors is not None:
+                mirrors.release(url)
+            self._end_segment_write(item, thread_info, writer)
+
+
+def create_download_manager(config, update_callback=None):
+    """ساخت مدیر دانلود بر اساس موتور انتخاب شده در تنظیمات"""
+    if config.get("download_engine", "threads") == "asyncio":
+        return AsyncDownloadManager(config, update_callback)
+    return DownloadManager(config, update_callback)
+
+
+# معیارهای پایش به قالب متنی Prometheus
+METRICS_HELP = {
+    "bytes_received_total": ("counter", "Bytes received from servers"),
+    "http_responses_total": ("counter", "HTTP responses by status code"),
+    "retries_total": ("counter", "Retried requests by reason (connection, reconnect, throttled)"),
+    "downloads_finished_total": ("counter", "Finished download runs by final status"),
+    "downloads": ("gauge", "Downloads by status"),
+    "queue_length": ("gauge", "Downloads waiting in the queue"),
+    "active_connections": ("gauge", "Open transfer connections"),
+    "idle_connections": ("gauge", "Idle keep-alive connections in the asyncio engine pool"),
+    "download_speed_bytes": ("gauge", "Total download speed in bytes per second"),
+    "segment_duration_seconds": ("histogram", "Duration of each segment request"),
+    "queue_wait_seconds": ("histogram", "Time from queueing to start"),
+    "finalize_seconds": ("histogram", "Time to combine parts and finalize a multi-segment download"),
+    "scheduler_latency_seconds": ("histogram", "Time from dispatch until the transfer starts running"),
+    "digest_read_bytes_total": ("counter", "Bytes read back from disk to complete checksums not hashed while writing"),
+}
+
+
+def format_metrics(metrics):
+    """تبدیل خروجی get_metrics به قالب متنی Prometheus"""
+    def label_text(labels):
+        if not labels:
+            return ""
+        pairs = []
+        for name, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+    
+    lines = []
+    described = set()
+    
+    def describe(name):
+        if name not in described:
+            described.add(name)
+            metric_type, help_text = METRICS_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {METRICS_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} {metric_type}")
+    
+    for section in ("counters", "gauges"):
+        for (name, labels), value in sorted(metrics[section].items()):
+            describe(name)
+            lines.append(f"{METRICS_PREFIX}{name}{label_text(labels)} {value!r}")
+    
+    for name, histogram in sorted(metrics["histograms"].items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(METRICS_BUCKETS + ("+Inf",), histogram["buckets"]):
+            cumulative += count
+            le = bound if isinstance(bound, str) else f"{bound:g}"
+            lines.append(f'{METRICS_PREFIX}{name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{METRICS_PREFIX}{name}_sum {histogram['sum']!r}")
+        lines.append(f"{METRICS_PREFIX}{name}_count {histogram['count']}")
+    
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(manager, path):
+    """نوشتن معیارها در فایل (مثلاً برای textfile collector)؛ جایگزینی اتمی تا خواننده فایل نیمه‌کاره نبیند"""
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(format_metrics(manager.get_metrics()))
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"خطا در نوشتن فایل معیارها: {e}")
+
+
+def start_metrics_writer(manager, path, interval=METRICS_FILE_INTERVAL):
+    """نوشتن دوره‌ای فایل معیارها در نخ پس‌زمینه تا بسته شدن مدیر دانلود"""
+    def run():
+        while not manager.closing:
+            write_metrics_file(manager, path)
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=run, daemon=True, name="MetricsWriter")
+    thread.start()
+    return thread
+
+
+# API کنترل محلی
+CONTROL_EVENT_INTERVAL = 0.25  # ثانیه بین ارسال رویدادهای ادغام‌شده به مشترکان
+CONTROL_KEEPALIVE_INTERVAL = 15  # ثانیه؛ پیام خالی برای تشخیص اتصال‌های قطع‌شده
+CONTROL_SUBSCRIBER_BUFFER = 1024 * 1024  # مشترکی که بیش از این داده نخوانده مانده است قطع می‌شود
+CONTROL_MAX_BODY = 16 * 1024 * 1024  # حداکثر حجم بدنه درخواست (افزودن دسته‌ای)
+CONTROL_LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")  # نام میزبان بدون درگاه و کروشه IPv6
+
+HTTP_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+                404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+                415: "Unsupported Media Type", 500: "Internal Server Error"}
+
+
+class ControlError(Exception):
+    """خطای درخواست API کنترل با کد وضعیت HTTP"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def download_state(item):
+    """وضعیت قابل ارسال یک دانلود برای API کنترل"""
+    state = item.to_dict()
+    state["speed"] = item.speed
+    state["progress"] = round(item.progress, 1)
+    return state
+
+
+class ControlServer:
+    """API محلی HTTP/JSON برای افزودن و کنترل دانلودها و دریافت رویدادهای پیشرفت (SSE)
+    
+    همه اتصال‌ها روی یک حلقه رویداد در نخ جداگانه سرویس می‌شوند؛ هر مشترک رویدادها فقط یک
+    اتصال باز است و رویدادهای هر نوبت یک بار برای همه مشترکان کدگذاری می‌شوند.
+    فراخوانی‌های مدیر دانلود در نخ‌های کمکی اجرا می‌شوند تا قفل مدیر حلقه را متوقف نکند.
+    """
+    
+    def __init__(self, manager, host="127.0.0.1", port=0, token=""):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.token = token
+        self.events = UIUpdateBus()
+        self.subscribers = set()
+        self.connections = set()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        
+        # رویدادهای پیشرفت علاوه بر گیرنده قبلی (رابط کاربری یا خط فرمان) به این API هم می‌رسند
+        previous = manager.update_callback
+        
+        def publish(item):
+            if previous:
+                previous(item)
+            self.events.publish(item)
+        
+        manager.update_callback = publish
+        # افزودن و حذف دانلودها از هر مسیری (API، رابط کاربری یا خط فرمان) به مشترکان می‌رسد
+        manager.list_listeners.append(self.events)
+    
+    def start(self):
+        """راه‌اندازی سرور در نخ پس‌زمینه؛ خطای باز کردن درگاه (مثلاً درگاه اشغال) همین‌جا برمی‌گردد"""
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.broadcast_task = self.loop.create_task(self._broadcast())
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="ControlServer")
+        self.thread.start()
+    
+    def stop(self):
+        """بستن سرور و اتصال همه مشترکان"""
+        if self.loop is None:
+            return
+        if self.events in self.manager.list_listeners:
+            self.manager.list_listeners.remove(self.events)
+        
+        async def close():
+            self.server.close()
+            self.broadcast_task.cancel()
+            # بستن اتصال‌ها پردازشگر هر اتصال را با پایان خواندن خاتمه می‌دهد
+            for writer in list(self.connections):
+                writer.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if tasks:
+                await asyncio.wait(tasks, timeout=1)
+            self.loop.stop()
+        
+        asyncio.run_coroutine_threadsafe(close(), self.loop)
+        self.thread.join(5)
+        if not self.thread.is_alive():
+            self.loop.close()
+        self.loop = None
+    
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+    
+    async def _handle_connection(self, reader, writer):
+        """سرویس درخواست‌های یک اتصال keep-alive"""
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                header_lines = []
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    header_lines.append(line)
+                headers = http.client.parse_headers(BytesIO(b''.join(header_lines) + b'\r\n'))
+                
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._send(writer, 400, {"error": "خط درخواست نامعتبر"}, close=True)
+                    break
+                
+                length = int(headers.get("Content-Length") or 0)
+                if length > CONTROL_MAX_BODY:
+                    await self._send(writer, 413, {"error": "بدنه درخواست بیش از حد بزرگ است"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                
+                path, _, query = target.partition("?")
+                if method == "GET" and path == "/events":
+                    if self._authorize(headers) is None:
+                        await self._subscribe(reader, writer)
+                        return
+                
+                keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+                try:
+                    error = self._authorize(headers)
+                    if error:
+                        raise error
+                    status, result = await self.loop.run_in_executor(
+                        None, self._dispatch, method, path, urllib.parse.parse_qs(query), headers, body)
+                except ControlError as e:
+                    status, result = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, result = 500, {"error": str(e)}
+                await self._send(writer, status, result, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+    
+    def _authorize(self, headers):
+        """بررسی میزبان (در برابر DNS rebinding) و توکن؛ ControlError برمی‌گرداند یا None"""
+        # هدر Host ممکن است درگاه یا آدرس IPv6 داخل کروشه داشته باشد ([::1]:6801)
+        try:
+            host = urllib.parse.urlsplit("//" + headers.get("Host", "")).hostname
+        except ValueError:
+            host = None
+        if self.host in CONTROL_LOCAL_HOSTS and host not in CONTROL_LOCAL_HOSTS:
+            return ControlError(403, "فقط درخواست‌های محلی پذیرفته می‌شوند")
+        if self.token and headers.get("Authorization") != f"Bearer {self.token}":
+            return ControlError(401, "توکن نامعتبر است")
+        return None
+    
+    async def _send(self, writer, status, result, close=False):
+        # نتیجه متنی (معیارها) بدون تبدیل به JSON ارسال می‌شود
+        if isinstance(result, str):
+            body = result.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+    
+    async def _subscribe(self, reader, writer):
+        """ثبت یک مشترک رویدادها تا قطع اتصال از سمت کلاینت"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n: connected\n\n")
+        self.subscribers.add(writer)
+        try:
+            # کلاینت چیزی نمی‌فرستد؛ پایان خواندن یعنی قطع اتصال
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(writer)
+    
+    async def _broadcast(self):
+        """ارسال دوره‌ای آخرین وضعیت دانلودهای تغییرکرده به همه مشترکان"""
+        last_keepalive = time.monotonic()
+        while True:
+            await asyncio.sleep(CONTROL_EVENT_INTERVAL)
+            # دانلودهای تازه با آخرین وضعیت خود یک بار فرستاده می‌شوند
+            updated = {item.id: item for item in self.events.drain_added(len(self.events.added))}
+            updated.update((item.id, item) for item in self.events.drain())
+            removed = self.events.drain_removed()
+            if not self.subscribers:
+                continue
+            
+            events = [f"event: download\ndata: {json.dumps(download_state(item), ensure_ascii=False)}\n\n"
+                      for item in updated.values()]
+            events += [f"event: removed\ndata: {json.dumps({'id': download_id})}\n\n" for download_id in removed]
+            if events:
+                events.append(f"event: stats\ndata: {json.dumps(self.manager.get_stats())}\n\n")
+            elif time.monotonic() - last_keepalive >= CONTROL_KEEPALIVE_INTERVAL:
+                events.append(": keepalive\n\n")
+            else:
+                continue
+            last_keepalive = time.monotonic()
+            
+            payload = "".join(events).encode("utf-8")
+            for writer in list(self.subscribers):
+                # مشترک کند داده‌ها را انباشته نمی‌کند؛ با اتصال دوباره وضعیت را از /downloads می‌گیرد
+                if writer.is_closing() or writer.transport.get_write_buffer_size() > CONTROL_SUBSCRIBER_BUFFER:
+                    self.subscribers.discard(writer)
+                    writer.close()
+                    continue
+                writer.write(payload)
+    
+    def _dispatch(self, method, path, query, headers, body):
+        """اجرای یک درخواست غیر جریانی؛ (کد وضعیت، نتیجه) برمی‌گرداند"""
+        if method == "POST" and not headers.get("Content-Type", "").startswith("application/json"):
+            # فرم‌های صفحات وب بدون درخواست preflight نمی‌توانند این نوع محتوا را بفرستند
+            raise ControlError(415, "نوع محتوا باید application/json باشد")
+        data = {}
+        if body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise ControlError(400, "بدنه JSON نامعتبر است")
+            if not isinstance(data, dict):
+                raise ControlError(400, "بدنه باید یک شیء JSON باشد")
+        
+        parts = path.strip("/").split("/")
+        if parts == ["stats"] and method == "GET":
+            return 200, self.manager.get_stats()
+        if parts == ["metrics"] and method == "GET":
+            return 200, format_metrics(self.manager.get_metrics())
+        if parts == ["profile"]:
+            if method == "POST":
+                seconds = data.get("seconds", PROFILE_DEFAULT_SECONDS)
+                if not isinstance(seconds, (int, float)) or seconds <= 0:
+                    raise ControlError(400, "مدت پروفایل‌گیری باید عددی مثبت باشد")
+                if not PROFILER.start(seconds):
+                    raise ControlError(409, "پروفایل‌گیری دیگری در حال انجام است")
+            return 200, {"running": PROFILER.running, "result": PROFILER.result}
+        if parts[0] != "downloads" or len(parts) > 3:
+            raise ControlError(404, "مسیر یافت نشد")
+        
+        if len(parts) == 1:
+            if method == "GET":
+                statuses = query.get("status")
+                items = [item for item in self.manager.get_all_downloads()
+                         if not statuses or item.status in statuses]
+                return 200, {"downloads": [download_state(item) for item in items]}
+            if method == "POST":
+                return 201, self._add(data)
+            raise ControlError(405, "متد پشتیبانی نمی‌شود")
+        
+        download_id = parts[1]
+        item = self.manager.get_download(download_id)
+        if item is None:
+            raise ControlError(404, "دانلود یافت نشد")
+        
+        if len(parts) == 2:
+            if method == "GET":
+                return 200, download_state(item)
+            if method == "DELETE":
+                self.manager.remove_download(download_id)
+                return 200, {"ok": True}
+            raise ControlError(405, "متد پشتیبانی نمی‌شود")
+        
+        if method != "POST":
+            raise ControlError(405, "متد پشتیبانی نمی‌شود")
+        action = parts[2]
+        if action == "pause":
+            ok = self.manager.pause_download(download_id)
+        elif action == "resume":
+            ok = self.manager.resume_download(download_id)
+        elif action == "cancel":
+            ok = self.manager.cancel_download(download_id)
+        elif action == "top":
+            ok = self.manager.move_to_top(download_id)
+        elif action == "priority":
+            ok = self.manager.set_priority(download_id, self._priority(data))
+        else:
+            raise ControlError(404, "عملیات یافت نشد")
+        if not ok:
+            raise ControlError(409, f"عملیات {action} در وضعیت {item.status} ممکن نیست")
+        self.events.publish(item)
+        return 200, {"ok": True}
+    
+    def _priority(self, data):
+        priority = data.get("priority", PRIORITY_NORMAL)
+        if priority not in (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH, PRIORITY_URGENT):
+            raise ControlError(400, "اولویت باید عددی بین ۰ تا ۳ باشد")
+        return priority
+    
+    def _add(self, data):
+        """افزودن یک دانلود {"url": ...} یا دسته‌ای {"downloads": [...]} با یک بار گرفتن قفل"""
+        entries = data.get("downloads")
+        single = entries is None
+        if single:
+            entries = [data]
+        if not isinstance(entries, list) or not entries:
+            raise ControlError(400, "فهرست downloads خالی یا نامعتبر است")
+        
+        default_path = data.get("save_path") or self.manager.config["default_download_path"]
+        batch = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"url": entry}
+            url = entry.get("url") if isinstance(entry, dict) else None
+            if not isinstance(url, str) or urlparse(url).scheme not in ("http", "https"):
+                raise ControlError(400, f"آدرس نامعتبر: {url}")
+            save_path = os.path.abspath(os.path.expanduser(entry.get("save_path") or default_path))
+            checksum = entry.get("checksum") or None
+            if checksum is not None:
+                try:
+                    checksum = parse_checksum(str(checksum))
+                except ValueError as e:
+                    raise ControlError(400, str(e))
+            try:
+                mirrors = parse_mirrors(entry.get("mirrors"))
+            except ValueError as e:
+                raise ControlError(400, str(e))
+            batch.append((url, save_path, entry.get("filename") or None, None, checksum, mirrors))
+        
+        try:
+            for save_path in {entry[1] for entry in batch}:
+                os.makedirs(save_path, exist_ok=True)
+        except OSError as e:
+            raise ControlError(400, f"خطا در ایجاد پوشه ذخیره: {e}")
+        ids = self.manager.add_downloads(batch, self._priority(data))
+        for download_id in ids:
+            item = self.manager.get_download(download_id)
+            if item is not None:
+                self.events.publish(item)
+        return {"id": ids[0]} if single else {"ids": ids}
+
+
+def start_control_server(manager, config, port=None):
+    """راه‌اندازی API کنترل با تنظیمات control_api_*؛ در صورت خطا پیام چاپ و None برگردانده می‌شود"""
+    server = ControlServer(manager, config.get("control_api_host", "127.0.0.1"),
+                           port if port is not None else config.get("control_api_port", 6801),
+                           config.get("control_api_token", ""))
+    try:
+        server.start()
+    except OSError as e:
+        print(f"خطا در راه‌اندازی API کنترل: {e}")
+        return None
+    return server
 
 
 # توابع کمکی
@@ -679,6 +3931,76 @@ def format_size(size_bytes):
     
     return f"{s} {size_names[i]}"
 
+COPY_CHUNK_SIZE = 64 * 1024 * 1024  # حداکثر حجم هر فراخوانی کپی هسته‌ای
+COPY_BUFFER_SIZE = 1024 * 1024  # اندازه بافر روش جایگزین
+
+def copy_file_data(src_fd, dst_fd, count):
+    """کپی داده بین دو فایل از موقعیت فعلی هر دو؛ در صورت امکان بدون عبور از فضای کاربر"""
+    # copy_file_range و sendfile (لینوکس) داده را درون هسته جابه‌جا می‌کنند
+    for method in ("copy_file_range", "sendfile"):
+        if count <= 0 or not hasattr(os, method):
+            continue
+        try:
+            while count > 0:
+                if method == "copy_file_range":
+                    copied = os.copy_file_range(src_fd, dst_fd, min(count, COPY_CHUNK_SIZE))
+                else:
+                    copied = os.sendfile(dst_fd, src_fd, None, min(count, COPY_CHUNK_SIZE))
+                if copied == 0:
+                    break
+                count -= copied
+            return
+        except OSError as e:
+            # عدم پشتیبانی سیستم‌فایل یا هسته؛ ادامه با روش بعدی از همان موقعیت
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                               errno.EBADF, errno.ENOTSUP, errno.EPERM):
+                raise
+    
+    # روش جایگزین: حلقه با بافر ثابت، بدون خواندن کل فایل در حافظه
+    while count > 0:
+        data = os.read(src_fd, min(count, COPY_BUFFER_SIZE))
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.write(dst_fd, view)
+            view = view[written:]
+        count -= len(data)
+
+def move_file(src, dst):
+    """انتقال فایل؛ بین دو دیسک مختلف با کپی هسته‌ای و حذف مبدا"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    
+    flags = getattr(os, "O_BINARY", 0)
+    src_fd = os.open(src, os.O_RDONLY | flags)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | flags, 0o666)
+        try:
+            copy_file_data(src_fd, dst_fd, os.fstat(src_fd).st_size)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    os.remove(src)
+
+def write_at(fd, data, offset):
+    """نوشتن کامل داده در موقعیت مشخص یک فایل"""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # ویندوز: توصیف‌گر فایل مخصوص همین نخ است، پس جابه‌جایی اشاره‌گر امن است
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
 def format_speed(speed_bytes):
     """تبدیل سرعت به فرمت خوانا"""
     if speed_bytes < 1024:
@@ -704,6 +4026,7 @@ def format_time(seconds):
 
 def generate_gradient_image(width, height, start_color, end_color):
     """ایجاد تصویر با رنگ گرادیانت"""
+    from PIL import Image
     base = Image.new('RGBA', (width, height), start_color)
     top = Image.new('RGBA', (width, height), end_color)
     mask = Image.new('L', (width, height))
@@ -725,7 +4048,7 @@ class ShetabDaryaftApp:
         self.root = root
         
         # بارگذاری مستقیم فونت‌ها در ویندوز در ابتدای کار
-        self._load_fonts_directly()
+        register_windows_fonts()
         
         # تنظیمات اولیه پنجره
         self.root.title(APP_NAME)
@@ -733,7 +4056,7 @@ class ShetabDaryaftApp:
         self.root.minsize(800, 600)
         
         # بارگذاری تنظیمات
-        self.config = self._load_config()
+        self.config = load_config()
         
         # تنظیم رنگ‌های اصلی تم
         self.colors = self._setup_colors()
@@ -741,24 +4064,56 @@ class ShetabDaryaftApp:
         # تنظیم استایل‌های ttk
         self._setup_styles()
         
-        # ایجاد مدیر دانلود
-        self.download_manager = DownloadManager(self.config, self._update_download_ui)
+        # ایجاد مدیر دانلود؛ تغییرات دانلودها از نخ‌های کارگر فقط در صندوق پیام ثبت می‌شوند
+        self.ui_bus = UIUpdateBus()
+        self.download_manager = create_download_manager(self.config, self.ui_bus.publish)
+        # دانلودهای بازیابی‌شده یک بار و دانلودهای بعدی با هر افزودن به لیست می‌رسند
+        self.download_manager.list_listeners.append(self.ui_bus)
+        for item in self.download_manager.get_all_downloads():
+            self.ui_bus.publish_added(item)
+        STARTUP_PROFILE.mark("download manager")
         
         # متغیرهای عمومی
         self.selected_download_id = None
         self.download_items_ui = {}
+        self.import_progress = None  # وضعیت وارد کردن فهرست آدرس‌ها در پس‌زمینه
+        self.control_server = None
+        self.profiling = PROFILER.running  # نمایش نتیجه پروفایل پس از پایان آن
         
         # تنظیم فونت‌ها
         self._register_fonts()
+        STARTUP_PROFILE.mark("fonts")
         
         # ایجاد رابط کاربری
         self._create_widgets()
+        STARTUP_PROFILE.mark("widgets")
         
         # به‌روزرسانی دوره‌ای
         self._start_periodic_update()
+        self._drain_ui_updates()
         
         # ذخیره‌سازی تنظیمات هنگام خروج
         self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        
+        # کارهای سنگین پس از اولین رسم پنجره انجام می‌شوند
+        self.root.after_idle(self._start_deferred_loading)
+    
+    def _start_deferred_loading(self):
+        """پس از نمایش پنجره: بارگذاری ماژول‌های شبکه و تاریخچه در پس‌زمینه"""
+        STARTUP_PROFILE.mark("first paint")
+        
+        def load():
+            load_network_modules()
+            STARTUP_PROFILE.mark("network modules (deferred)")
+            self.download_manager.load_history()
+            STARTUP_PROFILE.mark("history (deferred)")
+            if self.config.get("control_api"):
+                self.control_server = start_control_server(self.download_manager, self.config)
+            if self.config.get("metrics_file"):
+                start_metrics_writer(self.download_manager, self.config["metrics_file"])
+            STARTUP_PROFILE.report()
+        
+        threading.Thread(target=load, daemon=True, name="DeferredStartup").start()
     
     def _setup_colors(self):
         """تنظیم رنگ‌های مورد استفاده در برنامه"""
@@ -842,41 +4197,18 @@ class ShetabDaryaftApp:
         style.configure("Treeview", background=self.colors["bg"], fieldbackground=self.colors["bg"], foreground=self.colors["text"])
         style.configure("Treeview.Heading", background=self.colors["primary"], foreground=self.colors["button_fg"])
         
-        # تنظیم استایل برای آیتم انتخاب شده
-        style.configure("Selected.TFrame", background=self.colors["secondary"])
+        # استایل لیست دانلودها
+        item_bg = self.colors.get("list_item_bg", self.colors["bg"])
+        style.configure("Downloads.Treeview", background=item_bg, fieldbackground=item_bg,
+                        foreground=self.colors["text"], rowheight=DOWNLOAD_ROW_HEIGHT)
+        style.map("Downloads.Treeview", background=[("selected", self.colors["secondary"])],
+                  foreground=[("selected", self.colors["button_fg"])])
         
-        # ذخیره استایل برای استفاده در جاهای دیگر
-        self.style = style
-    
-    def _load_fonts_directly(self):
-        """بارگذاری مستقیم فونت‌های فارسی در ویندوز"""
-        if os.name != "nt":
-            return
-            
-        try:
-            import ctypes
-            
-            # فونت‌های مورد نیاز
-            font_files = ["BYekan+.ttf", "BYekan+ Bold.ttf"]
-            
-            # بارگذاری هر فونت
-            for font_file in font_files:
-                font_path = os.path.join(FONT_DIR, font_file)
-                if not os.path.exists(font_path):
-                    continue
-                    
-                # بارگذاری فونت در ویندوز
-                try:
-                    result = ctypes.windll.gdi32.AddFontResourceW(font_path)
-                    print(f"فونت '{font_file}' با نتیجه {result} بارگذاری شد")
-                except Exception as e:
-                    print(f"خطا در بارگذاری فونت {font_file}: {e}")
-            
-            # اعلام تغییر فونت به سیستم
-            ctypes.windll.user32.SendMessageW(0xFFFF, 0x001D, 0, 0)  # WM_FONTCHANGE
-            
-        except Exception as e:
-            print(f"خطا در بارگذاری مستقیم فونت: {e}")
+        # تنظیم استایل برای آیتم انتخاب شده
+        style.configure("Selected.TFrame", background=self.colors["secondary"])
+        
+        # ذخیره استایل برای استفاده در جاهای دیگر
+        self.style = style
     
     def _register_fonts(self):
         """ثبت فونت‌های برنامه"""
@@ -886,35 +4218,8 @@ class ShetabDaryaftApp:
             # تعیین سایز فونت با اندازه بزرگتر
             font_size = self.config.get("font_size", 15)  # افزایش سایز بیشتر
             
-            # فایل‌های فونت
-            font_yekan = "BYekan+.ttf"
-            font_yekan_bold = "BYekan+ Bold.ttf"
-            
-            # مسیرهای کامل فونت‌ها
-            yekan_path = os.path.join(FONT_DIR, font_yekan)
-            yekan_bold_path = os.path.join(FONT_DIR, font_yekan_bold)
-            
-            # ثبت مستقیم فونت‌ها
-            print("در حال ثبت فونت‌ها در سیستم...")
-            
-            # ثبت اجباری فونت‌ها در ویندوز
-            if os.name == "nt":
-                try:
-                    # ثبت مستقیم فونت‌ها در ویندوز
-                    for path in [yekan_path, yekan_bold_path]:
-                        if os.path.exists(path):
-                            # ثبت فونت در سیستم
-                            result = ctypes.windll.gdi32.AddFontResourceW(path)
-                            print(f"نتیجه ثبت فونت {os.path.basename(path)}: {result}")
-                            
-                            # اطلاع‌رسانی تغییر فونت به سیستم
-                            ctypes.windll.user32.SendMessageW(0xFFFF, 0x001D, 0, 0)
-                except Exception as e:
-                    print(f"خطا در ثبت سیستمی فونت: {e}")
-            
-            print("در حال تلاش برای یافتن فونت‌ها در سیستم...")
-            available_fonts = sorted(list(tkfont.families()))
-            print(f"فونت‌های موجود: {available_fonts[:5]}... (و {len(available_fonts)-5} مورد دیگر)")
+            # فونت‌ها در ویندوز یک بار توسط register_windows_fonts ثبت شده‌اند؛ فهرست فونت‌های
+            # سیستم فقط با گزینه --font-info پیمایش می‌شود
             
             # روش مستقیم‌تر - استفاده از فونت با نام کامل
             font_family = "BYekan+"
@@ -955,21 +4260,7 @@ class ShetabDaryaftApp:
                 except Exception as e:
                     print(f"خطا در تنظیم استایل {style_name}: {e}")
             
-            # 3. تنظیم فونت برای همه ویجت‌های موجود
-            print("تنظیم فونت برای ویجت‌های موجود...")
-            def set_font_for_all_widgets(widget):
-                try:
-                    widget.configure(font=self.font_normal)
-                except:
-                    pass
-                    
-                # بازگشتی برای همه فرزندان
-                for child in widget.winfo_children():
-                    set_font_for_all_widgets(child)
-                    
-            # اجرای تابع برای همه ویجت‌ها
-            set_font_for_all_widgets(self.root)
-            
+            # ویجت‌ها بعد از این مرحله ساخته می‌شوند و فونت را از گزینه‌های پایه می‌گیرند
             print("ثبت فونت‌ها با موفقیت انجام شد")
             
         except Exception as e:
@@ -1139,6 +4430,18 @@ class ShetabDaryaftApp:
         self.remove_btn = tk.Button(toolbar_frame, text="🗑 حذف", command=self._remove_download, state="disabled", **toolbar_btn_style)
         self.remove_btn.pack(side="right", padx=5, pady=5)
         
+        # منوی اولویت و جایگاه در صف
+        self.priority_var = tk.IntVar(value=PRIORITY_NORMAL)
+        self.priority_btn = tk.Menubutton(toolbar_frame, text="⇅ اولویت", state="disabled", relief=tk.FLAT, **toolbar_btn_style)
+        priority_menu = tk.Menu(self.priority_btn, tearoff=0)
+        for priority in (PRIORITY_URGENT, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW):
+            priority_menu.add_radiobutton(label=self._get_priority_text(priority), value=priority,
+                                          variable=self.priority_var, command=self._set_priority)
+        priority_menu.add_separator()
+        priority_menu.add_command(label="انتقال به ابتدای صف", command=self._move_to_top)
+        self.priority_btn.config(menu=priority_menu)
+        self.priority_btn.pack(side="right", padx=5, pady=5)
+        
         # نمایشگر تعداد دانلودها
         self.download_count_label = tk.Label(toolbar_frame, text="تعداد دانلودها: 0", 
                                         font=self.font_normal, bg=self.colors["bg"],
@@ -1153,6 +4456,8 @@ class ShetabDaryaftApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="فایل", menu=file_menu)
         file_menu.add_command(label="دانلود جدید", command=self._show_new_download_dialog)
+        file_menu.add_command(label="وارد کردن فهرست آدرس‌ها", command=self._import_url_list)
+        file_menu.add_command(label="تاریخچه دانلودها", command=self._show_history_dialog)
         file_menu.add_separator()
         file_menu.add_command(label="تنظیمات", command=self._show_settings_dialog)
         file_menu.add_separator()
@@ -1174,24 +4479,35 @@ class ShetabDaryaftApp:
         content_container.add(details_frame, height=150)
         details_frame.pack_propagate(False)
         
-        # ایجاد اسکرول برای لیست دانلود‌ها
-        downloads_canvas = tk.Canvas(downloads_frame, bg=self.colors["bg"], highlightthickness=0)
-        scrollbar = ttk.Scrollbar(downloads_frame, orient="vertical", command=downloads_canvas.yview)
-        
-        self.downloads_scrollable_frame = tk.Frame(downloads_canvas, bg=self.colors["bg"])
-        self.downloads_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: downloads_canvas.configure(scrollregion=downloads_canvas.bbox("all"))
-        )
-        
-        downloads_canvas.create_window((0, 0), window=self.downloads_scrollable_frame, anchor="nw")
-        downloads_canvas.configure(yscrollcommand=scrollbar.set)
-        
-        # تغییر اندازه بوم با تغییر اندازه پنجره
-        downloads_frame.bind("<Configure>", lambda e: downloads_canvas.configure(width=e.width-20))
-        
-        downloads_canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        # لیست مجازی دانلودها: هر دانلود یک ردیف Treeview است و فقط ردیف‌های قابل مشاهده رسم می‌شوند
+        self.downloads_tree = ttk.Treeview(downloads_frame, style="Downloads.Treeview",
+                                           columns=("filename", "status", "progress", "info"),
+                                           displaycolumns=("info", "progress", "status", "filename"),
+                                           show="headings", selectmode="browse")
+        self.downloads_tree.heading("filename", text="نام فایل", anchor="e")
+        self.downloads_tree.heading("status", text="وضعیت", anchor="e")
+        self.downloads_tree.heading("progress", text="پیشرفت")
+        self.downloads_tree.heading("info", text="حجم و سرعت", anchor="w")
+        self.downloads_tree.column("filename", width=220, anchor="e")
+        self.downloads_tree.column("status", width=120, anchor="e", stretch=False)
+        self.downloads_tree.column("progress", width=190, anchor="center", stretch=False)
+        self.downloads_tree.column("info", width=220, anchor="w")
+        
+        # یک تگ مشترک برای هر وضعیت به جای یک استایل جداگانه برای هر دانلود
+        for status in DOWNLOAD_STATUSES:
+            self.downloads_tree.tag_configure(status, foreground=self._get_status_color(status))
+        item_bg = self.colors.get("list_item_bg", self.colors["bg"])
+        self.downloads_tree.tag_configure("hover", background=self.colors.get("list_item_hover", self._lighten_color(item_bg)))
+        
+        self.downloads_scrollbar = ttk.Scrollbar(downloads_frame, orient="vertical", command=self.downloads_tree.yview)
+        self.downloads_tree.configure(yscrollcommand=self._on_downloads_scroll)
+        
+        self.downloads_tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.downloads_tree.bind("<Motion>", self._on_tree_motion)
+        self.downloads_tree.bind("<Leave>", lambda e: self._set_hover_row(None))
+        
+        self.downloads_tree.pack(side="left", fill="both", expand=True)
+        self.downloads_scrollbar.pack(side="right", fill="y")
         
         # بخش جزئیات دانلود
         details_inner_frame = tk.Frame(details_frame, bg=self.colors["bg"], padx=10, pady=5)
@@ -1248,6 +4564,16 @@ class ShetabDaryaftApp:
         self.detail_elapsed = tk.Label(details_grid, text="-", **info_value_style)
         self.detail_elapsed.grid(row=4, column=0, sticky="w", padx=5)
         
+        # اتصال‌های فعال / هدف کنترل‌گر
+        tk.Label(details_grid, text="اتصال‌ها:", **info_label_style).grid(row=4, column=3, sticky="e", padx=5)
+        self.detail_connections = tk.Label(details_grid, text="-", **info_value_style)
+        self.detail_connections.grid(row=4, column=2, sticky="w", padx=5)
+        
+        # چکیده محاسبه‌شده یا مورد انتظار
+        tk.Label(details_grid, text="چک‌سام:", **info_label_style).grid(row=5, column=3, sticky="e", padx=5)
+        self.detail_checksum = tk.Label(details_grid, text="-", **info_value_style)
+        self.detail_checksum.grid(row=5, column=0, columnspan=3, sticky="w", padx=5)
+        
         # تنظیم وزن ستون‌ها
         for i in range(4):
             details_grid.columnconfigure(i, weight=1)
@@ -1264,8 +4590,10 @@ class ShetabDaryaftApp:
                                  font=(self.font_normal["family"], 9))
         self.status_label.pack(side="right", padx=10)
         
-        # ذخیره مرجع به لیست دانلودها برای به‌روزرسانی
+        # ذخیره مقادیر آخرین رسم هر ردیف برای جلوگیری از به‌روزرسانی تکراری
         self.download_items_ui = {}
+        self.hover_row = None
+        self.visible_refresh_pending = False
         
         # تنظیم اولیه
         self._update_download_items()
@@ -1274,201 +4602,107 @@ class ShetabDaryaftApp:
         for child in details_grid.winfo_children():
             if isinstance(child, tk.Label):
                 child.configure(justify="right")
-        
-        # تابع برای بروزرسانی آمار دانلود‌ها
-        self._update_download_stats()
-    
-    def _load_config(self):
-        """بارگذاری تنظیمات از فایل"""
-        if not os.path.exists(CONFIG_FILE):
-            # اگر فایل تنظیمات وجود ندارد، از تنظیمات پیش‌فرض استفاده کن
-            self._save_config(DEFAULT_CONFIG)
-            return DEFAULT_CONFIG
-        
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                # ادغام تنظیمات جدید از تنظیمات پیش‌فرض
-                for key, value in DEFAULT_CONFIG.items():
-                    if key not in config:
-                        config[key] = value
-                return config
-        except:
-            # در صورت خطا، از تنظیمات پیش‌فرض استفاده کن
-            self._save_config(DEFAULT_CONFIG)
-            return DEFAULT_CONFIG
-    
-    def _save_config(self, config):
-        """ذخیره تنظیمات در فایل"""
-        try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-            return True
-        except:
-            print("خطا در ذخیره‌سازی تنظیمات")
-            return False
     
     def _start_periodic_update(self):
-        """شروع به‌روزرسانی دوره‌ای رابط کاربری"""
+        """تنها تایمر دوره‌ای رابط کاربری: لیست، جزئیات، ساید بار و نوار وضعیت"""
         self._update_download_items()
         self._update_details()
+        self._update_download_stats()
         self.root.after(1000, self._start_periodic_update)
     
     def _update_download_items(self):
-        """به‌روزرسانی لیست دانلودها"""
-        # دریافت لیست دانلودها
-        downloads = self.download_manager.get_all_downloads()
-        
-        # به‌روزرسانی شمارنده دانلودها
-        self.download_count_label.config(text=f"تعداد دانلودها: {len(downloads)}")
-        
-        # یافتن شناسه‌های دانلودهای موجود
-        current_ids = set(item.id for item in downloads)
-        ui_ids = set(self.download_items_ui.keys())
-        
-        # حذف دانلودهایی که دیگر وجود ندارند
-        for dl_id in ui_ids - current_ids:
-            if dl_id in self.download_items_ui:
-                for widget in self.download_items_ui[dl_id]['widgets']:
-                    widget.destroy()
+        """همگام‌سازی ردیف‌های لیست با افزودن و حذف‌های صندوق پیام و رسم دوباره ردیف‌های قابل مشاهده؛
+        هزینه به تعداد تغییرها و اندازه پنجره بستگی دارد نه تعداد کل دانلودها"""
+        # حذف ردیف دانلودهایی که از مدیر دانلود حذف شده‌اند
+        removed_ids = [dl_id for dl_id in self.ui_bus.drain_removed() if dl_id in self.download_items_ui]
+        if removed_ids:
+            self.downloads_tree.delete(*removed_ids)
+            for dl_id in removed_ids:
                 del self.download_items_ui[dl_id]
+            if self.hover_row in removed_ids:
+                self.hover_row = None
         
-        # اضافه کردن دانلودهای جدید
-        row = 0
-        for item in downloads:
-            if item.id not in self.download_items_ui:
-                # ایجاد فریم جدید با طراحی مدرن
-                item_bg = self.colors.get("list_item_bg", self.colors["bg"])
-                
-                frame = tk.Frame(self.downloads_scrollable_frame, bg=item_bg, bd=1, 
-                              relief=tk.GROOVE, padx=10, pady=10)
-                frame.grid(row=row, column=0, sticky="ew", padx=5, pady=5, ipadx=5, ipady=5)
-                
-                # تنظیم گسترش افقی
-                self.downloads_scrollable_frame.columnconfigure(0, weight=1)
-                
-                # فریم اطلاعات فایل (بالا)
-                info_frame = tk.Frame(frame, bg=item_bg)
-                info_frame.pack(fill="x", expand=True)
-                
-                # آیکون وضعیت
-                status_icon = self._get_status_icon(item.status)
-                status_label = tk.Label(info_frame, text=status_icon, font=(self.font_bold[0], 18), 
-                                     bg=item_bg, fg=self._get_status_color(item.status),
-                                     padx=5)
-                status_label.pack(side="right")
-                
-                # نام فایل
-                filename_label = tk.Label(info_frame, text=item.filename, font=self.font_bold, 
-                                       bg=item_bg, fg=self.colors["text"],
-                                       anchor="w", padx=5)
-                filename_label.pack(side="right", fill="x", expand=True)
-                
-                # وضعیت
-                status_text_label = tk.Label(info_frame, text=self._get_status_text(item.status), 
-                                          bg=item_bg, fg=self._get_status_color(item.status),
-                                          font=self.font_normal, padx=5)
-                status_text_label.pack(side="left")
-                
-                # نوار پیشرفت
-                progress_frame = tk.Frame(frame, bg=item_bg, pady=5)
-                progress_frame.pack(fill="x", expand=True)
-                
-                # استفاده از ttk.Progressbar با استایل سفارشی
-                progress_height = 15  # افزایش ارتفاع نوار پیشرفت
-                progress_style = f"Custom{item.id}.Horizontal.TProgressbar"
-                
-                # تنظیم رنگ نوار پیشرفت بر اساس وضعیت
-                progress_color = self._get_progress_color(item.status)
-                self.style.configure(progress_style, background=progress_color, 
-                                 troughcolor=self.colors.get("progress_bg", "#f0f0f0"), 
-                                 borderwidth=0, thickness=progress_height)
-                
-                progress_bar = ttk.Progressbar(progress_frame, style=progress_style, 
-                                            value=item.progress, length=400)
-                progress_bar.pack(fill="x", expand=True, padx=5)
-                
-                # فریم اطلاعات اضافی (پایین)
-                details_frame = tk.Frame(frame, bg=item_bg)
-                details_frame.pack(fill="x", expand=True, pady=(5, 0))
-                
-                # سایز و سرعت - سمت راست
-                file_info = self._get_download_info_text(item)
-                info_label = tk.Label(details_frame, text=file_info, 
-                                   bg=item_bg, fg=self.colors["text"],
-                                   font=self.font_normal, anchor="w")
-                info_label.pack(side="right", padx=5)
-                
-                # افزودن رویدادهای کلیک
-                for widget in [frame, info_frame, progress_frame, details_frame, filename_label, 
-                            status_label, status_text_label, progress_bar, info_label]:
-                    widget.bind("<Button-1>", lambda e, id=item.id: self._select_download(id))
-                    # تغییر حالت نشانگر موس به دست
-                    widget.bind("<Enter>", lambda e, w=widget, bg=item_bg: self._on_item_enter(w, bg))
-                    widget.bind("<Leave>", lambda e, w=widget, bg=item_bg: self._on_item_leave(w, bg))
-                
-                # ذخیره اشاره‌گرها
-                self.download_items_ui[item.id] = {
-                    'widgets': [frame, info_frame, progress_frame, details_frame, filename_label, 
-                               status_label, status_text_label, progress_bar, info_label],
-                    'filename_label': filename_label,
-                    'status_label': status_label,
-                    'status_text_label': status_text_label,
-                    'progress_bar': progress_bar,
-                    'info_label': info_label,
-                    'frame': frame,
-                    'bg_color': item_bg
-                }
-                
-                row += 1
-            else:
-                # به‌روزرسانی آیتم‌های موجود
-                ui_item = self.download_items_ui[item.id]
-                
-                # به‌روزرسانی آیکون وضعیت
-                ui_item['status_label'].config(text=self._get_status_icon(item.status),
-                                          fg=self._get_status_color(item.status))
-                
-                # به‌روزرسانی متن وضعیت
-                ui_item['status_text_label'].config(text=self._get_status_text(item.status),
-                                               fg=self._get_status_color(item.status))
-                
-                # به‌روزرسانی نوار پیشرفت
-                ui_item['progress_bar'].config(value=item.progress)
-                
-                # به‌روزرسانی اطلاعات دانلود
-                ui_item['info_label'].config(text=self._get_download_info_text(item))
-                
-                # به‌روزرسانی رنگ نوار پیشرفت
-                progress_style = f"Custom{item.id}.Horizontal.TProgressbar"
-                progress_color = self._get_progress_color(item.status)
-                self.style.configure(progress_style, background=progress_color)
-                
-                if self.selected_download_id == item.id:
-                    # به‌روزرسانی جزئیات اگر این دانلود انتخاب شده است
-                    self._update_details()
+        # اضافه کردن ردیف دانلودهای جدید؛ پس از وارد کردن فهرست بزرگ ردیف‌ها در چند تیک اضافه می‌شوند
+        for item in self.ui_bus.drain_added(DOWNLOAD_ROWS_PER_TICK):
+            # دانلودی که پیش از رسیدن ردیفش حذف شده باشد اضافه نمی‌شود
+            if item.id not in self.download_items_ui and self.download_manager.get_download(item.id) is not None:
+                self._insert_download_row(item)
         
-        # به‌روزرسانی آمار دانلودها
-        self._update_download_stats()
+        self._refresh_visible_rows()
     
-    def _on_item_enter(self, widget, original_bg):
-        """رویداد هنگام ورود موس به آیتم دانلود"""
-        hover_bg = self.colors.get("list_item_hover", self._lighten_color(original_bg))
-        widget.configure(bg=hover_bg)
-        
-        # تغییر رنگ همه ویجت‌های داخلی که پس‌زمینه دارند
-        for child in widget.winfo_children():
-            if hasattr(child, 'configure') and 'bg' in child.config():
-                child.configure(bg=hover_bg)
+    def _insert_download_row(self, item):
+        """افزودن ردیف یک دانلود به انتهای لیست"""
+        values = self._get_download_row_values(item)
+        self.downloads_tree.insert("", "end", iid=item.id, values=values, tags=(item.status,))
+        self.download_items_ui[item.id] = (values, item.status)
     
-    def _on_item_leave(self, widget, original_bg):
-        """رویداد هنگام خروج موس از آیتم دانلود"""
-        widget.configure(bg=original_bg)
-        
-        # بازگرداندن رنگ همه ویجت‌های داخلی
-        for child in widget.winfo_children():
-            if hasattr(child, 'configure') and 'bg' in child.config():
-                child.configure(bg=original_bg)
+    def _get_download_row_values(self, item):
+        """مقادیر ستون‌های ردیف یک دانلود"""
+        return (item.filename,
+                f"{self._get_status_icon(item.status)} {self._get_status_text(item.status)}",
+                self._get_progress_text(item.progress),
+                self._get_download_info_text(item))
+    
+    def _get_progress_text(self, progress):
+        """نوار پیشرفت متنی برای ستون پیشرفت"""
+        filled = int(progress / 100 * PROGRESS_BAR_CELLS)
+        return f"{'█' * filled}{'░' * (PROGRESS_BAR_CELLS - filled)} {progress:5.1f}%"
+    
+    def _refresh_download_row(self, item):
+        """رسم دوباره ردیف یک دانلود در صورت تغییر مقادیر آن"""
+        values = self._get_download_row_values(item)
+        if self.download_items_ui.get(item.id) == (values, item.status):
+            return
+        self.download_items_ui[item.id] = (values, item.status)
+        self.downloads_tree.item(item.id, values=values, tags=self._get_row_tags(item.id))
+    
+    def _get_row_tags(self, download_id):
+        """تگ‌های ردیف: تگ مشترک وضعیت و در صورت نیاز تگ هاور"""
+        status = self.download_items_ui[download_id][1]
+        return (status, "hover") if download_id == self.hover_row else (status,)
+    
+    def _visible_rows(self):
+        """شناسه ردیف‌هایی که در حال حاضر در پنجره لیست دیده می‌شوند"""
+        rows = []
+        for y in range(DOWNLOAD_ROW_HEIGHT // 2, self.downloads_tree.winfo_height(), DOWNLOAD_ROW_HEIGHT):
+            row = str(self.downloads_tree.identify_row(y))
+            if row and row in self.download_items_ui and (not rows or rows[-1] != row):
+                rows.append(row)
+        return rows
+    
+    def _refresh_visible_rows(self):
+        """به‌روزرسانی ردیف‌های قابل مشاهده؛ هزینه به اندازه پنجره بستگی دارد نه تعداد دانلودها"""
+        self.visible_refresh_pending = False
+        for download_id in self._visible_rows():
+            item = self.download_manager.get_download(download_id)
+            if item:
+                self._refresh_download_row(item)
+    
+    def _on_downloads_scroll(self, first, last):
+        """به‌روزرسانی ردیف‌هایی که با اسکرول وارد پنجره شده‌اند"""
+        self.downloads_scrollbar.set(first, last)
+        if not self.visible_refresh_pending:
+            self.visible_refresh_pending = True
+            self.root.after_idle(self._refresh_visible_rows)
+    
+    def _on_tree_select(self, event):
+        """رویداد انتخاب ردیف در لیست دانلودها"""
+        selection = self.downloads_tree.selection()
+        if selection and str(selection[0]) != self.selected_download_id:
+            self._select_download(str(selection[0]))
+    
+    def _on_tree_motion(self, event):
+        """رویداد حرکت موس روی لیست دانلودها"""
+        self._set_hover_row(str(self.downloads_tree.identify_row(event.y)) or None)
+    
+    def _set_hover_row(self, download_id):
+        """جابه‌جایی تگ هاور بین ردیف‌ها"""
+        if download_id == self.hover_row:
+            return
+        previous, self.hover_row = self.hover_row, download_id
+        for row in (previous, download_id):
+            if row in self.download_items_ui:
+                self.downloads_tree.item(row, tags=self._get_row_tags(row))
     
     def _lighten_color(self, hex_color, factor=0.15):
         """روشن‌تر کردن رنگ برای حالت هاور"""
@@ -1506,18 +4740,6 @@ class ShetabDaryaftApp:
         }
         return colors.get(status, self.colors["text"])
     
-    def _get_progress_color(self, status):
-        """رنگ نوار پیشرفت بر اساس وضعیت"""
-        colors = {
-            "pending": self.colors.get("warning", "#ffc107"),
-            "downloading": self.colors.get("accent", "#00b8d4"),
-            "paused": self.colors.get("warning", "#ffc107"),
-            "completed": self.colors.get("success", "#28a745"),
-            "error": self.colors.get("danger", "#dc3545"),
-            "canceled": self.colors.get("danger", "#dc3545")
-        }
-        return colors.get(status, self.colors.get("progress_fg", "#00b8d4"))
-    
     def _get_status_text(self, status):
         """تبدیل وضعیت به متن فارسی"""
         status_texts = {
@@ -1600,11 +4822,31 @@ class ShetabDaryaftApp:
         # زمان سپری شده
         self.detail_elapsed.config(text=format_time(item.elapsed_time()))
         
+        # تعداد اتصال‌های دانلود چندبخشی
+        if item.status == "downloading" and item.connection_control:
+            control = item.connection_control
+            text = f"{item.connections} (هدف {control.target} از {control.maximum})"
+            mirrors = item.mirror_set
+            if mirrors is not None:
+                text += f" | منابع: {mirrors.usable_count(time.time())} از {len(mirrors.urls)}"
+            self.detail_connections.config(text=text)
+        else:
+            self.detail_connections.config(text="-")
+        
+        if item.checksum:
+            self.detail_checksum.config(text=item.checksum)
+        elif item.expected_checksum:
+            self.detail_checksum.config(text=f"{item.expected_checksum} (مورد انتظار)")
+        else:
+            self.detail_checksum.config(text="-")
+        
         # به‌روزرسانی دکمه‌ها
         self.pause_btn.config(state="normal" if item.status == "downloading" else "disabled")
         self.resume_btn.config(state="normal" if item.status == "paused" else "disabled")
         self.cancel_btn.config(state="normal" if item.status in ["downloading", "paused", "pending"] else "disabled")
         self.remove_btn.config(state="normal" if item.status in ["completed", "error", "canceled"] else "disabled")
+        self.priority_btn.config(state="normal" if item.status in ["downloading", "paused", "pending"] else "disabled")
+        self.priority_var.set(item.priority)
     
     def _clear_details(self):
         """پاکسازی پنل جزئیات"""
@@ -1617,45 +4859,31 @@ class ShetabDaryaftApp:
         self.detail_speed.config(text="-")
         self.detail_eta.config(text="-")
         self.detail_elapsed.config(text="-")
+        self.detail_connections.config(text="-")
+        self.detail_checksum.config(text="-")
         
         # غیرفعال کردن دکمه‌ها
         self.pause_btn.config(state="disabled")
         self.resume_btn.config(state="disabled")
         self.cancel_btn.config(state="disabled")
         self.remove_btn.config(state="disabled")
+        self.priority_btn.config(state="disabled")
     
     def _select_download(self, download_id):
         """انتخاب یک دانلود از لیست"""
-        # حذف حالت انتخاب قبلی
-        if self.selected_download_id and self.selected_download_id in self.download_items_ui:
-            ui_item = self.download_items_ui[self.selected_download_id]
-            bg_color = ui_item.get('bg_color', self.colors["bg"])
-            
-            # بازگرداندن رنگ همه ویجت‌ها به حالت عادی
-            for widget in ui_item['widgets']:
-                if hasattr(widget, 'configure') and 'bg' in widget.config():
-                    widget.configure(bg=bg_color)
-            
-            # حذف بوردر انتخاب
-            ui_item['frame'].configure(relief=tk.GROOVE, bd=1)
-        
-        # تنظیم دانلود جدید انتخاب شده
         self.selected_download_id = download_id
         
-        # تغییر ظاهر آیتم انتخاب شده
+        # دانلودی که تازه اضافه شده ممکن است هنوز ردیفی در لیست نداشته باشد (مثلاً پشت ردیف‌های یک فهرست بزرگ)
+        if download_id not in self.download_items_ui:
+            item = self.download_manager.get_download(download_id)
+            if item is not None:
+                self._insert_download_row(item)
+        
+        # هم‌راستا کردن انتخاب لیست با دانلود انتخاب شده
         if download_id in self.download_items_ui:
-            ui_item = self.download_items_ui[download_id]
-            
-            # تغییر رنگ پس‌زمینه به رنگ انتخاب
-            selected_bg = self.colors.get("secondary", self._lighten_color(ui_item.get('bg_color', self.colors["bg"]), 0.1))
-            
-            # اعمال رنگ انتخاب به همه ویجت‌ها
-            for widget in ui_item['widgets']:
-                if hasattr(widget, 'configure') and 'bg' in widget.config():
-                    widget.configure(bg=selected_bg)
-            
-            # افزایش برجستگی بوردر
-            ui_item['frame'].configure(relief=tk.RIDGE, bd=2)
+            if tuple(map(str, self.downloads_tree.selection())) != (download_id,):
+                self.downloads_tree.selection_set(download_id)
+            self.downloads_tree.see(download_id)
         
         # فعال/غیرفعال کردن دکمه‌های کنترل
         self._update_control_buttons()
@@ -1671,6 +4899,7 @@ class ShetabDaryaftApp:
             self.resume_btn.config(state="disabled")
             self.cancel_btn.config(state="disabled")
             self.remove_btn.config(state="disabled")
+            self.priority_btn.config(state="disabled")
             return
             
         # دریافت اطلاعات دانلود انتخاب شده
@@ -1687,6 +4916,30 @@ class ShetabDaryaftApp:
         self.resume_btn.config(state="normal" if item.status == "paused" else "disabled")
         self.cancel_btn.config(state="normal" if item.status in ["downloading", "paused", "pending"] else "disabled")
         self.remove_btn.config(state="normal" if item.status in ["completed", "error", "canceled"] else "disabled")
+        self.priority_btn.config(state="normal" if item.status in ["downloading", "paused", "pending"] else "disabled")
+        self.priority_var.set(item.priority)
+    
+    def _get_priority_text(self, priority):
+        """متن فارسی سطح اولویت"""
+        priority_texts = {
+            PRIORITY_LOW: "کم",
+            PRIORITY_NORMAL: "عادی",
+            PRIORITY_HIGH: "زیاد",
+            PRIORITY_URGENT: "فوری"
+        }
+        return priority_texts.get(priority, "عادی")
+    
+    def _set_priority(self):
+        """تغییر اولویت دانلود انتخاب شده"""
+        if self.selected_download_id:
+            self.download_manager.set_priority(self.selected_download_id, self.priority_var.get())
+            self._update_details()
+    
+    def _move_to_top(self):
+        """انتقال دانلود انتخاب شده به ابتدای صف"""
+        if self.selected_download_id:
+            if not self.download_manager.move_to_top(self.selected_download_id):
+                messagebox.showinfo("صف دانلود", "این دانلود در صف انتظار نیست.")
     
     def _pause_download(self):
         """توقف موقت دانلود انتخاب شده"""
@@ -1720,7 +4973,7 @@ class ShetabDaryaftApp:
         """نمایش دیالوگ دانلود جدید"""
         dialog = tk.Toplevel(self.root)
         dialog.title("دانلود جدید")
-        dialog.geometry("500x250")
+        dialog.geometry("500x330")
         dialog.resizable(False, False)
         dialog.transient(self.root)
         dialog.grab_set()
@@ -1762,9 +5015,19 @@ class ShetabDaryaftApp:
         filename_entry = tk.Entry(main_frame, textvariable=filename_var, width=50, **entry_style)
         filename_entry.grid(row=2, column=0, sticky="w", padx=5, pady=5)
         
+        tk.Label(main_frame, text="چک‌سام (اختیاری):", **label_style).grid(row=3, column=1, sticky="e", padx=5, pady=5)
+        checksum_var = tk.StringVar()
+        checksum_entry = tk.Entry(main_frame, textvariable=checksum_var, width=50, **entry_style)
+        checksum_entry.grid(row=3, column=0, sticky="w", padx=5, pady=5)
+        
+        tk.Label(main_frame, text="آینه‌ها (اختیاری):", **label_style).grid(row=4, column=1, sticky="e", padx=5, pady=5)
+        mirrors_var = tk.StringVar()
+        mirrors_entry = tk.Entry(main_frame, textvariable=mirrors_var, width=50, **entry_style)
+        mirrors_entry.grid(row=4, column=0, sticky="w", padx=5, pady=5)
+        
         # فریم دکمه‌ها
         button_frame = tk.Frame(main_frame, bg=self.colors["bg"])
-        button_frame.grid(row=3, column=0, columnspan=2, pady=10)
+        button_frame.grid(row=5, column=0, columnspan=2, pady=10)
         
         # استایل دکمه‌ها
         button_style = {"bg": self.colors["button_bg"], "fg": self.colors["button_fg"], 
@@ -1777,7 +5040,8 @@ class ShetabDaryaftApp:
         
         # دکمه دانلود
         download_btn = tk.Button(button_frame, text="شروع دانلود", 
-                               command=lambda: self._start_new_download(url_var.get(), save_path_var.get(), filename_var.get(), dialog),
+                               command=lambda: self._start_new_download(url_var.get(), save_path_var.get(), filename_var.get(), dialog,
+                                                                         checksum_var.get(), mirrors_var.get()),
                                **button_style)
         download_btn.pack(side="right", padx=5)
         
@@ -1796,7 +5060,7 @@ class ShetabDaryaftApp:
         if directory:
             path_var.set(directory)
     
-    def _start_new_download(self, url, save_path, filename, dialog=None):
+    def _start_new_download(self, url, save_path, filename, dialog=None, checksum="", mirrors=""):
         """شروع یک دانلود جدید"""
         # بررسی ورودی‌ها
         if not url or not url.strip():
@@ -1807,17 +5071,32 @@ class ShetabDaryaftApp:
             messagebox.showerror("خطا", "مسیر ذخیره نامعتبر است.")
             return
         
+        if checksum.strip():
+            try:
+                checksum = parse_checksum(checksum)
+            except ValueError as e:
+                messagebox.showerror("خطا", str(e))
+                return
+        
+        # آینه‌ها با فاصله از هم جدا می‌شوند
+        try:
+            mirrors = parse_mirrors(mirrors)
+        except ValueError as e:
+            messagebox.showerror("خطا", str(e))
+            return
+        
         # افزودن پروتکل اگر ندارد
         if not url.startswith(('http://', 'https://')):
             url = 'http://' + url
         
         try:
             # افزودن دانلود جدید
-            download_id = self.download_manager.add_download(url, save_path, filename)
+            download_id = self.download_manager.add_download(url, save_path, filename, checksum=checksum.strip() or None,
+                                                             mirrors=mirrors)
             
             # ذخیره مسیر پیش‌فرض جدید
             self.config["default_download_path"] = save_path
-            self._save_config(self.config)
+            save_config(self.config)
             
             # بستن دیالوگ در صورت وجود
             if dialog:
@@ -1935,6 +5214,45 @@ class ShetabDaryaftApp:
                                   font=self.font_normal)
         auto_check.pack(anchor="w", pady=5)
         
+        # فریم محدودیت سرعت
+        limit_frame = tk.LabelFrame(main_frame, text="محدودیت سرعت (کیلوبایت بر ثانیه، صفر یعنی بدون محدودیت)", 
+                                  bg=self.colors["bg"], 
+                                  fg=self.colors["text"],
+                                  font=self.font_bold,
+                                  padx=10, pady=10)
+        limit_frame.pack(fill="x", pady=10)
+        
+        limit_grid = tk.Frame(limit_frame, bg=self.colors["bg"])
+        limit_grid.pack(fill="x", pady=5)
+        
+        # محدودیت کل
+        tk.Label(limit_grid, text="کل برنامه:", 
+              bg=self.colors["bg"], fg=self.colors["text"],
+              font=self.font_normal).grid(row=0, column=1, sticky="e", padx=5, pady=5)
+        
+        global_limit = tk.StringVar(value=str(self.config.get("global_speed_limit", 0)))
+        tk.Entry(limit_grid, textvariable=global_limit, width=8, 
+              font=self.font_normal).grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        
+        # محدودیت هر دانلود
+        tk.Label(limit_grid, text="هر دانلود:", 
+              bg=self.colors["bg"], fg=self.colors["text"],
+              font=self.font_normal).grid(row=1, column=1, sticky="e", padx=5, pady=5)
+        
+        download_limit = tk.StringVar(value=str(self.config.get("download_speed_limit", 0)))
+        tk.Entry(limit_grid, textvariable=download_limit, width=8, 
+              font=self.font_normal).grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        
+        # محدودیت میزبان‌ها به شکل host=limit
+        tk.Label(limit_grid, text="میزبان‌ها (host=limit):", 
+              bg=self.colors["bg"], fg=self.colors["text"],
+              font=self.font_normal).grid(row=2, column=1, sticky="e", padx=5, pady=5)
+        
+        host_limits = tk.StringVar(value=", ".join(
+            f"{host}={limit}" for host, limit in self.config.get("host_speed_limits", {}).items()))
+        tk.Entry(limit_grid, textvariable=host_limits, width=20, 
+              font=self.font_normal).grid(row=2, column=0, sticky="w", padx=5, pady=5)
+        
         # فریم تنظیمات ظاهری
         appearance_frame = tk.LabelFrame(main_frame, text="تنظیمات ظاهری", 
                                       bg=self.colors["bg"], 
@@ -1980,6 +5298,29 @@ class ShetabDaryaftApp:
                                  font=self.font_normal)
         tray_check.pack(anchor="w", pady=5)
         
+        # پروفایل‌گیری برای بررسی کندی دانلودها یا رابط کاربری
+        debug_frame = tk.LabelFrame(main_frame, text="عیب‌یابی", 
+                                 bg=self.colors["bg"], 
+                                 fg=self.colors["text"],
+                                 font=self.font_bold,
+                                 padx=10, pady=10)
+        debug_frame.pack(fill="x", pady=10)
+        
+        tk.Label(debug_frame, text="مدت پروفایل‌گیری (ثانیه):", 
+              bg=self.colors["bg"], fg=self.colors["text"],
+              font=self.font_normal).grid(row=0, column=1, sticky="e", padx=5, pady=5)
+        
+        profile_seconds = tk.StringVar(value=str(PROFILE_DEFAULT_SECONDS))
+        tk.Spinbox(debug_frame, from_=5, to=600, textvariable=profile_seconds, 
+                width=5, font=self.font_normal).grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        
+        profile_btn = tk.Button(debug_frame, 
+                             text="توقف پروفایل‌گیری" if PROFILER.running else "شروع پروفایل‌گیری",
+                             bg=self.colors["button_bg"], fg=self.colors["button_fg"],
+                             font=self.font_normal)
+        profile_btn.config(command=lambda: self._toggle_profiling(profile_seconds.get(), profile_btn))
+        profile_btn.grid(row=1, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        
         # دکمه‌های ذخیره/انصراف
         button_frame = tk.Frame(main_frame, bg=self.colors["bg"], pady=10)
         button_frame.pack(fill="x")
@@ -2000,6 +5341,9 @@ class ShetabDaryaftApp:
                               auto_start.get(),
                               font_size.get(),
                               tray_icon.get(),
+                              global_limit.get(),
+                              download_limit.get(),
+                              host_limits.get(),
                               dialog
                           ),
                           bg=self.colors["button_bg"], 
@@ -2014,21 +5358,28 @@ class ShetabDaryaftApp:
                             **button_style)
         cancel_btn.pack(side="right", padx=5)
         
-        # مرکزی کردن دیالوگ
+        # مرکزی کردن دیالوگ؛ اندازه از محتوا گرفته می‌شود تا دکمه‌ها بیرون از پنجره نمانند
         dialog.update_idletasks()
-        width = dialog.winfo_width()
-        height = dialog.winfo_height()
+        width = max(dialog.winfo_width(), dialog.winfo_reqwidth())
+        height = max(dialog.winfo_height(), dialog.winfo_reqheight())
         x = (self.root.winfo_width() // 2) - (width // 2) + self.root.winfo_x()
         y = (self.root.winfo_height() // 2) - (height // 2) + self.root.winfo_y()
         dialog.geometry(f"{width}x{height}+{x}+{y}")
     
-    def _save_settings(self, default_path, concurrent_downloads, threads_per_download, multithreaded, theme, auto_start, font_size, tray_icon, dialog):
+    def _save_settings(self, default_path, concurrent_downloads, threads_per_download, multithreaded, theme, auto_start, font_size, tray_icon, global_limit, download_limit, host_limits, dialog):
         """ذخیره تنظیمات جدید"""
         try:
             # بررسی صحت ورودی‌ها
             concurrent_downloads = int(concurrent_downloads)
             threads_per_download = int(threads_per_download)
             font_size = int(font_size)
+            global_limit = max(0, int(global_limit or 0))
+            download_limit = max(0, int(download_limit or 0))
+            host_speed_limits = {}
+            for entry in host_limits.split(","):
+                if entry.strip():
+                    host, limit = entry.split("=")
+                    host_speed_limits[host.strip().lower()] = max(0, int(limit))
             
             # بررسی محدودیت‌ها
             if concurrent_downloads < 1:
@@ -2055,9 +5406,15 @@ class ShetabDaryaftApp:
             self.config["auto_start_download"] = auto_start
             self.config["font_size"] = font_size
             self.config["tray_icon_enabled"] = tray_icon
+            self.config["global_speed_limit"] = global_limit
+            self.config["download_speed_limit"] = download_limit
+            self.config["host_speed_limits"] = host_speed_limits
+            
+            # محدودیت‌های سرعت بدون نیاز به راه‌اندازی مجدد اعمال می‌شوند
+            self.download_manager.apply_speed_limits()
             
             # ذخیره تنظیمات
-            saved = self._save_config(self.config)
+            saved = save_config(self.config)
             
             if saved:
                 messagebox.showinfo("ذخیره تنظیمات", "تنظیمات با موفقیت ذخیره شد.\nبرخی تنظیمات پس از راه‌اندازی مجدد برنامه اعمال می‌شوند.")
@@ -2079,6 +5436,184 @@ class ShetabDaryaftApp:
         except Exception as e:
             messagebox.showerror("خطا", f"خطا در ذخیره تنظیمات: {str(e)}")
     
+    def _toggle_profiling(self, seconds, button):
+        """شروع یا توقف پروفایل‌گیری؛ نتیجه پس از پایان در به‌روزرسانی دوره‌ای نمایش داده می‌شود"""
+        if PROFILER.running:
+            PROFILER.stop()
+            button.config(text="شروع پروفایل‌گیری")
+            return
+        
+        try:
+            seconds = float(seconds)
+        except ValueError:
+            messagebox.showerror("خطا", "مدت پروفایل‌گیری باید عدد باشد")
+            return
+        
+        PROFILER.start(seconds)
+        self.profiling = True
+        button.config(text="توقف پروفایل‌گیری")
+    
+    def _show_profile_result(self):
+        """نمایش مسیر فایل پروفایل پس از پایان پروفایل‌گیری"""
+        self.profiling = False
+        result = PROFILER.result or {}
+        if "error" in result:
+            messagebox.showerror("خطا", f"خطا در ذخیره پروفایل: {result['error']}")
+            return
+        threads = "\n".join(f"{name}: {count}" for name, count in
+                            sorted(result.get("threads", {}).items(), key=lambda entry: -entry[1]))
+        messagebox.showinfo("پروفایل‌گیری",
+                            f"{result.get('samples', 0)} نمونه در فایل زیر ذخیره شد:\n{result.get('path')}\n\n{threads}")
+    
+    def _import_url_list(self):
+        """وارد کردن فهرست آدرس‌ها از فایل متنی، CSV یا JSONL در پس‌زمینه"""
+        if self.import_progress is not None:
+            messagebox.showinfo("وارد کردن فهرست", "وارد کردن فهرست قبلی هنوز در حال انجام است")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="انتخاب فهرست آدرس‌ها",
+            filetypes=[("فهرست آدرس‌ها", "*.txt *.csv *.jsonl *.ndjson"), ("همه فایل‌ها", "*.*")])
+        if not path:
+            return
+        save_path = filedialog.askdirectory(title="انتخاب پوشه ذخیره",
+                                            initialdir=self.config["default_download_path"])
+        if not save_path:
+            return
+        
+        progress = {"read": 0, "added": 0, "duplicates": 0, "invalid": 0, "probe_failed": 0, "done": False}
+        self.import_progress = progress
+        
+        def on_batch(result, ids):
+            progress.update(result)
+        
+        def run():
+            try:
+                progress.update(self.download_manager.import_urls(iter_url_list(path), save_path, on_batch=on_batch))
+            except (OSError, ValueError) as e:
+                progress["error"] = str(e)
+            progress["done"] = True
+        
+        threading.Thread(target=run, daemon=True, name="UrlImport").start()
+        self.status_label.config(text="در حال وارد کردن فهرست آدرس‌ها...")
+    
+    def _update_import_status(self):
+        """نمایش پیشرفت وارد کردن فهرست در نوار وضعیت و خلاصه نهایی پس از پایان"""
+        progress = dict(self.import_progress)
+        if not progress["done"]:
+            self.status_label.config(
+                text=f"وارد کردن فهرست: {progress['added']} افزوده از {progress['read']} خوانده‌شده")
+            return
+        
+        self.import_progress = None
+        if "error" in progress:
+            messagebox.showerror("خطا", f"خطا در خواندن فهرست آدرس‌ها: {progress['error']}")
+            return
+        messagebox.showinfo("وارد کردن فهرست",
+                            f"خوانده‌شده: {progress['read']}\n"
+                            f"افزوده‌شده: {progress['added']}\n"
+                            f"تکراری: {progress['duplicates']}\n"
+                            f"نامعتبر: {progress['invalid']}\n"
+                            f"بدون پاسخ بررسی اولیه: {progress['probe_failed']}")
+    
+    def _show_history_dialog(self):
+        """نمایش تاریخچه دانلودها به صورت صفحه‌بندی‌شده با جستجو و فیلتر وضعیت"""
+        # رکوردهای در انتظار ثبت هم در نتیجه دیده شوند
+        self.download_manager.save_history()
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("تاریخچه دانلودها")
+        dialog.geometry("750x450")
+        dialog.transient(self.root)
+        dialog.configure(bg=self.colors["bg"])
+        
+        # فریم اصلی
+        main_frame = tk.Frame(dialog, bg=self.colors["bg"], padx=10, pady=10)
+        main_frame.pack(fill="both", expand=True)
+        
+        label_style = {"bg": self.colors["bg"], "fg": self.colors["text"], "font": self.font_normal}
+        button_style = {"bg": self.colors["button_bg"], "fg": self.colors["button_fg"], 
+                       "activebackground": self.colors["button_active"], "font": self.font_normal,
+                       "relief": tk.RAISED, "bd": 1, "padx": 10, "pady": 2}
+        
+        # فیلترها
+        filter_frame = tk.Frame(main_frame, bg=self.colors["bg"])
+        filter_frame.pack(fill="x", pady=(0, 5))
+        
+        tk.Label(filter_frame, text="جستجو:", **label_style).pack(side="right", padx=5)
+        search_var = tk.StringVar()
+        search_entry = ttk.Entry(filter_frame, textvariable=search_var, width=30)
+        search_entry.pack(side="right", padx=5)
+        
+        tk.Label(filter_frame, text="وضعیت:", **label_style).pack(side="right", padx=5)
+        status_options = {"همه": None}
+        status_options.update((self._get_status_text(status), status) for status in DOWNLOAD_STATUSES)
+        status_var = tk.StringVar(value="همه")
+        ttk.Combobox(filter_frame, textvariable=status_var, values=list(status_options),
+                     state="readonly", width=12).pack(side="right", padx=5)
+        
+        # جدول تاریخچه
+        tree_frame = tk.Frame(main_frame, bg=self.colors["bg"])
+        tree_frame.pack(fill="both", expand=True)
+        tree = ttk.Treeview(tree_frame, columns=("filename", "status", "size", "date", "url"),
+                            displaycolumns=("url", "date", "size", "status", "filename"), show="headings")
+        for column, title, width in (("filename", "نام فایل", 180), ("status", "وضعیت", 90), ("size", "سایز", 90),
+                                     ("date", "تاریخ", 130), ("url", "لینک", 240)):
+            tree.heading(column, text=title)
+            tree.column(column, width=width, anchor="e" if column != "url" else "w")
+        for status in DOWNLOAD_STATUSES:
+            tree.tag_configure(status, foreground=self._get_status_color(status))
+        tree_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=tree_scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        tree_scrollbar.pack(side="right", fill="y")
+        
+        # صفحه‌بندی
+        nav_frame = tk.Frame(main_frame, bg=self.colors["bg"])
+        nav_frame.pack(fill="x", pady=(5, 0))
+        next_btn = tk.Button(nav_frame, text="بعدی", **button_style)
+        next_btn.pack(side="left", padx=5)
+        page_label = tk.Label(nav_frame, **label_style)
+        page_label.pack(side="left", expand=True)
+        prev_btn = tk.Button(nav_frame, text="قبلی", **button_style)
+        prev_btn.pack(side="right", padx=5)
+        
+        page = {"offset": 0}
+        
+        def load_page():
+            filters = {"status": status_options[status_var.get()], "search": search_var.get().strip() or None}
+            total = self.download_manager.count_history(**filters)
+            records = self.download_manager.query_history(HISTORY_PAGE_SIZE, page["offset"], **filters)
+            
+            tree.delete(*tree.get_children())
+            for record in records:
+                date = (datetime.datetime.fromtimestamp(record["end_time"]).strftime("%Y/%m/%d %H:%M")
+                        if record["end_time"] else "-")
+                tree.insert("", "end", tags=(record["status"],),
+                            values=(record["filename"], self._get_status_text(record["status"]),
+                                    format_size(record["size"] or 0), date, record["url"]))
+            
+            pages = max(1, math.ceil(total / HISTORY_PAGE_SIZE))
+            page_label.config(text=f"صفحه {page['offset'] // HISTORY_PAGE_SIZE + 1} از {pages} ({total} مورد)")
+            prev_btn.config(state="normal" if page["offset"] > 0 else "disabled")
+            next_btn.config(state="normal" if page["offset"] + HISTORY_PAGE_SIZE < total else "disabled")
+        
+        def change_page(step):
+            page["offset"] = max(0, page["offset"] + step * HISTORY_PAGE_SIZE)
+            load_page()
+        
+        def apply_filters(*args):
+            page["offset"] = 0
+            load_page()
+        
+        prev_btn.config(command=lambda: change_page(-1))
+        next_btn.config(command=lambda: change_page(1))
+        status_var.trace_add("write", apply_filters)
+        search_entry.bind("<Return>", apply_filters)
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        
+        load_page()
+    
     def _show_about_dialog(self):
         """نمایش دیالوگ درباره برنامه"""
         dialog = tk.Toplevel(self.root)
@@ -2143,14 +5678,19 @@ class ShetabDaryaftApp:
         
         dialog.bind("<Escape>", lambda e: dialog.destroy())
     
+    def _drain_ui_updates(self):
+        """تخلیه صندوق پیام مدیر دانلود در نخ اصلی Tk؛ هر دانلود حداکثر یک بار در هر نوبت"""
+        for item in self.ui_bus.drain():
+            self._update_download_ui(item)
+        
+        interval = int(1000 / max(1, self.config.get("ui_updates_per_second", 4)))
+        self.root.after(interval, self._drain_ui_updates)
+    
     def _update_download_ui(self, item):
-        """کالبک برای به‌روزرسانی UI با تغییرات دانلود"""
-        # به‌روزرسانی المان‌های UI مربوط به این دانلود
-        if item.id in self.download_items_ui:
-            ui_item = self.download_items_ui[item.id]
-            ui_item['status_label'].config(text=self._get_status_text(item.status))
-            ui_item['progress_bar'].config(value=item.progress)
-            ui_item['info_label'].config(text=self._get_download_info_text(item))
+        """به‌روزرسانی UI با تغییرات یک دانلود؛ فقط از نخ اصلی Tk فراخوانی می‌شود"""
+        # ردیف‌های خارج از پنجره هنگام اسکرول به آن‌ها به‌روز می‌شوند
+        if item.id in self.download_items_ui and self.downloads_tree.bbox(item.id):
+            self._refresh_download_row(item)
         
         # به‌روزرسانی پنل جزئیات اگر این دانلود انتخاب شده است
         if self.selected_download_id == item.id:
@@ -2164,92 +5704,345 @@ class ShetabDaryaftApp:
                                       f"{len(active_downloads)} دانلود در حال انجام وجود دارد. آیا مایل به خروج هستید؟"):
             return
         
-        # ذخیره تاریخچه دانلودها
-        self.download_manager.save_history()
+        # توقف دانلودها برای ادامه در اجرای بعدی و ذخیره تاریخچه
+        if self.control_server is not None:
+            self.control_server.stop()
+        self.download_manager.shutdown()
         self.root.destroy()
     
     def _update_download_stats(self):
-        """به‌روزرسانی آمار دانلودها در ساید بار"""
-        downloads = self.download_manager.get_all_downloads()
+        """به‌روزرسانی آمار دانلودها در ساید بار و نوار وضعیت از روی آمار مدیر دانلود"""
+        stats = self.download_manager.get_stats()
+        counts = stats["counts"]
         
-        # شمارش وضعیت‌های مختلف
-        active_count = sum(1 for item in downloads if item.status == "downloading")
-        completed_count = sum(1 for item in downloads if item.status == "completed")
-        paused_count = sum(1 for item in downloads if item.status == "paused")
-        error_count = sum(1 for item in downloads if item.status == "error" or item.status == "canceled")
+        active_count = counts["downloading"]
+        completed_count = counts["completed"]
+        paused_count = counts["paused"]
+        error_count = counts["error"] + counts["canceled"]
         
         # به‌روزرسانی برچسب‌های آمار
+        self.download_count_label.config(text=f"تعداد دانلودها: {stats['total']}")
         self.active_count_label.config(text=f"در حال دانلود: {active_count}")
         self.completed_count_label.config(text=f"تکمیل شده: {completed_count}")
         self.paused_count_label.config(text=f"متوقف شده: {paused_count}")
         self.error_count_label.config(text=f"خطا: {error_count}")
         
+        if self.profiling and not PROFILER.running:
+            self._show_profile_result()
+        
         # به‌روزرسانی وضعیت در نوار وضعیت
-        if active_count > 0:
-            self.status_label.config(text=f"در حال دانلود {active_count} فایل")
-        elif len(downloads) == 0:
+        if self.import_progress is not None:
+            self._update_import_status()
+        elif active_count > 0:
+            self.status_label.config(text=f"در حال دانلود {active_count} فایل - {format_speed(stats['speed'])}")
+        elif stats["total"] == 0:
             self.status_label.config(text="آماده برای دانلود")
         else:
             self.status_label.config(text=f"تکمیل شده: {completed_count} | خطا: {error_count}")
-        
-        # فراخوانی مجدد برای بروزرسانی بعدی بعد از ۲ ثانیه
-        self.root.after(2000, self._update_download_stats)
 
 
-# اجرای اصلی برنامه
-if __name__ == "__main__":
-    # بارگذاری ماژول مورد نیاز برای فونت
-    import tkinter.font as tkfont
-    import ctypes
-    from ctypes import WinDLL
+# اجرای بدون رابط گرافیکی
+EXIT_OK = 0
+EXIT_FAILED = 1  # حداقل یک دانلود با خطا یا لغو تمام شد
+EXIT_INTERRUPTED = 130  # توقف با Ctrl+C یا SIGTERM؛ دانلودها در اجرای بعدی ادامه می‌یابند
+CLI_REFRESH_INTERVAL = 0.5  # ثانیه بین به‌روزرسانی‌های خط وضعیت
+CLI_LOG_INTERVAL = 5  # ثانیه بین خطوط وضعیت وقتی خروجی ترمینال نیست
+FINISHED_STATUSES = ("completed", "error", "canceled")
+
+
+class TerminalStatus:
+    """خط وضعیت ترمینال؛ وقتی خروجی به فایل یا لاگ می‌رود هر چند ثانیه یک خط کامل چاپ می‌شود"""
     
-    # تلاش برای بارگذاری فونت‌ها
-    if os.name == "nt":
+    def __init__(self, stream=None, quiet=False):
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.tty = self.stream.isatty()
+        self.last_line = 0
+    
+    def update(self, text):
+        if self.quiet:
+            return
+        if self.tty:
+            self.stream.write("\r\033[K" + text)
+            self.stream.flush()
+        elif time.monotonic() - self.last_line >= CLI_LOG_INTERVAL:
+            self.stream.write(text + "\n")
+            self.stream.flush()
+            self.last_line = time.monotonic()
+    
+    def finish(self, text=None):
+        if self.tty and not self.quiet:
+            self.stream.write("\r\033[K")
+        if text and not self.quiet:
+            self.stream.write(text + "\n")
+        self.stream.flush()
+
+
+def build_cli_config(args):
+    """تنظیمات config.json با اعمال گزینه‌های خط فرمان (بدون ذخیره در فایل)"""
+    config = load_config()
+    if args.threads:
+        config["max_threads_per_download"] = args.threads
+    if args.concurrency:
+        config["max_concurrent_downloads"] = args.concurrency
+    if args.engine:
+        config["download_engine"] = args.engine
+    return config
+
+
+def install_stop_handlers(stop_event):
+    """Ctrl+C و SIGTERM به جای خاتمه ناگهانی فقط رویداد توقف را فعال می‌کنند"""
+    def handler(signum, frame):
+        stop_event.set()
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, handler)
+
+
+def add_cli_downloads(manager, urls, save_path, checksum=None, mirrors=None):
+    """افزودن آدرس‌ها؛ دانلود نیمه‌کاره همان آدرس در همان مسیر از اجرای قبلی ادامه می‌یابد"""
+    unfinished = {(item.url, item.save_path): item for item in manager.get_all_downloads()
+                  if item.status == "paused"}
+    ids = []
+    for url in urls:
+        item = unfinished.pop((url, save_path), None)
+        if item is not None:
+            if checksum:
+                item.expected_checksum = parse_checksum(checksum)
+            if mirrors:
+                item.mirrors = [mirror for mirror in parse_mirrors(mirrors) if mirror != url]
+            manager.resume_download(item.id)
+            ids.append(item.id)
+        else:
+            ids.append(manager.add_download(url, save_path, checksum=checksum, mirrors=mirrors))
+    return ids
+
+
+def start_cli_import(manager, args, save_path, on_batch=None, stop_event=None):
+    """وارد کردن فایل --input در یک نخ پس‌زمینه؛ (نخ، خلاصه) برمی‌گرداند
+    دانلودهای نیمه‌کاره همان آدرس‌ها ادامه می‌یابند و on_batch(ids) شناسه‌های افزوده یا ازسرگرفته را دریافت می‌کند"""
+    summary = {}
+    unfinished = {(item.url, item.save_path): item for item in manager.get_all_downloads()
+                  if item.status == "paused"}
+    
+    def entries():
+        for entry in iter_url_list(args.input):
+            item = unfinished.pop(((entry.get("url") or "").strip(), save_path), None)
+            if item is not None:
+                manager.resume_download(item.id)
+                summary["resumed"] = summary.get("resumed", 0) + 1
+                if on_batch:
+                    on_batch([item.id])
+            yield entry
+    
+    def run():
         try:
-            # بارگذاری مستقیم فونت‌ها در ویندوز
-            FONTS_COUNT = 32
-            FR_PRIVATE = 0x10
-            gdi32 = WinDLL('gdi32')
-            GDI32 = ctypes.WinDLL('gdi32')
-            user32 = ctypes.WinDLL('user32')
-            
-            # فونت‌های مورد نیاز
-            font_files = [
-                "BYekan+.ttf",
-                "BYekan+ Bold.ttf"
-            ]
-            
-            # بارگذاری تک تک فونت‌ها
-            for font_file in font_files:
-                font_path = os.path.join(FONT_DIR, font_file)
-                if os.path.exists(font_path):
-                    print(f"بارگذاری فونت {font_file} از مسیر {font_path}...")
-                    # سعی با روش اول: استفاده از AddFontResourceW
-                    try:
-                        res1 = GDI32.AddFontResourceW(font_path)
-                        if res1 > 0:
-                            print(f"فونت با موفقیت با روش اول بارگذاری شد: {font_file}")
-                    except Exception as e1:
-                        print(f"خطا در روش اول بارگذاری فونت {font_file}: {e1}")
-                        
-                    # سعی با روش دوم: استفاده از AddFontResourceExW
-                    try:
-                        res2 = gdi32.AddFontResourceExW(font_path, FR_PRIVATE, 0)
-                        if res2 > 0:
-                            print(f"فونت با موفقیت با روش دوم بارگذاری شد: {font_file}")
-                    except Exception as e2:
-                        print(f"خطا در روش دوم بارگذاری فونت {font_file}: {e2}")
-                else:
-                    print(f"فایل فونت پیدا نشد: {font_path}")
-            
-            # اعلام تغییر فونت به سیستم
-            user32.SendMessageW(0xFFFF, 0x001D, 0, 0)  # WM_FONTCHANGE برای همه پنجره‌ها
-            
-        except Exception as e:
-            print(f"خطا در فرآیند بارگذاری فونت: {str(e)}")
+            summary.update(manager.import_urls(entries(), save_path, probe=not args.no_probe,
+                                               on_batch=lambda result, ids: on_batch and on_batch(ids),
+                                               stop_event=stop_event))
+        except (OSError, ValueError) as e:
+            summary["error"] = str(e)
+    
+    thread = threading.Thread(target=run, daemon=True, name="UrlImport")
+    thread.start()
+    return thread, summary
+
+
+def format_import_summary(summary):
+    """خلاصه یک خطی نتیجه وارد کردن فهرست"""
+    if "error" in summary:
+        return f"خطا در خواندن فهرست آدرس‌ها: {summary['error']}"
+    # آدرس دانلودهای ازسرگرفته در مدیر دانلود وجود دارد و در import_urls تکراری شمرده می‌شود
+    duplicates = summary.get('duplicates', 0) - summary.get('resumed', 0)
+    return (f"فهرست: {summary.get('read', 0)} خوانده | {summary.get('added', 0)} افزوده | "
+            f"{summary.get('resumed', 0)} ادامه | {duplicates} تکراری | "
+            f"{summary.get('invalid', 0)} نامعتبر | {summary.get('probe_failed', 0)} بدون پاسخ")
+
+
+def run_get(args):
+    """دانلود آدرس‌ها و خروج؛ کد خروج نتیجه دانلودها را نشان می‌دهد"""
+    config = build_cli_config(args)
+    save_path = os.path.abspath(os.path.expanduser(args.out or config["default_download_path"]))
+    os.makedirs(save_path, exist_ok=True)
+    
+    # فقط پایان دانلودها حلقه انتظار را زودتر بیدار می‌کند
+    changed = threading.Event()
+    stop_event = threading.Event()
+    install_stop_handlers(stop_event)
+    
+    def on_update(item):
+        if item.status in FINISHED_STATUSES:
+            changed.set()
+    
+    manager = create_download_manager(config, on_update)
+    status = TerminalStatus(quiet=args.quiet)
+    ids = add_cli_downloads(manager, args.urls, save_path, args.checksum, args.mirror)
+    items = [manager.get_download(download_id) for download_id in ids]
+    
+    import_thread = None
+    if args.input:
+        def on_batch(batch_ids):
+            items.extend(manager.get_download(download_id) for download_id in batch_ids)
+            changed.set()
+        import_thread, import_summary = start_cli_import(manager, args, save_path, on_batch, stop_event)
+    
+    while not stop_event.is_set():
+        # نخ وارد کردن فهرست در همین حین به items اضافه می‌کند
+        importing = import_thread is not None and import_thread.is_alive()
+        current = list(items)
+        if not importing and all(item.status in FINISHED_STATUSES for item in current):
+            break
+        
+        size = sum(item.size for item in current)
+        downloaded = sum(item.downloaded for item in current)
+        done = sum(1 for item in current if item.status == "completed")
+        speed = sum(item.speed for item in current if item.status == "downloading")
+        percent = f" ({downloaded / size * 100:.1f}%)" if size else ""
+        status.update(f"[{done}/{len(current)}] {format_size(downloaded)} / {format_size(size)}{percent} - {format_speed(speed)}")
+        
+        changed.wait(CLI_REFRESH_INTERVAL)
+        changed.clear()
+    
+    manager.shutdown()
+    if import_thread is not None:
+        import_thread.join()
+    
+    if stop_event.is_set():
+        status.finish("دانلود متوقف شد؛ با اجرای دوباره همین فرمان ادامه می‌یابد")
+        return EXIT_INTERRUPTED
+    
+    failed = [item for item in items if item.status != "completed"]
+    import_failed = import_thread is not None and "error" in import_summary
+    status.finish(format_import_summary(import_summary) if import_thread is not None and not import_failed else None)
+    if import_failed:
+        print(format_import_summary(import_summary), file=sys.stderr)
+    for item in failed:
+        print(f"{item.url}: {item.error_message or item.status}", file=sys.stderr)
+    if not args.quiet:
+        # هم‌قالب خروجی sha256sum تا نیازی به خواندن دوباره فایل‌ها نباشد
+        for item in items:
+            if item.status == "completed" and item.checksum:
+                print(f"{item.checksum}  {item.full_path}")
+    return EXIT_FAILED if failed or import_failed else EXIT_OK
+
+
+def run_daemon(args):
+    """اجرای مدیر دانلود بدون رابط گرافیکی با تنظیمات config.json تا دریافت سیگنال توقف"""
+    config = build_cli_config(args)
+    save_path = os.path.abspath(os.path.expanduser(args.out or config["default_download_path"]))
+    os.makedirs(save_path, exist_ok=True)
+    
+    stop_event = threading.Event()
+    install_stop_handlers(stop_event)
+    manager = create_download_manager(config)
+    status = TerminalStatus(quiet=args.quiet)
+    
+    # kill -USR1 پروفایل‌گیری را در دیمن در حال اجرا شروع می‌کند
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: PROFILER.start())
+    
+    control_server = None
+    if args.control_port is not None or config.get("control_api"):
+        # دانلودهای افزوده‌شده از API بدون مسیر در پوشه --out ذخیره می‌شوند
+        config["default_download_path"] = save_path
+        control_server = start_control_server(manager, config, args.control_port)
+        if control_server is None:
+            manager.shutdown()
+            return EXIT_FAILED
+        if not args.quiet:
+            print(f"API کنترل: {control_server.url}")
+    
+    metrics_file = args.metrics_file or config.get("metrics_file")
+    if metrics_file:
+        start_metrics_writer(manager, metrics_file)
+    
+    # ادامه دانلودهای نیمه‌کاره اجرای قبلی
+    if config.get("auto_start_download", True):
+        for item in manager.get_all_downloads():
+            if item.status == "paused":
+                manager.resume_download(item.id)
+    add_cli_downloads(manager, args.urls, save_path)
+    import_thread = None
+    if args.input:
+        import_thread, import_summary = start_cli_import(manager, args, save_path, stop_event=stop_event)
+    
+    while not stop_event.wait(CLI_REFRESH_INTERVAL):
+        stats = manager.get_stats()
+        counts = stats["counts"]
+        status.update(f"فعال: {counts['downloading']} | در صف: {counts['pending']} | "
+                      f"کامل: {counts['completed']} | خطا: {counts['error']} | {format_speed(stats['speed'])}")
+        importing = import_thread is not None and import_thread.is_alive()
+        if args.exit_when_idle and not importing and counts["downloading"] == 0 and counts["pending"] == 0:
+            break
+    
+    interrupted = stop_event.is_set()
+    if control_server is not None:
+        control_server.stop()
+    manager.shutdown()
+    if metrics_file:
+        write_metrics_file(manager, metrics_file)
+    counts = manager.get_stats()["counts"]
+    status.finish(f"کامل: {counts['completed']} | خطا: {counts['error']} | لغو: {counts['canceled']}")
+    if import_thread is not None:
+        import_thread.join()
+        if "error" in import_summary:
+            print(format_import_summary(import_summary), file=sys.stderr)
+        elif not args.quiet:
+            print(format_import_summary(import_summary))
+    if counts["error"] or (import_thread is not None and "error" in import_summary):
+        return EXIT_FAILED
+    # سیگنال توقف برای دیمن عادی است؛ فقط با --exit-when-idle یعنی کار ناتمام مانده است
+    return EXIT_INTERRUPTED if interrupted and args.exit_when_idle else EXIT_OK
+
+
+def build_arg_parser():
+    """گزینه‌های خط فرمان؛ بدون فرمان، رابط گرافیکی اجرا می‌شود"""
+    parser = argparse.ArgumentParser(prog="shetabdaryaft", description=APP_NAME)
+    parser.add_argument("--config", help="مسیر فایل تنظیمات (پیش‌فرض config.json کنار برنامه)")
+    parser.add_argument("--startup-profile", action="store_true", help="چاپ مدت هر مرحله راه‌اندازی")
+    parser.add_argument("--font-info", action="store_true", help="چاپ فونت‌های شناسایی شده در سیستم")
+    parser.add_argument("--profile", type=float, metavar="SECONDS",
+                        help="پروفایل‌گیری از حلقه‌های دانلود و رابط کاربری در چند ثانیه اول (خروجی کنار config.json)")
+    
+    engine_options = argparse.ArgumentParser(add_help=False)
+    engine_options.add_argument("--out", help="پوشه ذخیره (پیش‌فرض default_download_path تنظیمات)")
+    engine_options.add_argument("--threads", type=int, help="حداکثر اتصال هر دانلود")
+    engine_options.add_argument("--concurrency", type=int, help="حداکثر دانلود همزمان")
+    engine_options.add_argument("--engine", choices=("threads", "asyncio"), help="موتور دانلود")
+    engine_options.add_argument("--quiet", action="store_true", help="بدون خط وضعیت")
+    engine_options.add_argument("--input", metavar="FILE",
+                                help="فهرست آدرس‌ها: فایل متنی (هر خط یک آدرس و آینه‌های آن)، CSV یا JSONL")
+    engine_options.add_argument("--no-probe", action="store_true",
+                                help="افزودن آدرس‌های --input بدون بررسی اولیه حجم و پشتیبانی از بازه")
+    
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    get_parser = commands.add_parser("get", parents=[engine_options], help="دانلود آدرس‌ها و خروج")
+    get_parser.add_argument("urls", nargs="*", metavar="URL")
+    get_parser.add_argument("--checksum", metavar="[ALGO:]HEX",
+                            help="چک‌سام مورد انتظار (md5، sha1 یا sha256) برای یک آدرس؛ عدم تطابق خطا است")
+    get_parser.add_argument("--mirror", action="append", metavar="URL",
+                            help="آدرس دیگری از همان فایل؛ بخش‌ها به نسبت سرعت بین منبع‌ها تقسیم می‌شوند (قابل تکرار)")
+    daemon_parser = commands.add_parser("daemon", parents=[engine_options],
+                                        help="اجرای مدیر دانلود در پس‌زمینه تا دریافت سیگنال توقف")
+    daemon_parser.add_argument("urls", nargs="*", metavar="URL")
+    daemon_parser.add_argument("--exit-when-idle", action="store_true",
+                               help="خروج پس از پایان همه دانلودهای فعال و صف")
+    daemon_parser.add_argument("--control-port", type=int, metavar="PORT",
+                               help="فعال‌سازی API کنترل محلی روی این درگاه (صفر: درگاه آزاد)")
+    daemon_parser.add_argument("--metrics-file", metavar="FILE",
+                               help="نوشتن دوره‌ای معیارهای Prometheus در این فایل")
+    return parser
+
+
+def run_gui(args):
+    """اجرای رابط گرافیکی"""
+    # بارگذاری فونت‌ها در ویندوز
+    register_windows_fonts()
     
     # ایجاد پنجره اصلی
+    load_gui_modules()
     root = tk.Tk()
+    STARTUP_PROFILE.mark("tk")
     
     # تعیین جهت‌گیری راست به چپ
     root.tk.call('encoding', 'system', 'utf-8')
@@ -2266,30 +6059,13 @@ if __name__ == "__main__":
         root.tk.call('tcl_setRightToLeftVal', 1)
     except:
         pass
-    
-    # تلاش برای بارگذاری پکیج tkfontchooser برای اطلاعات بیشتر فونت
-    try:
-        root.tk.call('package', 'require', 'fontchooser')
-    except:
-        pass
         
     # تنظیم عنوان و آیکون برنامه
     root.title(APP_NAME)
     
-    # بررسی وجود تم Aqua در لیست تم‌های موجود
-    aqua_theme_exists = False
-    try:
-        themes = ttk.Style().theme_names()
-        if "aqua" not in themes:
-            print("تم Aqua به لیست تم‌ها اضافه می‌شود...")
-        else:
-            aqua_theme_exists = True
-            print("تم Aqua از قبل وجود دارد.")
-    except:
-        print("خطا در بررسی تم‌های موجود")
-    
     # نمایش اطلاعات فونت‌های سیستم
-    print_font_info()
+    if args.font_info:
+        print_font_info(root)
     
     # راه‌اندازی برنامه
     app = ShetabDaryaftApp(root)
@@ -2300,6 +6076,7 @@ if __name__ == "__main__":
     # پاکسازی فونت‌ها در ویندوز
     if os.name == "nt":
         try:
+            import ctypes
             for font_file in os.listdir(FONT_DIR):
                 if font_file.endswith('.ttf'):
                     font_path = os.path.join(FONT_DIR, font_file)
@@ -2307,3 +6084,50 @@ if __name__ == "__main__":
                         ctypes.windll.gdi32.RemoveFontResourceW(font_path)
         except:
             pass
+    
+    return EXIT_OK
+
+
+def main(argv=None):
+    global CONFIG_FILE
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.command == "get" and not args.urls and not args.input:
+        parser.error("get: حداقل یک آدرس یا --input لازم است")
+    if args.command == "get" and args.checksum:
+        if len(args.urls) != 1:
+            parser.error("get: --checksum فقط با یک آدرس قابل استفاده است (برای فهرست‌ها ستون checksum)")
+        try:
+            parse_checksum(args.checksum)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.command == "get" and args.mirror:
+        if len(args.urls) != 1:
+            parser.error("get: --mirror فقط با یک آدرس قابل استفاده است (برای فهرست‌ها ستون mirrors)")
+        try:
+            parse_mirrors(args.mirror)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.config:
+        CONFIG_FILE = os.path.abspath(args.config)
+    if args.profile:
+        PROFILER.start(args.profile)
+    
+    try:
+        if args.command == "get":
+            return run_get(args)
+        if args.command == "daemon":
+            return run_daemon(args)
+        
+        STARTUP_PROFILE.enabled = args.startup_profile
+        STARTUP_PROFILE.mark("module imports")
+        return run_gui(args)
+    finally:
+        # پروفایل نیمه‌تمام هنگام خروج نوشته می‌شود
+        if PROFILER.running:
+            PROFILER.stop()
+
+
+# اجرای اصلی برنامه
+if __name__ == "__main__":
+    sys.exit(main())
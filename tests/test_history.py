@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""آزمون تاریخچه SQLite (HistoryStore): وارد کردن تاریخچه JSON قدیمی و ماندگاری رکوردهای ثبت‌نشده"""
+
+import json
+import threading
+
+import shetabdaryaft
+from shetabdaryaft import DownloadItem, HistoryStore
+
+
+def legacy_record(index):
+    """رکورد تاریخچه با قالب JSON قدیمی (فقط کلیدهای نسخه‌های پیشین to_dict)"""
+    return {
+        "id": f"legacy-{index}",
+        "url": f"http://mirror{index % 2}.example.com/files/file{index}.bin",
+        "save_path": "/downloads",
+        "filename": f"file{index}.bin",
+        "status": "completed" if index % 3 else "error",
+        "size": 1000 * index,
+        "downloaded": 1000 * index,
+        "start_time": 1700000000.0 + index,
+        "end_time": 1700000100.0 + index,
+        "resume_support": True,
+        "error_message": "" if index % 3 else "timeout",
+    }
+
+
+def completed_item(index):
+    item = DownloadItem(f"http://example.com/new{index}.bin", "/downloads", f"new{index}.bin")
+    item.size = item.downloaded = 10 * index
+    item.start_time = 1800000000.0 + index
+    item.end_time = 1800000010.0 + index
+    item.status = "completed"
+    return item
+
+
+def test_json_history_migrates_once(tmp_path, monkeypatch):
+    """تاریخچه JSON قدیمی یک بار وارد پایگاه داده می‌شود و رکوردها بدون تغییر بازخوانی می‌شوند"""
+    records = [legacy_record(index) for index in range(1, 8)]
+    json_path = tmp_path / "download_history.json"
+    json_path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(shetabdaryaft, "HISTORY_FILE", str(json_path))
+    monkeypatch.setattr(shetabdaryaft, "HISTORY_DB", str(tmp_path / "download_history.db"))
+    monkeypatch.setattr(shetabdaryaft, "TEMP_DIR", str(tmp_path))
+    
+    manager = shetabdaryaft.DownloadManager(dict(shetabdaryaft.DEFAULT_CONFIG))
+    assert manager.count_history() == len(records)
+    assert manager.count_history(status="error") == 2
+    assert manager.count_history(host="mirror1.example.com") == 4
+    
+    rows = manager.query_history(limit=100)
+    assert [row["id"] for row in rows] == [record["id"] for record in reversed(records)]
+    for row in rows:
+        data = json.loads(row["data"])
+        assert data == next(record for record in records if record["id"] == row["id"])
+        item = DownloadItem.from_dict(data)
+        assert (item.url, item.filename, item.size, item.status) == (
+            data["url"], data["filename"], data["size"], data["status"])
+    manager.shutdown()
+    manager.history.close()
+    
+    # اجرای بعدی فایل JSON را دوباره وارد نمی‌کند، حتی اگر تغییر کرده باشد
+    json_path.write_text(json.dumps(records + [legacy_record(99)]), encoding="utf-8")
+    history = HistoryStore(str(tmp_path / "download_history.db"))
+    assert history.import_json(str(json_path)) == 0
+    assert history.count() == len(records)
+    history.close()
+
+
+def test_pending_records_survive_close(tmp_path):
+    """رکوردهایی که هنوز در دسته ثبت نشده‌اند با close بدون flush صریح روی دیسک می‌مانند"""
+    path = str(tmp_path / "history.db")
+    history = HistoryStore(path)
+    items = [completed_item(index) for index in range(5)]
+    for item in items:
+        history.add(item)
+    assert history.pending  # دسته هنوز پر نشده و زمان‌سنج ثبت نرسیده است
+    history.close()
+    
+    reopened = HistoryStore(path)
+    rows = reopened.query(limit=10)
+    assert {row["id"] for row in rows} == {item.id for item in items}
+    assert all(json.loads(row["data"])["status"] == "completed" for row in rows)
+    reopened.close()
+
+
+def test_concurrent_writers(tmp_path, monkeypatch):
+    """ثبت همزمان از چند نخ با دسته‌های پرشده و زمان‌سنج ثبت هیچ رکوردی را از دست نمی‌دهد"""
+    monkeypatch.setattr(shetabdaryaft, "HISTORY_BATCH_SIZE", 7)
+    monkeypatch.setattr(shetabdaryaft, "HISTORY_FLUSH_DELAY", 0.01)
+    path = str(tmp_path / "history.db")
+    history = HistoryStore(path)
+    writers, per_writer = 8, 50
+    
+    def write(writer):
+        for index in range(per_writer):
+            history.add(completed_item(writer * per_writer + index))
+    
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    history.close()
+    
+    reopened = HistoryStore(path)
+    assert reopened.count() == writers * per_writer
+    reopened.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""آزمون ترتیب صف اولویت‌دار دانلودها (DownloadScheduler)"""
+
+from shetabdaryaft import (DownloadScheduler, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+                           PRIORITY_URGENT)
+
+
+def drain(scheduler):
+    """برداشتن همه موارد صف به ترتیب"""
+    order = []
+    while True:
+        download_id = scheduler.pop()
+        if download_id is None:
+            return order
+        order.append(download_id)
+
+
+def test_priority_then_arrival_order():
+    """اولویت بالاتر زودتر؛ در اولویت برابر ترتیب ورود حفظ می‌شود"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    scheduler.push("low", PRIORITY_LOW, enqueue_time=100)
+    scheduler.push("normal-1", PRIORITY_NORMAL, enqueue_time=100)
+    scheduler.push("high", PRIORITY_HIGH, enqueue_time=100)
+    scheduler.push("normal-2", PRIORITY_NORMAL, enqueue_time=100)
+    
+    assert len(scheduler) == 4
+    assert drain(scheduler) == ["high", "normal-1", "normal-2", "low"]
+    assert len(scheduler) == 0
+
+
+def test_aging_promotes_long_waiting_item():
+    """مورد کم‌اولویتی که بیش از aging_weight ثانیه منتظر مانده از مورد معمولی تازه جلو می‌زند"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    scheduler.push("old-low", PRIORITY_LOW, enqueue_time=0)
+    scheduler.push("new-normal", PRIORITY_NORMAL, enqueue_time=700)
+    scheduler.push("recent-normal", PRIORITY_NORMAL, enqueue_time=500)
+    
+    assert drain(scheduler) == ["recent-normal", "old-low", "new-normal"]
+
+
+def test_urgent_tier_is_never_overtaken_by_aging():
+    """موارد فوری همیشه پیش از بقیه هستند، هرچقدر هم موارد دیگر منتظر مانده باشند"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    scheduler.push("ancient-high", PRIORITY_HIGH, enqueue_time=-10 ** 9)
+    scheduler.push("urgent", PRIORITY_URGENT, enqueue_time=10 ** 9)
+    
+    assert scheduler.peek() == ("urgent", True)
+    assert drain(scheduler) == ["urgent", "ancient-high"]
+
+
+def test_set_priority_keeps_waiting_time():
+    """تغییر اولویت یک مورد در صف جایگاه آن را عوض می‌کند و زمان انتظارش را نگه می‌دارد"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    scheduler.push("a", PRIORITY_NORMAL, enqueue_time=500)
+    scheduler.push("b", PRIORITY_NORMAL, enqueue_time=510)
+    scheduler.push("c", PRIORITY_HIGH, enqueue_time=1000)
+    
+    assert scheduler.set_priority("b", PRIORITY_HIGH)
+    # b با اولویت بالا و ورود زودتر از c جلو می‌افتد؛ a معمولی پس از هر دو
+    assert drain(scheduler) == ["b", "c", "a"]
+    assert not scheduler.set_priority("missing", PRIORITY_HIGH)
+
+
+def test_removed_entries_are_skipped():
+    """ورودی‌های حذف‌شده (لغو در صف یا تغییر اولویت) در هرم می‌مانند اما برداشته نمی‌شوند"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    for index in range(5):
+        scheduler.push(f"d{index}", PRIORITY_NORMAL, enqueue_time=index)
+    scheduler.set_priority("d3", PRIORITY_LOW)
+    
+    assert scheduler.remove("d0")
+    assert not scheduler.remove("d0")
+    assert "d0" not in scheduler
+    assert len(scheduler) == 4
+    # ورودی حذف‌شده d0 و ورودی قدیمی d3 هنوز در هرم هستند (پنج ورود و یک ورود دوباره)
+    assert len(scheduler.heap) == 6
+    assert scheduler.peek() == ("d1", False)
+    assert drain(scheduler) == ["d1", "d2", "d4", "d3"]
+    assert scheduler.peek() is None
+
+
+def test_heap_is_compacted_when_mostly_removed():
+    """هرم پس از حذف‌های زیاد بازسازی می‌شود و ترتیب موارد باقی‌مانده درست می‌ماند"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    for index in range(200):
+        scheduler.push(index, PRIORITY_NORMAL, enqueue_time=index)
+    for index in range(0, 200, 2):
+        scheduler.remove(index)
+    for index in range(1, 150, 2):
+        scheduler.remove(index)
+    
+    assert len(scheduler) == 25
+    assert len(scheduler.heap) <= 2 * len(scheduler) + 64
+    assert drain(scheduler) == list(range(151, 200, 2))
+
+
+def test_move_to_top_stays_behind_urgent():
+    """انتقال به ابتدای صف مورد را جلوی همه موارد غیر فوری می‌برد، نه جلوی موارد فوری"""
+    scheduler = DownloadScheduler(aging_weight=600)
+    scheduler.push("urgent", PRIORITY_URGENT, enqueue_time=50)
+    scheduler.push("high", PRIORITY_HIGH, enqueue_time=0)
+    scheduler.push("low", PRIORITY_LOW, enqueue_time=100)
+    
+    assert scheduler.move_to_top("low")
+    assert drain(scheduler) == ["urgent", "low", "high"]
+    assert not scheduler.move_to_top("low")